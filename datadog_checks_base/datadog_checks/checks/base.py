@@ -1,14 +1,19 @@
 # (C) Datadog, Inc. 2018
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+from array import array
 from collections import defaultdict
+from contextlib import contextmanager
 import logging
 import re
 import json
 import copy
+from time import time
 import traceback
 import unicodedata
 
+from six.moves import intern
+
 try:
     import datadog_agent
     from ..log import init_logging
@@ -21,8 +26,10 @@ try:
 except ImportError:
     from ..stubs import aggregator
 
+from .libs.profiler import CheckProfiler
 from ..config import is_affirmative
 from ..utils.common import ensure_bytes
+from ..utils.lru_cache import LRUCache
 from ..utils.proxy import config_proxy_skip
 
 
@@ -32,6 +39,16 @@ class AgentCheck(object):
     """
     OK, WARNING, CRITICAL, UNKNOWN = (0, 1, 2, 3)
 
+    # Maximum number of distinct tag lists whose normalized version is kept in cache, 0 to disable
+    TAGS_CACHE_SIZE = 4096
+
+    # Maximum number of (metric, prefix, fix_case) whose normalized name, and of names whose
+    # `convert_to_underscore_separated` version, are kept in cache, 0 to disable
+    NORMALIZE_CACHE_SIZE = 4096
+
+    # Number of samples after which a metrics batch is flushed before the end of its context
+    METRIC_BATCH_SIZE = 10000
+
     def __init__(self, *args, **kwargs):
         """
         args: `name`, `init_config`, `agentConfig` (deprecated), `instances`
@@ -44,6 +61,13 @@ class AgentCheck(object):
         self.agentConfig = kwargs.get('agentConfig', {})
         self.warnings = []
 
+        # normalized tag lists, keyed by the tuple of the submitted tags. `hits`/`misses` are counted
+        self._tags_cache = LRUCache(self.TAGS_CACHE_SIZE)
+        self._normalize_cache = LRUCache(self.NORMALIZE_CACHE_SIZE)
+
+        # (type, name, value, tags, hostname) samples buffered while in a `batch_metrics` context
+        self._metric_batch = None
+
         if len(args) > 0:
             self.name = args[0]
         if len(args) > 1:
@@ -74,6 +98,17 @@ class AgentCheck(object):
 
         self.default_integration_http_timeout = float(self.agentConfig.get('default_integration_http_timeout', 9))
 
+        # Opt-in instrumentation of the runs, see `CheckProfiler`
+        self.profiler = CheckProfiler.from_config(self, self.init_config, {
+            aggregator.GAUGE: 'gauge',
+            aggregator.RATE: 'rate',
+            aggregator.COUNT: 'count',
+            aggregator.MONOTONIC_COUNT: 'monotonic_count',
+            aggregator.COUNTER: 'counter',
+            aggregator.HISTOGRAM: 'histogram',
+            aggregator.HISTORATE: 'historate',
+        })
+
         self._deprecations = {
             'increment': [
                 False,
@@ -107,12 +142,62 @@ class AgentCheck(object):
             # ignore metric sample
             return
 
-        tags = self._normalize_tags(tags, device_name)
+        profiler = self.profiler
+        if profiler is None:
+            tags = self._normalize_tags(tags, device_name)
+        else:
+            profiler.submissions[mtype] += 1
+            start = time()
+            tags = self._normalize_tags(tags, device_name)
+            profiler.tags_normalization_time += time() - start
         if hostname is None:
             hostname = ""
 
+        batch = self._metric_batch
+        if batch is not None:
+            batch.append((mtype, name, float(value), tags, hostname))
+            if len(batch) >= self.METRIC_BATCH_SIZE:
+                self._flush_metric_batch()
+            return
+
         aggregator.submit_metric(self, self.check_id, mtype, name, float(value), tags, hostname)
 
+    @contextmanager
+    def batch_metrics(self):
+        """
+        Buffer the metrics submitted within the context, and send them to the aggregator in a single
+        call when it exits (or every `METRIC_BATCH_SIZE` samples). The samples buffered before an
+        exception are still sent. Nested contexts are part of the outermost batch.
+        """
+        if self._metric_batch is not None:
+            yield
+            return
+
+        self._metric_batch = []
+        try:
+            yield
+        finally:
+            self._flush_metric_batch()
+            self._metric_batch = None
+
+    def _flush_metric_batch(self):
+        batch = self._metric_batch
+        if not batch:
+            return
+        self._metric_batch = []
+
+        submit_metrics = getattr(aggregator, 'submit_metrics', None)
+        if submit_metrics is not None:
+            # samples are sent column-wise, with the types and values in typed arrays
+            mtypes, names, values, tags, hostnames = zip(*batch)
+            submit_metrics(self, self.check_id, array('b', mtypes), names, array('d', values), tags, hostnames)
+        else:
+            # the aggregator doesn't support batches, submit the samples one by one
+            submit_metric = aggregator.submit_metric
+            check_id = self.check_id
+            for sample in batch:
+                submit_metric(self, check_id, *sample)
+
     def gauge(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.GAUGE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
@@ -185,6 +270,14 @@ class AgentCheck(object):
     def check(self, instance):
         raise NotImplementedError
 
+    # Single pass equivalent of the successive cleanups of `normalize`: runs of illegal characters and underscores
+    # are dropped at both ends of the name and around dots, and replaced by one underscore anywhere else
+    METRIC_NAME_CLEANUP_RE = re.compile(
+        r'(?P<edge>^[,+*\-/()\[\]{}\s_]+|[,+*\-/()\[\]{}\s_]+\Z)|'
+        r'[,+*\-/()\[\]{}\s_]*(?P<dot>\.)[,+*\-/()\[\]{}\s_]*|'
+        r'[,+*\-/()\[\]{}\s_]+'
+    )
+
     def normalize(self, metric, prefix=None, fix_case=False):
         """
         Turn a metric into a well-formed metric name
@@ -194,31 +287,40 @@ class AgentCheck(object):
         :param fix_case A boolean, indicating whether to make sure that
                         the metric name returned is in underscore_case
         """
+        key = (metric, prefix, fix_case)
+        name = self._normalize_cache.get(key)
+        if name is None:
+            name = self._normalize(metric, prefix, fix_case)
+            self._normalize_cache.set(key, name)
+        return name
+
+    def _normalize(self, metric, prefix, fix_case):
         if isinstance(metric, unicode):
             metric_name = unicodedata.normalize('NFKD', metric).encode('ascii', 'ignore')
         else:
             metric_name = metric
 
         if fix_case:
-            name = self.convert_to_underscore_separated(metric_name)
+            name = self._convert_to_underscore_separated(metric_name)
             if prefix is not None:
-                prefix = self.convert_to_underscore_separated(prefix)
+                prefix = self._convert_to_underscore_separated(prefix)
         else:
-            name = re.sub(r"[,\+\*\-/()\[\]{}\s]", "_", metric_name)
-        # Eliminate multiple _
-        name = re.sub(r"__+", "_", name)
-        # Don't start/end with _
-        name = re.sub(r"^_", "", name)
-        name = re.sub(r"_$", "", name)
-        # Drop ._ and _.
-        name = re.sub(r"\._", ".", name)
-        name = re.sub(r"_\.", ".", name)
+            name = metric_name
+        name = self.METRIC_NAME_CLEANUP_RE.sub(self._cleanup_metric_name, name)
 
         if prefix is not None:
             return prefix + "." + name
         else:
             return name
 
+    @staticmethod
+    def _cleanup_metric_name(match):
+        if match.group('dot'):
+            return '.'
+        if match.group('edge'):
+            return ''
+        return '_'
+
     FIRST_CAP_RE = re.compile('(.)([A-Z][a-z]+)')
     ALL_CAP_RE = re.compile('([a-z0-9])([A-Z])')
     METRIC_REPLACEMENT = re.compile(r'([^a-zA-Z0-9_.]+)|(^[^a-zA-Z]+)')
@@ -229,6 +331,15 @@ class AgentCheck(object):
         Convert from CamelCase to camel_case
         And substitute illegal metric characters
         """
+        # the 1-tuple keys don't collide with the (metric, prefix, fix_case) ones of `normalize`
+        key = (name,)
+        metric_name = self._normalize_cache.get(key)
+        if metric_name is None:
+            metric_name = self._convert_to_underscore_separated(name)
+            self._normalize_cache.set(key, metric_name)
+        return metric_name
+
+    def _convert_to_underscore_separated(self, name):
         metric_name = self.FIRST_CAP_RE.sub(r'\1_\2', name)
         metric_name = self.ALL_CAP_RE.sub(r'\1_\2', metric_name).lower()
         metric_name = self.METRIC_REPLACEMENT.sub('_', metric_name)
@@ -240,9 +351,24 @@ class AgentCheck(object):
         - append `device_name` as `device:` tag
         - normalize tags to type `str`
         - always return a list
+
+        Checks submit the same tag lists run after run, so the normalized (and interned) lists
+        are cached by tags tuple: the returned list may be shared and must not be mutated.
         """
         if tags is None:
             normalized_tags = []
+        elif not device_name:
+            key = tuple(tags)
+            try:
+                normalized_tags = self._tags_cache.get(key)
+            except TypeError:
+                # unhashable tags, they can't be cached
+                return self._normalize_tags_type(key)
+
+            if normalized_tags is None:
+                normalized_tags = [intern(tag) for tag in self._normalize_tags_type(key)]
+                self._tags_cache.set(key, normalized_tags)
+            return normalized_tags
         else:
             normalized_tags = list(tags)  # normalize to `list` type, and make a copy
 
@@ -290,6 +416,9 @@ class AgentCheck(object):
         return warnings
 
     def run(self):
+        if self.profiler is not None:
+            self.profiler.start()
+
         try:
             self.check(copy.deepcopy(self.instances[0]))
             result = ''
@@ -302,6 +431,12 @@ class AgentCheck(object):
                 }
             ])
 
+        if self.profiler is not None:
+            try:
+                self.profiler.stop()
+            except Exception:
+                self.log.exception("Unable to report the stats of the run")
+
         return result
 
     def _get_requests_proxy(self):
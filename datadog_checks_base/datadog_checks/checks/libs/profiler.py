@@ -0,0 +1,112 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from collections import defaultdict
+import cProfile
+import os
+import pstats
+from StringIO import StringIO
+import time
+
+from ...config import is_affirmative
+
+
+class CheckProfiler(object):
+    """
+    Opt-in instrumentation of the runs of an `AgentCheck`, enabled with the `init_config` settings:
+
+    - `collect_run_stats`: submit the wall time and CPU time of each run, the number of samples
+      submitted by metric type, and the time spent normalizing their tags, as internal metrics
+    - `profile_runs`: profile one run out of `profile_runs` with cProfile (implies `collect_run_stats`),
+      the `profile_top` (20 by default) functions with the highest cumulative time are logged, or
+      written to the `profile_output` file
+
+    The CPU time is the one of the whole process, it includes the work of other threads.
+    """
+    METRIC_PREFIX = 'datadog.agent.check'
+    DEFAULT_PROFILE_TOP = 20
+
+    def __init__(self, check, metric_types, profile_runs=0, profile_top=DEFAULT_PROFILE_TOP, profile_output=None):
+        """
+        :param check: the instrumented AgentCheck
+        :param metric_types: dict of metric type -> name used in the `metric_type` tag
+        """
+        self.check = check
+        self.metric_types = metric_types
+        self.profile_runs = profile_runs
+        self.profile_top = profile_top
+        self.profile_output = profile_output
+
+        self.runs = 0
+        self.submissions = defaultdict(int)
+        self.tags_normalization_time = 0.0
+        self._start_time = None
+        self._start_cpu_time = None
+        self._profile = None
+
+    @classmethod
+    def from_config(cls, check, init_config, metric_types):
+        """
+        Return a `CheckProfiler` for `check` if enabled in its `init_config`, None otherwise
+        """
+        init_config = init_config or {}
+        profile_runs = int(init_config.get('profile_runs', 0))
+        if not profile_runs and not is_affirmative(init_config.get('collect_run_stats', False)):
+            return None
+
+        return cls(
+            check,
+            metric_types,
+            profile_runs=profile_runs,
+            profile_top=int(init_config.get('profile_top', cls.DEFAULT_PROFILE_TOP)),
+            profile_output=init_config.get('profile_output'),
+        )
+
+    @staticmethod
+    def _cpu_time():
+        times = os.times()
+        return times[0] + times[1]
+
+    def start(self):
+        self.runs += 1
+        self.submissions.clear()
+        self.tags_normalization_time = 0.0
+
+        if self.profile_runs and self.runs % self.profile_runs == 0:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+        self._start_cpu_time = self._cpu_time()
+        self._start_time = time.time()
+
+    def stop(self):
+        run_time = time.time() - self._start_time
+        cpu_time = self._cpu_time() - self._start_cpu_time
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._dump_profile()
+            self._profile = None
+
+        # snapshot the counts first, the stats themselves are submissions
+        submissions = [(self.metric_types.get(mtype, mtype), count) for mtype, count in self.submissions.iteritems()]
+        tags = ['check:{}'.format(self.check.name)]
+        self.check.gauge(self.METRIC_PREFIX + '.run_time', run_time, tags=tags)
+        self.check.gauge(self.METRIC_PREFIX + '.cpu_time', cpu_time, tags=tags)
+        self.check.gauge(self.METRIC_PREFIX + '.tags_normalization_time', self.tags_normalization_time, tags=tags)
+        for metric_type, count in submissions:
+            self.check.gauge(
+                self.METRIC_PREFIX + '.submissions', count, tags=tags + ['metric_type:{}'.format(metric_type)]
+            )
+
+    def _dump_profile(self):
+        output = StringIO()
+        stats = pstats.Stats(self._profile, stream=output)
+        stats.sort_stats('cumulative').print_stats(self.profile_top)
+        report = "Profile of run #{} of check {}:\n{}".format(self.runs, self.check.name, output.getvalue())
+
+        if self.profile_output:
+            with open(self.profile_output, 'w') as f:
+                f.write(report)
+        else:
+            self.check.log.info(report)
@@ -0,0 +1,346 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from collections import deque
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted to a lane whose queue is full
+    """
+    pass
+
+
+class JobTimeout(Exception):
+    """
+    Raised by `Job.get` when the job overran its timeout, or wasn't done in time
+    """
+    pass
+
+
+class JobCancelled(Exception):
+    """
+    Raised by `Job.get` when the job was cancelled before it started
+    """
+    pass
+
+
+class Job(object):
+    """
+    A function call submitted to a `JobScheduler`
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed_out'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, scheduler, func, args, kwargs, lane, timeout, deadline=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.timeout = timeout
+        # absolute time past which the job is reaped, however long it was queued
+        self._deadline = deadline
+        self.state = Job.PENDING
+        self.submitted = None
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.exception = None
+        self._scheduler = scheduler
+        self._worker = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return '<Job {} ({}) {}>'.format(getattr(self.func, '__name__', self.func), self.lane, self.state)
+
+    @property
+    def deadline(self):
+        """
+        Time past which the running job is reaped: the earliest of its `timeout` after it started
+        and of the absolute deadline it was submitted with, None for no limit
+        """
+        deadline = self._deadline
+        if self.started is not None and self.timeout is not None:
+            run_deadline = self.started + self.timeout
+            deadline = run_deadline if deadline is None else min(deadline, run_deadline)
+        return deadline
+
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to be over, return whether it is
+        """
+        self._done.wait(timeout)
+        return self.ready()
+
+    def get(self, timeout=None):
+        """
+        Return the result of the job once it is over, or raise its exception
+        """
+        if not self.wait(timeout):
+            raise JobTimeout("{} not done after {}s".format(self, timeout))
+        if self.state == Job.FAILED:
+            raise self.exception
+        elif self.state == Job.TIMED_OUT:
+            raise JobTimeout("{} ran past its deadline".format(self))
+        elif self.state == Job.CANCELLED:
+            raise JobCancelled("{} was cancelled".format(self))
+        return self.result
+
+    def cancel(self):
+        """
+        Cancel the job if it hasn't started yet, return whether it was cancelled
+        """
+        return self._scheduler.cancel(self)
+
+
+class Lane(object):
+    """
+    Queue of the jobs of the same kind in a `JobScheduler`.
+
+    Workers pick the jobs of the lane with the lowest `priority` value first. A lane can be limited to
+    `max_running` concurrent jobs, so that a kind of job can't take all the workers, and to `max_queue_size`
+    pending jobs. 0 means no limit.
+    """
+    def __init__(self, name, priority=0, max_queue_size=0, max_running=0):
+        self.name = name
+        self.priority = priority
+        self.max_queue_size = max_queue_size
+        self.max_running = max_running
+        self.queue = deque()
+        self.running = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            Job.DONE: 0,
+            Job.FAILED: 0,
+            Job.TIMED_OUT: 0,
+            Job.CANCELLED: 0,
+            'queue_time.total': 0.0,
+            'queue_time.max': 0.0,
+            'run_time.total': 0.0,
+            'run_time.max': 0.0,
+        }
+
+    def is_full(self):
+        return 0 < self.max_queue_size <= len(self.queue)
+
+    def can_run(self):
+        return bool(self.queue) and (not self.max_running or self.running < self.max_running)
+
+    def record(self, job):
+        stats = self.stats
+        stats[job.state] += 1
+        if job.started is not None:
+            queue_time = job.started - job.submitted
+            run_time = job.finished - job.started
+            stats['queue_time.total'] += queue_time
+            stats['queue_time.max'] = max(stats['queue_time.max'], queue_time)
+            stats['run_time.total'] += run_time
+            stats['run_time.max'] = max(stats['run_time.max'], run_time)
+
+
+class JobScheduler(object):
+    """
+    Runs jobs in a pool of worker threads, an alternative to `thread_pool.Pool` with:
+
+    - priority lanes: jobs are queued in `Lane`s, the workers run the jobs of the lane of highest
+      priority first, and lanes can be limited to a number of workers
+    - backpressure: the queue of a lane can be bounded, `submit` then waits for room or raises `QueueFull`
+    - timeouts: `reap` gives up on the jobs running for longer than their timeout, or past their deadline,
+      and replaces their workers, which can't be interrupted, by new ones. Their result is ignored if they
+      ever finish.
+    - cancellation of the jobs that haven't started yet
+    - per lane stats of the outcome of the jobs, of the time they spent queued and running
+    """
+    DEFAULT_LANE = 'default'
+
+    def __init__(self, workers, lanes=None, name='scheduler'):
+        """
+        :param workers: number of worker threads
+        :param lanes: list of `Lane`, a single unbounded lane named `DEFAULT_LANE` by default
+        :param name: prefix of the names of the worker threads
+        """
+        self.name = name
+        self.lanes = sorted(lanes or [Lane(self.DEFAULT_LANE)], key=lambda lane: lane.priority)
+        self._lanes_by_name = {lane.name: lane for lane in self.lanes}
+        self._cond = threading.Condition(threading.Lock())
+        self._running = set()
+        self._workers = set()
+        self._worker_count = 0
+        self._stopping = False
+        for _ in range(workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        self._worker_count += 1
+        worker = threading.Thread(target=self._work, name='{}-{}'.format(self.name, self._worker_count))
+        worker.daemon = True
+        self._workers.add(worker)
+        worker.start()
+
+    def submit(self, func, args=(), kwargs=None, lane=DEFAULT_LANE, timeout=None, block=True, queue_timeout=None,
+               deadline=None):
+        """
+        Queue a call of `func(*args, **kwargs)` in `lane`, return its `Job`.
+
+        :param timeout: seconds the job may run before it is reaped, None for no limit
+        :param block: if the queue of the lane is full, wait for room, or raise `QueueFull` right away
+        :param queue_timeout: seconds to wait for room in the queue before raising `QueueFull`, None to wait forever
+        :param deadline: time, as returned by `time.time()`, past which the job is reaped if still running,
+                         whenever it started. None for no limit
+        """
+        lane = self._lanes_by_name[lane]
+        job = Job(self, func, args, kwargs or {}, lane.name, timeout, deadline)
+        with self._cond:
+            if lane.is_full():
+                if not block:
+                    raise QueueFull("The queue of lane {} is full".format(lane.name))
+                end = None if queue_timeout is None else time.time() + queue_timeout
+                while lane.is_full() and not self._stopping:
+                    remaining = None if end is None else end - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise QueueFull("The queue of lane {} is still full after {}s".format(lane.name, queue_timeout))
+                    self._cond.wait(remaining)
+            if self._stopping:
+                raise RuntimeError("The scheduler is stopped")
+
+            job.submitted = time.time()
+            lane.queue.append(job)
+            self._cond.notify_all()
+        return job
+
+    def _next_job(self):
+        for lane in self.lanes:
+            if lane.can_run():
+                return lane, lane.queue.popleft()
+        return None, None
+
+    def _work(self):
+        worker = threading.current_thread()
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping or worker not in self._workers:
+                        return
+                    lane, job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+
+                lane.running += 1
+                job.state = Job.RUNNING
+                job.started = time.time()
+                job._worker = worker
+                self._running.add(job)
+                # there's room in the queue of the lane
+                self._cond.notify_all()
+
+            try:
+                result, exception = job.func(*job.args, **job.kwargs), None
+            except Exception as e:
+                result, exception = None, e
+
+            with self._cond:
+                # the job may have been reaped meanwhile, the worker was then replaced
+                if job.state == Job.RUNNING:
+                    job.result = result
+                    job.exception = exception
+                    self._finish(lane, job, Job.DONE if exception is None else Job.FAILED)
+                self._cond.notify_all()
+
+    def _finish(self, lane, job, state):
+        if job.state == Job.RUNNING:
+            lane.running -= 1
+            self._running.discard(job)
+        job.state = state
+        job.finished = time.time()
+        lane.record(job)
+        job._done.set()
+
+    def cancel(self, job):
+        """
+        Cancel `job` if it hasn't started yet, return whether it was cancelled
+        """
+        with self._cond:
+            if job.state != Job.PENDING:
+                return False
+            lane = self._lanes_by_name[job.lane]
+            lane.queue.remove(job)
+            self._finish(lane, job, Job.CANCELLED)
+            self._cond.notify_all()
+        return True
+
+    def reap(self):
+        """
+        Give up on the jobs running past their deadline, and replace their workers.
+        Return the list of the reaped jobs.
+        """
+        now = time.time()
+        reaped = []
+        with self._cond:
+            for job in list(self._running):
+                deadline = job.deadline
+                if deadline is not None and now > deadline:
+                    self._finish(self._lanes_by_name[job.lane], job, Job.TIMED_OUT)
+                    self._workers.discard(job._worker)
+                    if not self._stopping:
+                        self._start_worker()
+                    reaped.append(job)
+            if reaped:
+                self._cond.notify_all()
+        return reaped
+
+    def queue_size(self, lane=None):
+        """
+        Return the number of pending jobs of `lane`, or of all the lanes
+        """
+        with self._cond:
+            if lane is not None:
+                return len(self._lanes_by_name[lane].queue)
+            return sum(len(lane.queue) for lane in self.lanes)
+
+    def running(self):
+        """
+        Return the number of running jobs
+        """
+        with self._cond:
+            return len(self._running)
+
+    def pop_stats(self):
+        """
+        Return the stats of the jobs over since the previous call, by lane name:
+        count of jobs by final state, and the total and max of their `queue_time` and `run_time`
+        """
+        with self._cond:
+            stats = {}
+            for lane in self.lanes:
+                stats[lane.name] = lane.stats
+                lane.reset_stats()
+            return stats
+
+    def stop(self, timeout=None):
+        """
+        Cancel the pending jobs and stop the workers, waiting up to `timeout` seconds for the running jobs
+        """
+        with self._cond:
+            self._stopping = True
+            for lane in self.lanes:
+                while lane.queue:
+                    self._finish(lane, lane.queue.popleft(), Job.CANCELLED)
+            workers = list(self._workers)
+            self._workers.clear()
+            self._cond.notify_all()
+
+        end = None if timeout is None else time.time() + timeout
+        for worker in workers:
+            worker.join(None if end is None else max(end - time.time(), 0))
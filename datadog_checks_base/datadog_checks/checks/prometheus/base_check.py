@@ -2,9 +2,12 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+from time import time
+
 from .mixins import PrometheusScraperMixin
 
 from .. import AgentCheck
+from ..libs.thread_pool import Pool, TimeoutError
 from ...errors import CheckException
 
 
@@ -63,11 +66,18 @@ class PrometheusScraper(PrometheusScraperMixin):
                 if self.labels_mapper is not None and label.name in self.labels_mapper:
                     tag_name = self.labels_mapper[label.name]
                 _tags.append('{}:{}'.format(tag_name, label.value))
+        _tags.extend(self._label_join_index.joined_tags(metric))
         return self._finalize_tags_to_submit(_tags, metric_name, val, metric, custom_tags=custom_tags, hostname=hostname)
 
     def _submit_service_check(self, *args, **kwargs):
         self.check.service_check(*args, **kwargs)
 
+    def _submit_raw_monotonic_count(self, *args, **kwargs):
+        self.check.monotonic_count(*args, **kwargs)
+
+    def _batch_metrics(self):
+        return self.check.batch_metrics()
+
 
 class GenericPrometheusCheck(AgentCheck):
     """
@@ -82,29 +92,129 @@ class GenericPrometheusCheck(AgentCheck):
         metrics:
         - bar
         - foo
+
+    `prometheus_url` can also be a list of endpoints sharing the same settings. They are scraped one
+    after the other, unless `scrape_workers` is greater than 1: the endpoints are then fetched and
+    parsed concurrently by a pool of `scrape_workers` threads, and their metrics submitted from the
+    check thread in the order of the list. The endpoints whose metrics aren't available `scrape_timeout`
+    seconds after the start of the run are then skipped for the run.
     """
+    # Default number of seconds to wait for the metrics of the endpoints, when scraped concurrently
+    DEFAULT_SCRAPE_TIMEOUT = 10
+
     def __init__(self, name, init_config, agentConfig, instances=None, default_instances={}, default_namespace=""):
         super(GenericPrometheusCheck, self).__init__(name, init_config, agentConfig, instances)
         self.scrapers_map = {}
         self.default_instances = default_instances
         self.default_namespace = default_namespace
+        self.pool = None
+        self.pool_size = 0
+        # results of the concurrent scrapes still running, by endpoint
+        self._pending_scrapes = {}
         for instance in instances:
-            self.get_scraper(instance)
+            self.get_scrapers(instance)
 
     def check(self, instance):
-        endpoint = instance["prometheus_url"]
-        scraper = self.get_scraper(instance)
-        if not scraper.metrics_mapper:
-            raise CheckException("You have to collect at least one metric from the endpoint: " + endpoint)
+        scrapers = self.get_scrapers(instance)
+        self._evict_removed_endpoints(instance)
+        for endpoint, scraper in scrapers:
+            if not scraper.metrics_mapper:
+                raise CheckException("You have to collect at least one metric from the endpoint: " + endpoint)
 
-        scraper.process(
-            endpoint,
+        kwargs = dict(
             send_histograms_buckets=instance.get('send_histograms_buckets', True),
             send_monotonic_counter=instance.get('send_monotonic_counter', True),
             instance=instance,
             ignore_unmapped=True
         )
 
+        workers = int(instance.get('scrape_workers', 1))
+        if workers > 1 and len(scrapers) > 1:
+            timeout = float(instance.get('scrape_timeout', self.DEFAULT_SCRAPE_TIMEOUT))
+            self._process_concurrently(scrapers, workers, timeout, time() + timeout, **kwargs)
+        else:
+            for endpoint, scraper in scrapers:
+                scraper.process(endpoint, **kwargs)
+
+    def stop(self):
+        self._stop_pool()
+        for scraper in self.scrapers_map.values():
+            scraper.close_http_sessions()
+
+    def _stop_pool(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def _evict_removed_endpoints(self, instance):
+        """
+        Close the connections of the scrapers whose endpoint isn't configured anymore, and forget them
+        """
+        configured = set(self._get_endpoints(instance))
+        for other in self.instances:
+            configured.update(self._get_endpoints(other))
+        for endpoint in list(self.scrapers_map):
+            if endpoint not in configured:
+                self.scrapers_map.pop(endpoint).close_http_sessions()
+                self._pending_scrapes.pop(endpoint, None)
+
+    def _process_concurrently(self, scrapers, workers, timeout, deadline, **kwargs):
+        """
+        Fetch and parse the endpoints in the thread pool, then process their metrics in order, until `deadline`
+        """
+        if self.pool is None or self.pool_size != workers:
+            self._stop_pool()
+            self.pool = Pool(workers, name="prometheus")
+            self.pool_size = workers
+
+        for endpoint, scraper in scrapers:
+            pending = self._pending_scrapes.get(endpoint)
+            if pending is not None and not pending.ready():
+                # the scrape of the previous run is still going on, don't pile up another one
+                self.warning("Previous scrape of {} still running, skipping it".format(endpoint))
+                continue
+            family_filter = scraper.get_family_filter(kwargs['ignore_unmapped'])
+            self._pending_scrapes[endpoint] = self.pool.apply_async(
+                scraper.fetch_metric_families, (endpoint, family_filter), {'timeout': timeout}
+            )
+
+        for endpoint, scraper in scrapers:
+            result = self._pending_scrapes.get(endpoint)
+            if result is None:
+                continue
+            try:
+                scrape_result = result.get(max(deadline - time(), 0))
+            except TimeoutError:
+                self._skip_timed_out_scrape(scraper, endpoint, timeout)
+                continue
+            except IOError as e:
+                self.warning("Unable to scrape {}: {}".format(endpoint, e))
+                scraper.submit_health_service_check(endpoint, AgentCheck.CRITICAL)
+                continue
+            finally:
+                if result.ready():
+                    del self._pending_scrapes[endpoint]
+
+            self._process_scrape_result(scraper, endpoint, scrape_result, **kwargs)
+
+    def _skip_timed_out_scrape(self, scraper, endpoint, timeout):
+        self.warning("Timed out after {}s waiting for the metrics of {}".format(timeout, endpoint))
+        scraper.submit_health_service_check(endpoint, AgentCheck.CRITICAL)
+
+    def _process_scrape_result(self, scraper, endpoint, result, **kwargs):
+        scraper.submit_health_service_check(endpoint, AgentCheck.OK)
+        self._submit_scrape_stats(scraper, endpoint, result)
+        scraper.submit_connection_stats(endpoint)
+        scraper.process_metric_families(result.metric_families, **kwargs)
+
+    def _submit_scrape_stats(self, scraper, endpoint, result):
+        tags = ["endpoint:" + endpoint]
+        prefix = "{}.prometheus.scrape".format(scraper.NAMESPACE)
+        self.gauge(prefix + ".fetch_time", result.fetch_time, tags=tags)
+        self.gauge(prefix + ".parse_time", result.parse_time, tags=tags)
+        self.gauge(prefix + ".samples", sum(len(family.metric) for family in result.metric_families), tags=tags)
+
     def _extract_rate_metrics(self, type_overrides):
         rate_metrics = []
         for metric in type_overrides:
@@ -114,19 +224,38 @@ class GenericPrometheusCheck(AgentCheck):
         return rate_metrics
 
 
-    def get_scraper(self, instance):
+    def get_scrapers(self, instance):
+        """
+        Return the list of (endpoint, scraper) of the instance, in the order of its `prometheus_url`
+        """
+        endpoints = self._get_endpoints(instance)
+        return [(endpoint, self.get_scraper(instance, endpoint)) for endpoint in endpoints]
+
+    def _get_namespace(self, instance):
         namespace = instance.get("namespace", "")
         # Check if we have a namespace
         if namespace == "":
             if self.default_namespace == "":
                 raise CheckException("You have to define a namespace for each prometheus check")
             namespace = self.default_namespace
+        return namespace
+
+    def _get_endpoints(self, instance):
+        default_instance = self.default_instances.get(self._get_namespace(instance), {})
+        endpoints = instance.get("prometheus_url", default_instance.get("prometheus_url", ""))
+        if isinstance(endpoints, basestring):
+            endpoints = [endpoints]
+        if not endpoints or "" in endpoints:
+            raise CheckException("Unable to find prometheus URL in config file.")
+        return endpoints
+
+    def get_scraper(self, instance, endpoint=None):
+        namespace = self._get_namespace(instance)
 
         # Retrieve potential default instance settings for the namespace
         default_instance = self.default_instances.get(namespace, {})
-        endpoint = instance.get("prometheus_url", default_instance.get("prometheus_url", ""))
-        if endpoint == "":
-            raise CheckException("Unable to find prometheus URL in config file.")
+        if endpoint is None:
+            endpoint = self._get_endpoints(instance)[0]
 
         # If we already created the corresponding scraper, return it
         if endpoint in self.scrapers_map:
@@ -5,12 +5,18 @@
 from fnmatch import fnmatchcase
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 from urllib3 import disable_warnings
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from google.protobuf.internal.decoder import _DecodeVarint32  # pylint: disable=E0611,E0401
 from ...utils.prometheus import metrics_pb2
+from ...utils.prometheus.label_joins import LabelJoinIndex
+from ...utils.prometheus.text_parser import parse_text_metric_families, FamilyFilter
 from math import isnan, isinf
+from time import time
+from six.moves import intern
+from weakref import WeakSet
 from prometheus_client.parser import text_fd_to_metric_families
 
 # toolkit
@@ -30,6 +36,11 @@ class UnknownFormatError(TypeError):
     pass
 
 
+# The metric families of an endpoint fetched with `fetch_metric_families`, along with the time taken
+# to download and to parse them, in seconds, and the size of the payload, in bytes
+ScrapeResult = namedtuple('ScrapeResult', 'metric_families fetch_time parse_time size')
+
+
 class PrometheusScraperMixin(object):
     # pylint: disable=E1101
     # This class is not supposed to be used by itself, it provides scraping behavior but
@@ -37,6 +48,7 @@ class PrometheusScraperMixin(object):
 
     UNWANTED_LABELS = ["le", "quantile"]  # are specifics keys for prometheus itself
     REQUESTS_CHUNK_SIZE = 1024 * 10  # use 10kb as chunk size when using the Stream feature in requests.get
+    REQUESTS_POOL_MAXSIZE = 2  # number of kept-alive connections per endpoint
 
     def __init__(self, *args, **kwargs):
         super(PrometheusScraperMixin, self).__init__(*args, **kwargs)
@@ -80,28 +92,9 @@ class PrometheusScraperMixin(object):
         # }
         self.label_joins = {}
 
-        # `_label_mapping` holds the additionals label info to add for a specific
-        # label value, example:
-        # self._label_mapping = {
-        #     'pod': {
-        #         'dd-agent-9s1l1': [("node","yolo"),("host_ip","yey")]
-        #     }
-        # }
-        self._label_mapping = {}
-
-        # `_active_label_mapping` holds a dictionary of label values found during the run
-        # to cleanup the label_mapping of unused values, example:
-        # self._active_label_mapping = {
-        #     'pod': {
-        #         'dd-agent-9s1l1': True
-        #     }
-        # }
-        self._active_label_mapping = {}
-
-        # `_watched_labels` holds the list of label to watch for enrichment
-        self._watched_labels = set()
-
-        self._dry_run = True
+        # `_label_join_index` holds the labels to join by value of the `label_to_match`
+        # labels, along with their tags, see `LabelJoinIndex`
+        self._label_join_index = LabelJoinIndex()
 
         # Some metrics are ignored because they are duplicates or introduce a
         # very high cardinality. Metrics included in this list will be silently
@@ -147,6 +140,17 @@ class PrometheusScraperMixin(object):
         # Extra http headers to be sent when polling endpoint
         self.extra_headers = {}
 
+        # `_http_sessions` holds a requests.Session per endpoint, along with the TLS settings it was
+        # created with, so that connections are kept alive and certificates loaded once across runs
+        self._http_sessions = {}
+
+        # `_known_sockets` holds the sockets the requests to each endpoint were sent over, to tell
+        # a kept-alive connection from a new one
+        self._known_sockets = {}
+
+        # Number of requests sent to each endpoint over a new connection and over a kept-alive one
+        self.connection_stats = {}
+
     def parse_metric_family(self, response):
         """
         Parse the MetricFamily from a valid requests.Response object to provide a MetricFamily object (see [0])
@@ -214,6 +218,51 @@ class PrometheusScraperMixin(object):
             raise UnknownFormatError('Unsupported content-type provided: {}'.format(
                 response.headers['Content-Type']))
 
+    def stream_metric_family(self, response, family_filter=None):
+        """
+        Same as `parse_metric_family`, except that the text format is decoded in a single pass into
+        lightweight objects exposing the same attributes as metrics_pb2.MetricFamily, one family at
+        a time, without materializing protobuf messages.
+
+        If a `FamilyFilter` is provided, the text families it doesn't want are skipped before their
+        labels are parsed.
+
+        :param response: requests.Response
+        :param family_filter: text_parser.FamilyFilter
+        :return: metrics_pb2.MetricFamily() or text_parser.MetricFamily()
+        """
+        if 'text/plain' in response.headers['Content-Type']:
+            return parse_text_metric_families(
+                response.iter_lines(chunk_size=self.REQUESTS_CHUNK_SIZE),
+                type_overrides=self.type_overrides,
+                prefix=self.prometheus_metrics_prefix,
+                family_filter=family_filter
+            )
+        return self.parse_metric_family(response)
+
+    def get_family_filter(self, ignore_unmapped=False):
+        """
+        Build the `FamilyFilter` matching what `process_metric` will handle: the mapped metrics,
+        the metrics having a method named after them (or the wildcards of `metrics_mapper` when
+        `ignore_unmapped` is set), minus `ignore_metrics`. The `label_joins` targets are always
+        parsed, for the labels the join index needs at least.
+
+        Checks overriding `process_metric` with different rules can return None to parse everything.
+        """
+        names = set(self.metrics_mapper)
+        wildcards = None
+        if ignore_unmapped:
+            wildcards = [x for x in self.metrics_mapper.keys() if '*' in x]
+        else:
+            # methods named after the metrics are called by `process_metric`
+            names.update(dir(self))
+
+        partial = {}
+        for metric, join in self.label_joins.iteritems():
+            partial[metric] = [join['label_to_match']] + list(join['labels_to_get'])
+
+        return FamilyFilter(names=names, wildcards=wildcards, ignored=self.ignore_metrics, partial=partial)
+
     def remove_metric_prefix(self, metric):
         return metric[len(self.prometheus_metrics_prefix):] if metric.startswith(self.prometheus_metrics_prefix) else metric
 
@@ -313,33 +362,74 @@ class PrometheusScraperMixin(object):
                         _l.value = _metric['labels'][lbl]
         return _obj
 
-    def scrape_metrics(self, endpoint):
+    def scrape_metrics(self, endpoint, family_filter=None):
         """
         Poll the data from prometheus and return the metrics as a generator.
+        `family_filter` allows to skip the unwanted families of text payloads, see `get_family_filter`.
         """
         response = self.poll(endpoint)
         try:
-            # no dry run if no label joins
-            if not self.label_joins:
-                self._dry_run = False
-            elif not self._watched_labels:
-                # build the _watched_labels set
-                for metric, val in self.label_joins.iteritems():
-                    self._watched_labels.add(val['label_to_match'])
-
-            for metric in self.parse_metric_family(response):
+            for metric in self._track_label_joins(self.stream_metric_family(response, family_filter=family_filter)):
                 yield metric
+        finally:
+            response.close()
+
+    def fetch_metric_families(self, endpoint, family_filter=None, timeout=10):
+        """
+        Poll `endpoint` and parse its whole payload, without submitting anything nor updating the
+        label joins, so it can run in a worker thread. The families are then handed over to
+        `process_metric_families`. Unlike `poll`, no health service check is sent.
 
-            # Set dry run off
-            self._dry_run = False
-            # Garbage collect unused mapping and reset active labels
-            for metric, mapping in self._label_mapping.items():
-                for key, val in mapping.items():
-                    if key not in self._active_label_mapping[metric]:
-                        del self._label_mapping[metric][key]
-            self._active_label_mapping = {}
+        :param endpoint: string url endpoint
+        :param family_filter: text_parser.FamilyFilter
+        :param timeout: seconds to wait for the server, as passed to requests
+        :return: ScrapeResult
+        """
+        start = time()
+        response = self.send_request(endpoint, timeout=timeout)
+        try:
+            size = len(response.content)
+            fetched = time()
+            metric_families = list(self.stream_metric_family(response, family_filter=family_filter))
         finally:
             response.close()
+        return ScrapeResult(metric_families, fetched - start, time() - fetched, size)
+
+    def _track_label_joins(self, metric_families):
+        """
+        Yield the metric families, the `label_joins` targets first: the other families are held back
+        until all the targets have been indexed, so their joined labels are known when they are
+        processed, from the first run on. Stale join entries are dropped once all families are yielded.
+        """
+        index = self._label_join_index
+        index.start(self.label_joins)
+        if not index.targets:
+            for metric in metric_families:
+                yield metric
+            return
+
+        pending_targets = set(index.targets)
+        held_back = []
+
+        for metric in metric_families:
+            if metric.name in index.targets:
+                index.store(metric, self._label_tags)
+                pending_targets.discard(metric.name)
+                yield metric
+                if not pending_targets:
+                    for held_metric in held_back:
+                        yield held_metric
+                    held_back = []
+            elif pending_targets:
+                held_back.append(metric)
+            else:
+                yield metric
+
+        # some targets are missing from the payload
+        for held_metric in held_back:
+            yield held_metric
+
+        index.collect()
 
     def process(self, endpoint, **kwargs):
         """
@@ -349,48 +439,42 @@ class PrometheusScraperMixin(object):
         Note that if the instance has a 'tags' attribute, it will be pushed
         automatically as additionnal custom tags and added to the metrics
         """
+        family_filter = self.get_family_filter(kwargs.get('ignore_unmapped', False))
+        self._process_metric_families(self.scrape_metrics(endpoint, family_filter=family_filter), **kwargs)
+
+    def process_metric_families(self, metric_families, **kwargs):
+        """
+        Same as `process`, for metric families already scraped with `fetch_metric_families`
+        """
+        self._process_metric_families(self._track_label_joins(metric_families), **kwargs)
+
+    def _process_metric_families(self, metric_families, **kwargs):
         instance = kwargs.get('instance')
         if instance:
             kwargs['custom_tags'] = instance.get('tags', [])
 
-        for metric in self.scrape_metrics(endpoint):
-            self.process_metric(metric, **kwargs)
+        with self._batch_metrics():
+            for metric in metric_families:
+                self.process_metric(metric, **kwargs)
 
-    def store_labels(self, message):
-        # If targeted metric, store labels
-        if message.name in self.label_joins:
-            matching_label = self.label_joins[message.name]['label_to_match']
-            for metric in message.metric:
-                labels_list = []
-                matching_value = None
-                for label in metric.label:
-                    if label.name == matching_label:
-                        matching_value = label.value
-                    elif label.name in self.label_joins[message.name]['labels_to_get']:
-                        labels_list.append((label.name, label.value))
-                try:
-                    self._label_mapping[matching_label][matching_value] = labels_list
-                except KeyError:
-                    if matching_value is not None:
-                        self._label_mapping[matching_label] = {matching_value: labels_list}
-
-    def join_labels(self, message):
-        # Filter metric to see if we can enrich with joined labels
-        if self.label_joins:
-            for metric in message.metric:
-                for label in metric.label:
-                    if label.name in self._watched_labels:
-                        # Set this label value as active
-                        if label.name not in self._active_label_mapping:
-                            self._active_label_mapping[label.name] = {}
-                        self._active_label_mapping[label.name][label.value] = True
-                        # If mapping found add corresponding labels
-                        try:
-                            for label_tuple in self._label_mapping[label.name][label.value]:
-                                extra_label = metric.label.add()
-                                extra_label.name, extra_label.value = label_tuple
-                        except KeyError:
-                            pass
+    def _label_tags(self, labels):
+        """
+        Return the interned tags of a tuple of (name, value) labels, `exclude_labels` and `labels_mapper` applied
+        """
+        tags = []
+        for name, value in labels:
+            if self.exclude_labels is None or name not in self.exclude_labels:
+                if self.labels_mapper is not None and name in self.labels_mapper:
+                    name = self.labels_mapper[name]
+                tags.append(intern('{}:{}'.format(name, value)))
+        return tuple(tags)
+
+    def join_labels(self, metric):
+        """
+        Return the tags of the labels joined to `metric`, for the check methods building their tags from
+        the labels themselves. The metrics submitted through `_submit` get them already.
+        """
+        return self._label_join_index.joined_tags(metric)
 
     def process_metric(self, message, **kwargs):
         """
@@ -402,36 +486,29 @@ class PrometheusScraperMixin(object):
         `send_histograms_buckets` is used to specify if yes or no you want to send the buckets as tagged values when dealing with histograms.
         """
 
-        # If targeted metric, store labels
-        self.store_labels(message)
-
         if message.name in self.ignore_metrics:
             return  # Ignore the metric
 
-        # Filter metric to see if we can enrich with joined labels
-        self.join_labels(message)
-
         send_histograms_buckets = kwargs.get('send_histograms_buckets', True)
         send_monotonic_counter = kwargs.get('send_monotonic_counter', False)
         custom_tags = kwargs.get('custom_tags')
         ignore_unmapped = kwargs.get('ignore_unmapped', False)
 
         try:
-            if not self._dry_run:
-                try:
-                    self._submit(self.metrics_mapper[message.name], message, send_histograms_buckets, send_monotonic_counter, custom_tags)
-                except KeyError:
-                    if not ignore_unmapped:
-                        # call magic method (non-generic check)
-                        getattr(self, message.name)(message, **kwargs)
-                    else:
-                        # build the wildcard list if first pass
-                        if self._metrics_wildcards is None:
-                            self._metrics_wildcards = [x for x in self.metrics_mapper.keys() if '*' in x]
-                        # try matching wildcard (generic check)
-                        for wildcard in self._metrics_wildcards:
-                            if fnmatchcase(message.name, wildcard):
-                                self._submit(message.name, message, send_histograms_buckets, send_monotonic_counter, custom_tags)
+            try:
+                self._submit(self.metrics_mapper[message.name], message, send_histograms_buckets, send_monotonic_counter, custom_tags)
+            except KeyError:
+                if not ignore_unmapped:
+                    # call magic method (non-generic check)
+                    getattr(self, message.name)(message, **kwargs)
+                else:
+                    # build the wildcard list if first pass
+                    if self._metrics_wildcards is None:
+                        self._metrics_wildcards = [x for x in self.metrics_mapper.keys() if '*' in x]
+                    # try matching wildcard (generic check)
+                    for wildcard in self._metrics_wildcards:
+                        if fnmatchcase(message.name, wildcard):
+                            self._submit(message.name, message, send_histograms_buckets, send_monotonic_counter, custom_tags)
 
         except AttributeError as err:
             self.log.debug("Unable to handle metric: {} - error: {}".format(message.name, err))
@@ -453,6 +530,22 @@ class PrometheusScraperMixin(object):
         :param headers: extra headers
         :return: requests.Response
         """
+        try:
+            response = self.send_request(endpoint, pFormat, headers)
+        except requests.exceptions.SSLError:
+            self.log.error("Invalid SSL settings for requesting {} endpoint".format(endpoint))
+            raise
+        except IOError:
+            self.submit_health_service_check(endpoint, AgentCheck.CRITICAL)
+            raise
+        self.submit_health_service_check(endpoint, AgentCheck.OK)
+        self.submit_connection_stats(endpoint)
+        return response
+
+    def send_request(self, endpoint, pFormat=PrometheusFormat.PROTOBUF, headers=None, timeout=10):
+        """
+        Same as `poll`, without sending the health service check
+        """
         if headers is None:
             headers = {}
         if 'accept-encoding' not in headers:
@@ -473,37 +566,98 @@ class PrometheusScraperMixin(object):
         elif self.ssl_ca_cert is False:
             disable_warnings(InsecureRequestWarning)
             verify = False
-        try:
-            response = requests.get(endpoint, headers=headers, stream=True, timeout=10, cert=cert, verify=verify)
-        except requests.exceptions.SSLError:
-            self.log.error("Invalid SSL settings for requesting {} endpoint".format(endpoint))
-            raise
-        except IOError:
-            if self.health_service_check:
-                self._submit_service_check(
-                    "{}{}".format(self.NAMESPACE, ".prometheus.health"),
-                    AgentCheck.CRITICAL,
-                    tags=["endpoint:" + endpoint]
-                )
-            raise
+        session = self.get_http_session(endpoint, cert, verify)
+        response = session.get(endpoint, headers=headers, stream=True, timeout=timeout, cert=cert, verify=verify)
+        self._track_connection(endpoint, response)
         try:
             response.raise_for_status()
-            if self.health_service_check:
-                self._submit_service_check(
-                    "{}{}".format(self.NAMESPACE, ".prometheus.health"),
-                    AgentCheck.OK,
-                    tags=["endpoint:" + endpoint]
-                )
-            return response
         except requests.HTTPError:
             response.close()
-            if self.health_service_check:
-                self._submit_service_check(
-                    "{}{}".format(self.NAMESPACE, ".prometheus.health"),
-                    AgentCheck.CRITICAL,
-                    tags=["endpoint:" + endpoint]
-                )
             raise
+        return response
+
+    def submit_health_service_check(self, endpoint, status):
+        """
+        Send the health service check of `endpoint` if enabled
+        """
+        if self.health_service_check:
+            self._submit_service_check(
+                "{}{}".format(self.NAMESPACE, ".prometheus.health"),
+                status,
+                tags=["endpoint:" + endpoint]
+            )
+
+    def get_http_session(self, endpoint, cert=None, verify=True):
+        """
+        Return the requests.Session used to poll `endpoint`. Sessions are kept across runs so their
+        connections are reused, the session of an endpoint is replaced when its TLS settings change.
+
+        :param endpoint: string url endpoint
+        :param cert: client certificate, as passed to requests
+        :param verify: TLS verification setting, as passed to requests
+        :return: requests.Session
+        """
+        tls_config = (cert, verify)
+        cached = self._http_sessions.get(endpoint)
+        if cached is not None:
+            if cached[0] == tls_config:
+                return cached[1]
+            cached[1].close()
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.REQUESTS_POOL_MAXSIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.cert = cert
+        session.verify = verify
+        self._http_sessions[endpoint] = (tls_config, session)
+        return session
+
+    def close_http_sessions(self, endpoints=None):
+        """
+        Close the sessions of `endpoints`, all of them by default, and forget their connection stats,
+        e.g. once the endpoints are removed from the configuration
+
+        :param endpoints: list of string url endpoints
+        """
+        if endpoints is None:
+            endpoints = list(self._http_sessions)
+        for endpoint in endpoints:
+            cached = self._http_sessions.pop(endpoint, None)
+            if cached is not None:
+                cached[1].close()
+            self._known_sockets.pop(endpoint, None)
+            self.connection_stats.pop(endpoint, None)
+
+    def _track_connection(self, endpoint, response):
+        """
+        Count the request in the `connection_stats` of `endpoint`, as reused if its socket already
+        carried a previous request. The socket is read from the public `connection` of the urllib3
+        response, which is held until the streamed response is closed.
+        """
+        connection = getattr(response.raw, 'connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        known_sockets = self._known_sockets.setdefault(endpoint, WeakSet())
+        stats = self.connection_stats.setdefault(endpoint, {'new': 0, 'reused': 0})
+        if sock in known_sockets:
+            stats['reused'] += 1
+        else:
+            known_sockets.add(sock)
+            stats['new'] += 1
+
+    def submit_connection_stats(self, endpoint):
+        """
+        Send the number of requests sent to `endpoint` over a new connection and over a kept-alive one
+        """
+        stats = self.connection_stats.get(endpoint)
+        if stats is None:
+            return
+        tags = ["endpoint:" + endpoint]
+        prefix = "{}.prometheus.connections".format(self.NAMESPACE)
+        self._submit_raw_monotonic_count(prefix + ".new", stats['new'], tags=tags)
+        self._submit_raw_monotonic_count(prefix + ".reused", stats['reused'], tags=tags)
 
     def _submit(self, metric_name, message, send_histograms_buckets=True, send_monotonic_counter=False, custom_tags=None, hostname=None):
         """
@@ -555,6 +709,9 @@ class PrometheusScraperMixin(object):
             for label in metric.label:
                 if label.name == self.label_to_hostname:
                     return label.value
+            for name, value in self._label_join_index.joined_labels(metric):
+                if name == self.label_to_hostname:
+                    return value
 
         return hostname
 
@@ -77,7 +77,14 @@ class PrometheusCheck(PrometheusScraperMixin, AgentCheck):
                 if self.labels_mapper is not None and label.name in self.labels_mapper:
                     tag_name = self.labels_mapper[label.name]
                 _tags.append('{}:{}'.format(tag_name, label.value))
+        _tags.extend(self._label_join_index.joined_tags(metric))
         return self._finalize_tags_to_submit(_tags, metric_name, val, metric, custom_tags=custom_tags, hostname=hostname)
 
     def _submit_service_check(self, *args, **kwargs):
         self.service_check(*args, **kwargs)
+
+    def _submit_raw_monotonic_count(self, *args, **kwargs):
+        self.monotonic_count(*args, **kwargs)
+
+    def _batch_metrics(self):
+        return self.batch_metrics()
@@ -21,6 +21,14 @@ class AggregatorStub(object):
     def submit_metric(self, check, check_id, mtype, name, value, tags, hostname):
         self._metrics[name].append(MetricStub(name, mtype, value, tags, hostname))
 
+    def submit_metrics(self, check, check_id, mtypes, names, values, tags, hostnames):
+        """
+        Batch entry point, receives the samples column-wise as flushed by `AgentCheck.batch_metrics`
+        """
+        metrics = self._metrics
+        for mtype, name, value, sample_tags, hostname in zip(mtypes, names, values, tags, hostnames):
+            metrics[name].append(MetricStub(name, mtype, value, sample_tags, hostname))
+
     def submit_service_check(self, check, check_id, name, status, tags, hostname, message):
         self._service_checks[name].append(ServiceCheckStub(check_id, name, status, tags, hostname, message))
 
@@ -0,0 +1,55 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Bounded mapping evicting the least recently used entries, meant for hot paths.
+
+    An `OrderedDict` costs as much to reorder on every hit as most of the values we cache
+    cost to compute, so the recency is tracked by generations instead: entries live in the
+    current generation, and when it is full it becomes the previous one. Entries of the
+    previous generation are moved back to the current one when they are used, the others
+    are dropped with it at the next rotation. Lookups are a single dict access, and the
+    cache never holds more than `maxsize` entries.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._generation_size = max(maxsize // 2, 1)
+        self._current = {}
+        self._previous = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self._current.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._previous.pop(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.set(key, value)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        current = self._current
+        if key not in current and len(current) >= self._generation_size:
+            self._previous = current
+            self._current = current = {}
+        current[key] = value
+
+    def clear(self):
+        self._current = {}
+        self._previous = {}
+
+    def __contains__(self, key):
+        return key in self._current or key in self._previous
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
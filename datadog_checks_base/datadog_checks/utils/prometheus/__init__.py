@@ -3,3 +3,4 @@
 # Licensed under Simplified BSD License (see LICENSE)
 
 from .functions import parse_metric_family  # noqa: F401
+from .text_parser import parse_text_metric_families  # noqa: F401
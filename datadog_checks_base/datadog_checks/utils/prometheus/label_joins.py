@@ -0,0 +1,111 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+
+
+class LabelJoinIndex(object):
+    """
+    Index of the labels to join to the metrics sharing a label value with a `label_joins` target, e.g.
+    `node` and `host_ip` of `kube_pod_info` joined by `pod`.
+
+    Each value of a matched label maps to the (name, value) pairs of the labels to join and to the tags
+    they make, formatted once when the target is stored and shared by all the metrics carrying that value.
+
+    Entries are stamped with the generation (scrape) that stored them: at the end of a scrape, the entries
+    of a matched label not refreshed by its targets are dropped. Labels whose targets were missing from the
+    scrape keep their entries.
+    """
+    def __init__(self):
+        # target metric name -> (label_to_match, frozenset of labels_to_get)
+        self.targets = {}
+        # label_to_match -> {label value -> (generation, labels tuple, tags tuple)}
+        self._mappings = {}
+        self.generation = 0
+        # matched labels refreshed during the current generation
+        self._refreshed = set()
+
+    def start(self, label_joins):
+        """
+        Start a new generation with the `label_joins` configuration of the scraper
+        """
+        self.generation += 1
+        self._refreshed = set()
+        self.targets = {
+            name: (join['label_to_match'], frozenset(join['labels_to_get'])) for name, join in label_joins.iteritems()
+        }
+        watched = set(label_to_match for label_to_match, _ in self.targets.itervalues())
+        for label_name in list(self._mappings):
+            if label_name not in watched:
+                del self._mappings[label_name]
+
+    def store(self, message, format_tags):
+        """
+        Index the labels to join of the target metric family `message`
+
+        :param format_tags: function turning a tuple of (name, value) labels into a tuple of tags
+        """
+        label_to_match, labels_to_get = self.targets[message.name]
+        mapping = self._mappings.setdefault(label_to_match, {})
+        generation = self.generation
+        for metric in message.metric:
+            matching_value = None
+            labels = []
+            for label in metric.label:
+                if label.name == label_to_match:
+                    matching_value = label.value
+                elif label.name in labels_to_get:
+                    labels.append((label.name, label.value))
+            if matching_value is not None:
+                labels = tuple(labels)
+                mapping[matching_value] = (generation, labels, format_tags(labels))
+        self._refreshed.add(label_to_match)
+
+    def collect(self):
+        """
+        Drop the entries of the labels refreshed during this generation that weren't stored again
+        """
+        generation = self.generation
+        for label_name in self._refreshed:
+            mapping = self._mappings[label_name]
+            for value in [value for value, entry in mapping.iteritems() if entry[0] != generation]:
+                del mapping[value]
+
+    def joined_labels(self, metric):
+        """
+        Return the tuple of (name, value) labels to join to `metric`
+        """
+        if not self._mappings:
+            return ()
+        joined = ()
+        for label in metric.label:
+            mapping = self._mappings.get(label.name)
+            if mapping is not None:
+                entry = mapping.get(label.value)
+                if entry is not None:
+                    joined += entry[1]
+        return joined
+
+    def joined_tags(self, metric):
+        """
+        Return the tuple of tags of the labels to join to `metric`
+        """
+        if not self._mappings:
+            return ()
+        joined = ()
+        for label in metric.label:
+            mapping = self._mappings.get(label.name)
+            if mapping is not None:
+                entry = mapping.get(label.value)
+                if entry is not None:
+                    joined += entry[2]
+        return joined
+
+    def get(self, label_name, value):
+        """
+        Return the tuple of (name, value) labels joined by `value` of `label_name`, or None
+        """
+        entry = self._mappings.get(label_name, {}).get(value)
+        return entry[1] if entry is not None else None
+
+    def __len__(self):
+        return sum(len(mapping) for mapping in self._mappings.itervalues())
@@ -0,0 +1,305 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from fnmatch import translate
+import re
+
+# message.type is the index in this array, same as `PrometheusScraperMixin.METRIC_TYPES`
+METRIC_TYPES = ['counter', 'gauge', 'summary', 'untyped', 'histogram']
+
+# labels holding the quantile/upper bound of a sample, they are not part of the series identity
+BOUND_LABELS = ('quantile', 'le')
+
+# sample name suffixes allowed in a family, by declared type
+ALLOWED_SUFFIXES = {
+    'summary': ('', '_count', '_sum'),
+    'histogram': ('_count', '_sum', '_bucket'),
+}
+
+NAME_RE = re.compile(r'[^{\s]+')
+LABELS_VALUE_RE = re.compile(r'(?:\s*\{(.*)\}\s*|\s+)(\S+)')
+LABEL_RE = re.compile(r'([^=\s,]+)\s*=\s*"((?:[^"\\]|\\.)*)"')
+ESCAPE_RE = re.compile(r'\\(.)')
+LABEL_ESCAPES = {'\\': '\\', 'n': '\n', '"': '"'}
+HELP_ESCAPES = {'\\': '\\', 'n': '\n'}
+
+
+class Label(object):
+    """
+    Lightweight equivalent of `metrics_pb2.LabelPair`
+    """
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name='', value=''):
+        self.name = name
+        self.value = value
+
+
+class LabelList(list):
+    """
+    List of `Label` supporting the protobuf repeated field `add()` method
+    """
+    def add(self):
+        label = Label()
+        self.append(label)
+        return label
+
+
+class Quantile(object):
+    __slots__ = ('quantile', 'value')
+
+    def __init__(self, quantile, value):
+        self.quantile = quantile
+        self.value = value
+
+
+class Bucket(object):
+    __slots__ = ('upper_bound', 'cumulative_count')
+
+    def __init__(self, upper_bound, cumulative_count):
+        self.upper_bound = upper_bound
+        self.cumulative_count = cumulative_count
+
+
+class Metric(object):
+    """
+    Lightweight equivalent of `metrics_pb2.Metric`.
+
+    The typed accessors (`metric.gauge.value`, `metric.summary.quantile`, `metric.histogram.bucket`...)
+    all resolve to the metric itself, so it can be handled like a protobuf message by `process_metric`,
+    `_submit` and the checks' magic methods.
+    """
+    __slots__ = ('label', 'value', 'sample_count', 'sample_sum', 'quantile', 'bucket')
+
+    def __init__(self, labels, value=0.0):
+        self.label = labels
+        self.value = value
+        self.sample_count = 0
+        self.sample_sum = 0.0
+        self.quantile = []
+        self.bucket = []
+
+    def Clear(self):
+        self.__init__(LabelList())
+
+    counter = gauge = untyped = summary = histogram = property(lambda self: self)
+
+
+class MetricFamily(object):
+    """
+    Lightweight equivalent of `metrics_pb2.MetricFamily`
+    """
+    __slots__ = ('name', 'help', 'type', 'metric')
+
+    def __init__(self, name, help, metric_type, metric):
+        self.name = name
+        self.help = help
+        self.type = metric_type
+        self.metric = metric
+
+
+class FamilyFilter(object):
+    """
+    Compiled allow/deny lists used to skip unwanted families at the tokenizer level,
+    before their labels are parsed.
+    """
+    def __init__(self, names=None, wildcards=None, ignored=None, partial=None):
+        """
+        :param names: iterable of the family names to parse
+        :param wildcards: iterable of fnmatch patterns of the family names to parse
+        :param ignored: iterable of the family names to skip, even if they are in `names` or match `wildcards`
+        :param partial: dict of family name -> list of labels, these families are parsed for the given labels only
+                        unless they are otherwise wanted. They take precedence over `ignored`.
+        """
+        self.names = set(names or [])
+        self.ignored = set(ignored or [])
+        self.partial = {name: frozenset(labels) for name, labels in (partial or {}).iteritems()}
+        self.pattern = None
+        if wildcards:
+            self.pattern = re.compile('|'.join(translate(wildcard) for wildcard in wildcards))
+
+    def wanted(self, name):
+        """
+        Return False if the family can be skipped, True if all its labels are needed,
+        or the frozenset of the only labels needed.
+        """
+        if name not in self.ignored:
+            if name in self.names:
+                return True
+            if self.pattern is not None and self.pattern.match(name):
+                return True
+        return self.partial.get(name, False)
+
+
+def _unescape(text, escapes):
+    if '\\' not in text:
+        return text
+    return ESCAPE_RE.sub(lambda m: escapes.get(m.group(1), m.group(0)), text)
+
+
+class _FamilyBuilder(object):
+    """
+    Accumulates the samples of the family being parsed. Samples of summaries and histograms
+    are grouped by a hashed key of their labels (without `quantile`/`le`), so `_sum`, `_count`
+    and `_bucket` samples are matched in constant time.
+    """
+    __slots__ = (
+        'name', 'short_name', 'help', 'type', 'labels', 'allowed', 'metrics', 'series', 'sums', 'counts'
+    )
+
+    def __init__(self, name, prefix, type_overrides, family_filter):
+        self.name = name
+        self.short_name = name[len(prefix):] if prefix and name.startswith(prefix) else name
+        self.help = ''
+        # `labels` is True when all the labels are needed, otherwise the set of labels to keep
+        self.labels = True if family_filter is None else family_filter.wanted(self.short_name)
+        self.set_type('untyped', type_overrides)
+
+    def set_type(self, declared_type, type_overrides):
+        self.allowed = {self.name + suffix: suffix for suffix in ALLOWED_SUFFIXES.get(declared_type, ('',))}
+        self.metrics = []
+        self.series = {}
+        self.sums = {}
+        self.counts = {}
+
+        override_key = '{}_bucket'.format(self.short_name) if declared_type == 'histogram' else self.short_name
+        if type_overrides:
+            self.type = type_overrides.get(override_key, declared_type)
+        else:
+            self.type = declared_type
+        if self.type not in METRIC_TYPES or self.type == 'untyped' or self.labels is False:
+            # the family will be skipped, no need to parse its samples
+            self.type = None
+
+    def add_sample(self, suffix, labels, value):
+        metric_type = self.type
+        if metric_type == 'summary' or metric_type == 'histogram':
+            if suffix == '_sum' or suffix == '_count':
+                key = frozenset((name, val) for name, val in labels if name not in BOUND_LABELS)
+                if suffix == '_sum':
+                    self.sums[key] = value
+                else:
+                    self.counts[key] = value
+                return
+
+            bound = None
+            series_labels = LabelList()
+            for name, val in labels:
+                if name in BOUND_LABELS:
+                    if (name == 'quantile') == (metric_type == 'summary'):
+                        bound = float(val)
+                else:
+                    series_labels.append(Label(name, val))
+            key = frozenset((label.name, label.value) for label in series_labels)
+
+            metric = self.series.get(key)
+            if metric is None:
+                metric = self.series[key] = Metric(series_labels)
+                self.metrics.append(metric)
+            if bound is not None:
+                if metric_type == 'summary':
+                    metric.quantile.append(Quantile(bound, value))
+                else:
+                    metric.bucket.append(Bucket(bound, long(value)))
+        else:
+            self.metrics.append(Metric(LabelList(Label(name, val) for name, val in labels), value))
+
+    def build(self):
+        if self.type is None or not self.metrics:
+            return None
+
+        if self.series:
+            sums, counts = self.sums, self.counts
+            for key, metric in self.series.iteritems():
+                if key in counts:
+                    metric.sample_count = long(counts[key])
+                if key in sums:
+                    metric.sample_sum = sums[key]
+
+        return MetricFamily(self.short_name, self.help, METRIC_TYPES.index(self.type), self.metrics)
+
+
+def parse_text_metric_families(lines, type_overrides=None, prefix='', family_filter=None):
+    """
+    Parse an iterable of lines in the Prometheus text format [0] in a single pass, yielding
+    one `MetricFamily` at a time as soon as all its samples have been read.
+
+    Families follow the same rules as `PrometheusScraperMixin.parse_metric_family`:
+    untyped families are skipped unless their type is overridden in `type_overrides`,
+    `prefix` is removed from the family names.
+
+    When a `FamilyFilter` is given, the samples of the families it doesn't want are skipped
+    as soon as their name is read, and only the needed labels of partial families are kept.
+
+    [0] https://prometheus.io/docs/instrumenting/exposition_formats/#text-format-details
+
+    :param lines: iterable of str, e.g. requests.Response.iter_lines()
+    :param type_overrides: dict of metric name -> metric type
+    :param prefix: str prefix to remove from the family names
+    :param family_filter: FamilyFilter
+    :return: generator of `MetricFamily`
+    """
+    family = None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0] == '#':
+            parts = line.split(None, 3)
+            if len(parts) < 3 or parts[1] not in ('HELP', 'TYPE'):
+                continue
+
+            name = parts[2]
+            if family is None or family.name != name:
+                if family is not None:
+                    result = family.build()
+                    if result is not None:
+                        yield result
+                family = _FamilyBuilder(name, prefix, type_overrides, family_filter)
+
+            if parts[1] == 'HELP':
+                family.help = _unescape(parts[3], HELP_ESCAPES) if len(parts) == 4 else ''
+            elif len(parts) == 4:
+                family.set_type(parts[3], type_overrides)
+            continue
+
+        name_match = NAME_RE.match(line)
+        if name_match is None:
+            raise ValueError("Invalid line: " + line)
+        name = name_match.group()
+
+        suffix = family.allowed.get(name) if family is not None else None
+        if suffix is None:
+            # sample outside of the current family: it makes an untyped family of its own
+            if family is not None:
+                result = family.build()
+                if result is not None:
+                    yield result
+            family = _FamilyBuilder(name, prefix, type_overrides, family_filter)
+            suffix = ''
+
+        if family.type is None:
+            continue
+
+        match = LABELS_VALUE_RE.match(line, name_match.end())
+        if match is None:
+            raise ValueError("Invalid line: " + line)
+        raw_labels, raw_value = match.groups()
+
+        if not raw_labels:
+            labels = []
+        elif family.labels is True:
+            labels = [(label_name, _unescape(label_value, LABEL_ESCAPES))
+                      for label_name, label_value in LABEL_RE.findall(raw_labels)]
+        else:
+            wanted_labels = family.labels
+            labels = [(label_name, _unescape(label_value, LABEL_ESCAPES))
+                      for label_name, label_value in LABEL_RE.findall(raw_labels) if label_name in wanted_labels]
+        family.add_sample(suffix, labels, float(raw_value))
+
+    if family is not None:
+        result = family.build()
+        if result is not None:
+            yield result
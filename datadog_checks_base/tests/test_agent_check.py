@@ -1,7 +1,17 @@
 # (C) Datadog, Inc. 2018
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import mock
+import pytest
+
 from datadog_checks.checks import AgentCheck
+from datadog_checks.stubs import aggregator
+
+
+@pytest.fixture
+def aggregator_stub():
+    aggregator.reset()
+    return aggregator
 
 
 def test_instance():
@@ -9,3 +19,144 @@ def test_instance():
     Simply assert the class can be insantiated
     """
     AgentCheck()
+
+
+@pytest.mark.parametrize('metric, prefix, fix_case, expected', [
+    ('foo.bar', None, False, 'foo.bar'),
+    ('(foo)-{bar}', 'prefix', False, 'prefix.foo_bar'),
+    ('_foo__ bar_._baz_', None, False, 'foo_bar.baz'),
+    (u'f\xf6\xf6 bar', None, False, 'foo_bar'),
+    ('MemStats.PauseNs', 'GoExpvar', True, 'go_expvar.mem_stats.pause_ns'),
+    ('__Foo__.BarBaz', None, True, 'foo.bar_baz'),
+])
+def test_normalize(metric, prefix, fix_case, expected):
+    assert AgentCheck().normalize(metric, prefix, fix_case=fix_case) == expected
+
+
+def test_normalize_cache():
+    check = AgentCheck()
+
+    assert check.normalize('foo bar', 'prefix') == 'prefix.foo_bar'
+    assert check.normalize('foo bar', 'prefix') == 'prefix.foo_bar'
+    assert check.normalize('foo bar', 'prefix', fix_case=True) == 'prefix.foo_bar'
+    assert (check._normalize_cache.hits, check._normalize_cache.misses) == (1, 2)
+
+
+def test_convert_to_underscore_separated_cache():
+    check = AgentCheck()
+
+    assert check.convert_to_underscore_separated('MemStats.PauseNs') == 'mem_stats.pause_ns'
+    assert check.convert_to_underscore_separated('MemStats.PauseNs') == 'mem_stats.pause_ns'
+    assert (check._normalize_cache.hits, check._normalize_cache.misses) == (1, 1)
+    # the normalized names are cached apart
+    assert check.normalize('MemStats.PauseNs') == 'MemStats.PauseNs'
+    assert (check._normalize_cache.hits, check._normalize_cache.misses) == (1, 2)
+
+
+def test_normalize_tags():
+    check = AgentCheck()
+    tags = [u'foo:bar', 'baz:qux', 42]
+
+    normalized = check._normalize_tags(tags, None)
+
+    assert normalized == ['foo:bar', 'baz:qux', '42']
+    assert all(isinstance(tag, str) for tag in normalized)
+    assert check._normalize_tags(None, None) == []
+    assert check._normalize_tags(['foo:bar'], 'sda1') == ['foo:bar', 'device:sda1']
+
+
+def test_normalize_tags_cache():
+    check = AgentCheck()
+
+    normalized = check._normalize_tags([u'foo:bar', 'baz:qux'], None)
+    assert check._normalize_tags((u'foo:bar', 'baz:qux'), None) is normalized
+    assert check._normalize_tags(['baz:qux', u'foo:bar'], None) == ['baz:qux', 'foo:bar']
+    assert (check._tags_cache.hits, check._tags_cache.misses) == (1, 2)
+
+    # unhashable tags are normalized without the cache
+    assert check._normalize_tags([['foo']], None) == ["['foo']"]
+
+
+def test_batch_metrics(aggregator_stub):
+    check = AgentCheck()
+
+    with mock.patch.object(aggregator_stub, 'submit_metrics', wraps=aggregator_stub.submit_metrics) as submit_metrics:
+        with check.batch_metrics():
+            check.gauge('foo', 1, tags=[u'foo:bar'])
+            with check.batch_metrics():
+                check.rate('bar', 2, hostname='baz')
+            check.gauge('foo', None)
+            assert not aggregator_stub.metric_names
+
+        assert submit_metrics.call_count == 1
+    aggregator_stub.assert_metric('foo', value=1, tags=['foo:bar'], count=1, metric_type=aggregator_stub.GAUGE)
+    aggregator_stub.assert_metric('bar', value=2, tags=[], hostname='baz', count=1, metric_type=aggregator_stub.RATE)
+
+    # out of a batch, metrics are submitted right away
+    check.gauge('baz', 3)
+    aggregator_stub.assert_metric('baz', value=3, count=1)
+
+
+def test_batch_metrics_flush(aggregator_stub):
+    check = AgentCheck()
+    check.METRIC_BATCH_SIZE = 2
+
+    with pytest.raises(ValueError):
+        with check.batch_metrics():
+            for i in range(3):
+                check.gauge('foo', i)
+            assert len(aggregator_stub.metrics('foo')) == 2
+            raise ValueError()
+
+    # samples buffered before the exception are flushed
+    aggregator_stub.assert_metric('foo', count=3)
+    assert check._metric_batch is None
+
+
+def test_batch_metrics_without_batch_support(aggregator_stub):
+    check = AgentCheck()
+
+    with mock.patch.object(aggregator_stub, 'submit_metrics', None), \
+            mock.patch.object(aggregator_stub, 'submit_metric', wraps=aggregator_stub.submit_metric) as submit_metric:
+        with check.batch_metrics():
+            check.gauge('foo', 1, tags=['foo:bar'])
+            check.gauge('bar', 2)
+            assert not submit_metric.called
+
+    submit_metric.assert_has_calls([
+        mock.call(check, '', 0, 'foo', 1.0, ['foo:bar'], ''),
+        mock.call(check, '', 0, 'bar', 2.0, [], ''),
+    ])
+
+
+class SubmittingCheck(AgentCheck):
+    def check(self, instance):
+        self.gauge('foo', 1, tags=['foo:bar'])
+        self.gauge('foo', 2, tags=['foo:baz'])
+        self.rate('bar', 3)
+
+
+def test_run_stats(aggregator_stub):
+    assert AgentCheck().profiler is None
+
+    check = SubmittingCheck('test', {'collect_run_stats': True}, {}, [{}])
+    assert check.run() == ''
+
+    tags = ['check:test']
+    for name in ('run_time', 'cpu_time', 'tags_normalization_time'):
+        aggregator_stub.assert_metric('datadog.agent.check.' + name, tags=tags, count=1)
+    aggregator_stub.assert_metric('datadog.agent.check.submissions', value=2, tags=tags + ['metric_type:gauge'], count=1)
+    aggregator_stub.assert_metric('datadog.agent.check.submissions', value=1, tags=tags + ['metric_type:rate'], count=1)
+
+
+def test_profile_runs(aggregator_stub, tmpdir):
+    output = str(tmpdir.join('profile.txt'))
+    check = SubmittingCheck('test', {'profile_runs': 2, 'profile_top': 5, 'profile_output': output}, {}, [{}])
+
+    check.run()
+    assert not tmpdir.join('profile.txt').check()
+    check.run()
+    report = tmpdir.join('profile.txt').read()
+    assert report.startswith('Profile of run #2 of check test')
+    assert '(check)' in report
+    aggregator_stub.assert_metric('datadog.agent.check.run_time', count=2)
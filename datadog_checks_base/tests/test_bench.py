@@ -0,0 +1,279 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import logging
+import os
+
+from google.protobuf.internal.encoder import _VarintBytes  # pylint: disable=E0611,E0401
+import pytest
+
+from datadog_checks.checks import AgentCheck
+from datadog_checks.checks.prometheus import PrometheusCheck
+from datadog_checks.stubs import aggregator
+from datadog_checks.utils.prometheus import metrics_pb2
+from datadog_checks.utils.tailfile import TailFile
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'prometheus')
+
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4'
+PROTOBUF_CONTENT_TYPE = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
+
+# Shape of the synthetic payloads: families of 100 series, of each type in turn
+METRIC_TYPES = ['counter', 'gauge', 'summary', 'untyped', 'histogram']
+SYNTHETIC_TYPES = ['gauge', 'counter', 'histogram', 'summary']
+SERIES_PER_FAMILY = 100
+BUCKETS = [0.1, 1.0, 10.0, float('inf')]
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class MockResponse:
+    def __init__(self, content, content_type):
+        self.content = content
+        self.headers = {'Content-Type': content_type}
+
+    def iter_lines(self, **_):
+        return iter(self.content.split("\n"))
+
+    def close(self):
+        pass
+
+
+def _synthetic_families(series):
+    for family in range(series // SERIES_PER_FAMILY):
+        metric_type = SYNTHETIC_TYPES[family % len(SYNTHETIC_TYPES)]
+        yield 'synthetic_{}_{}'.format(metric_type, family), metric_type
+
+
+def _synthetic_labels(i):
+    return [('pod', 'pod-{}'.format(i)), ('namespace', 'default'), ('container', 'app')]
+
+
+def _format_labels(labels):
+    return ','.join('{}="{}"'.format(name, value) for name, value in labels)
+
+
+def synthetic_text_payload(series):
+    """
+    Return a text payload of `series` series (label sets), see `SYNTHETIC_TYPES`
+    """
+    lines = []
+    for name, metric_type in _synthetic_families(series):
+        lines.append('# HELP {} Synthetic {}.'.format(name, metric_type))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for i in range(SERIES_PER_FAMILY):
+            labels = _format_labels(_synthetic_labels(i))
+            if metric_type == 'histogram':
+                for j, bound in enumerate(BUCKETS):
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, '+Inf' if j == 3 else bound, i + j))
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, i * 1.5))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, i + 3))
+            elif metric_type == 'summary':
+                for quantile in QUANTILES:
+                    lines.append('{}{{{},quantile="{}"}} {}'.format(name, labels, quantile, i * quantile))
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, i * 1.5))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, i + 3))
+            else:
+                lines.append('{}{{{}}} {}'.format(name, labels, i))
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_protobuf_payload(series):
+    """
+    Return the delimited protobuf equivalent of `synthetic_text_payload`
+    """
+    chunks = []
+    for name, metric_type in _synthetic_families(series):
+        message = metrics_pb2.MetricFamily()
+        message.name = name
+        message.help = 'Synthetic {}.'.format(metric_type)
+        message.type = METRIC_TYPES.index(metric_type)
+        for i in range(SERIES_PER_FAMILY):
+            metric = message.metric.add()
+            for label_name, label_value in _synthetic_labels(i):
+                label = metric.label.add()
+                label.name = label_name
+                label.value = label_value
+            if metric_type == 'histogram':
+                metric.histogram.sample_sum = i * 1.5
+                metric.histogram.sample_count = i + 3
+                for j, bound in enumerate(BUCKETS):
+                    bucket = metric.histogram.bucket.add()
+                    bucket.upper_bound = bound
+                    bucket.cumulative_count = i + j
+            elif metric_type == 'summary':
+                metric.summary.sample_sum = i * 1.5
+                metric.summary.sample_count = i + 3
+                for quantile in QUANTILES:
+                    q = metric.summary.quantile.add()
+                    q.quantile = quantile
+                    q.value = i * quantile
+            else:
+                getattr(metric, metric_type).value = i
+        data = message.SerializeToString()
+        chunks.append(_VarintBytes(len(data)) + data)
+    return ''.join(chunks)
+
+
+def synthetic_ksm_payload(pods):
+    """
+    Return a text payload with a `kube_pod_info` table of `pods` pods, and a status metric for each of them
+    """
+    lines = ['# TYPE kube_pod_info gauge']
+    for i in range(pods):
+        lines.append('kube_pod_info{{namespace="default",pod="pod-{0}",host_ip="10.0.{1}.{2}",pod_ip="172.17.{1}.{2}",'
+                     'node="node-{3}",created_by_kind="ReplicaSet",created_by_name="app-{3}"}} 1'
+                     .format(i, i // 256 % 256, i % 256, i % 100))
+    lines.append('# TYPE kube_pod_status_ready gauge')
+    for i in range(pods):
+        lines.append('kube_pod_status_ready{{namespace="default",pod="pod-{}",condition="true"}} 1'.format(i))
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.fixture(params=[1000, 10000, 100000], ids=['1k', '10k', '100k'])
+def series(request):
+    return request.param
+
+
+# the payloads depend on `benchmark` so they're not generated when the benchmarks are skipped
+@pytest.fixture
+def synthetic_text(benchmark, series):
+    return synthetic_text_payload(series)
+
+
+@pytest.fixture
+def synthetic_protobuf(benchmark, series):
+    return synthetic_protobuf_payload(series)
+
+
+@pytest.fixture(params=['metrics.txt', 'ksm.txt'])
+def text_payload(request):
+    with open(os.path.join(FIXTURES_DIR, request.param), 'r') as f:
+        return f.read()
+
+
+@pytest.fixture
+def check():
+    check = PrometheusCheck('prometheus_check', {}, {}, {})
+    check.NAMESPACE = 'prometheus'
+    return check
+
+
+def test_parse_metric_family_text(benchmark, check, text_payload):
+    benchmark(lambda: list(check.parse_metric_family(MockResponse(text_payload, 'text/plain'))))
+
+
+def test_stream_metric_family_text(benchmark, check, text_payload):
+    benchmark(lambda: list(check.stream_metric_family(MockResponse(text_payload, 'text/plain'))))
+
+
+def test_stream_metric_family_text_filtered(benchmark, check, text_payload):
+    check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready', 'go_goroutines': 'goroutines'}
+    check.label_joins = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    family_filter = check.get_family_filter(ignore_unmapped=True)
+
+    benchmark(lambda: list(check.stream_metric_family(MockResponse(text_payload, 'text/plain'), family_filter)))
+
+
+def test_stream_metric_family_synthetic_text(benchmark, check, synthetic_text):
+    benchmark(lambda: list(check.stream_metric_family(MockResponse(synthetic_text, TEXT_CONTENT_TYPE))))
+
+
+def test_parse_metric_family_synthetic_protobuf(benchmark, check, synthetic_protobuf):
+    benchmark(lambda: list(check.parse_metric_family(MockResponse(synthetic_protobuf, PROTOBUF_CONTENT_TYPE))))
+
+
+@pytest.mark.parametrize('metric_type', ['histogram', 'summary'])
+def test_submit(benchmark, check, metric_type):
+    families = [
+        family for family in check.stream_metric_family(MockResponse(synthetic_text_payload(1000), TEXT_CONTENT_TYPE))
+        if family.type == METRIC_TYPES.index(metric_type)
+    ]
+
+    def submit():
+        aggregator.reset()
+        for family in families:
+            check._submit(family.name, family)
+
+    benchmark(submit)
+
+
+@pytest.mark.parametrize('pods', [1000, 10000], ids=['1k', '10k'])
+def test_label_joins(benchmark, check, pods):
+    payload = synthetic_ksm_payload(pods)
+    check.poll = lambda endpoint: MockResponse(payload, TEXT_CONTENT_TYPE)
+    check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
+    check.label_joins = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node', 'host_ip']}}
+
+    def process():
+        aggregator.reset()
+        check.process('http://ksm/metrics', ignore_unmapped=True)
+
+    benchmark(process)
+    aggregator.assert_metric_has_tag('prometheus.pod.ready', 'node:node-1', count=pods // 100)
+
+
+@pytest.mark.parametrize('cache_size', [0, AgentCheck.TAGS_CACHE_SIZE], ids=['no_cache', 'cache'])
+def test_normalize_tags(benchmark, cache_size):
+    check = AgentCheck()
+    check._tags_cache.maxsize = cache_size
+    tags = [
+        [u'container_name:app-{}'.format(i), 'image_name:redis', 'image_tag:4.0', 'kube_namespace:default',
+         'pod_name:redis-{}'.format(i), 'kube_deployment:redis', 'docker_image:redis:4.0']
+        for i in range(100)
+    ]
+
+    def normalize():
+        for t in tags:
+            check._normalize_tags(t, None)
+
+    benchmark(normalize)
+
+
+@pytest.mark.parametrize('cache_size', [0, AgentCheck.NORMALIZE_CACHE_SIZE], ids=['cold', 'warm'])
+def test_normalize(benchmark, cache_size):
+    check = AgentCheck()
+    check._normalize_cache.maxsize = cache_size
+    names = ['MemStats.Frees-{}'.format(i) for i in range(100)]
+
+    def normalize():
+        for name in names:
+            check.normalize(name, 'go_expvar', fix_case=True)
+            check.normalize(name, 'go_expvar')
+
+    benchmark(normalize)
+
+
+@pytest.mark.parametrize('batch', [False, True], ids=['no_batch', 'batch'])
+def test_submit_metrics(benchmark, check, batch):
+    check.check_id = 'bench'
+    tags = [['pod_name:redis-{}'.format(i), 'kube_namespace:default'] for i in range(1000)]
+
+    def submit():
+        aggregator.reset()
+        if batch:
+            with check.batch_metrics():
+                for t in tags:
+                    check.gauge('prometheus.foo', 1, tags=t)
+        else:
+            for t in tags:
+                check.gauge('prometheus.foo', 1, tags=t)
+
+    benchmark(submit)
+
+
+def test_tail_file(benchmark, tmpdir):
+    log_file = tmpdir.join('test.log')
+    log_file.write(''.join(
+        '2018-06-01 12:00:{:02d} INFO [worker-{}] request served in {}ms\n'.format(i % 60, i % 8, i % 500)
+        for i in range(100000)
+    ))
+    lines = []
+
+    def tail():
+        del lines[:]
+        tailer = TailFile(logging.getLogger(__name__), str(log_file), lambda line: lines.append(line))
+        next(tailer.tail(line_by_line=False, move_end=False))
+
+    benchmark(tail)
+    assert len(lines) == 100000
@@ -1,15 +1,19 @@
 # (C) Datadog, Inc. 2016
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 import logging
 import os
+import threading
 
 import pytest
 import mock
 import requests
 
 from datadog_checks.checks.prometheus import PrometheusCheck, UnknownFormatError
-from datadog_checks.utils.prometheus import parse_metric_family, metrics_pb2
+from datadog_checks.utils.prometheus import parse_metric_family, parse_text_metric_families, metrics_pb2
+from datadog_checks.utils.prometheus.text_parser import FamilyFilter
 
 
 protobuf_content_type = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
@@ -285,7 +289,6 @@ def test_process_instance_with_tags(bin_data, mocked_prometheus_check, ref_gauge
 def test_process_metric_gauge(mocked_prometheus_check, ref_gauge):
     """ Gauge ref submission """
     check = mocked_prometheus_check
-    check._dry_run = False
     check.process_metric(ref_gauge)
     check.gauge.assert_called_with('prometheus.process.vm.bytes', 39211008.0, [], hostname=None)
 
@@ -299,7 +302,6 @@ def test_process_metric_filtered(mocked_prometheus_check):
     _m = filtered_gauge.metric.add()
     _m.gauge.value = 39211008.0
     check = mocked_prometheus_check
-    check._dry_run = False
     check.process_metric(filtered_gauge)
     check.log.debug.assert_called_with(
         "Unable to handle metric: process_start_time_seconds - error: 'PrometheusCheck' object has no attribute 'process_start_time_seconds'")
@@ -313,7 +315,7 @@ def test_poll_protobuf(mocked_prometheus_check, bin_data):
         status_code=200,
         content=bin_data,
         headers={'Content-Type': protobuf_content_type})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     response = check.poll("http://fake.endpoint:10055/metrics")
     messages = list(check.parse_metric_family(response))
@@ -329,7 +331,7 @@ def test_poll_text_plain(mocked_prometheus_check, text_data):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     response = check.poll("http://fake.endpoint:10055/metrics")
     messages = list(check.parse_metric_family(response))
@@ -339,6 +341,95 @@ def test_poll_text_plain(mocked_prometheus_check, text_data):
     p.stop()
 
 
+@pytest.fixture
+def metrics_server(text_data):
+    """
+    Local keep-alive HTTP server serving the text payload, records the client port of each request
+    """
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            ports.append(self.client_address[1])
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(text_data)))
+            self.end_headers()
+            self.wfile.write(text_data)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.ports = ports
+    server.url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_poll_reuses_connections(p_check, metrics_server):
+    for _ in range(3):
+        messages = list(p_check.scrape_metrics(metrics_server.url))
+        assert len(messages) == 40
+
+    assert len(set(metrics_server.ports)) == 1
+    assert p_check.connection_stats == {metrics_server.url: {'new': 1, 'reused': 2}}
+
+
+def test_poll_submits_connection_stats(p_check, metrics_server):
+    p_check.NAMESPACE = 'ns'
+    with mock.patch.object(p_check, 'monotonic_count') as monotonic_count:
+        for _ in range(2):
+            list(p_check.scrape_metrics(metrics_server.url))
+
+    tags = ['endpoint:' + metrics_server.url]
+    assert monotonic_count.call_args_list == [
+        mock.call('ns.prometheus.connections.new', 1, tags=tags),
+        mock.call('ns.prometheus.connections.reused', 0, tags=tags),
+        mock.call('ns.prometheus.connections.new', 1, tags=tags),
+        mock.call('ns.prometheus.connections.reused', 1, tags=tags),
+    ]
+
+
+def test_close_http_sessions(p_check, metrics_server):
+    list(p_check.scrape_metrics(metrics_server.url))
+    session = p_check.get_http_session(metrics_server.url)
+
+    with mock.patch.object(session, 'close', wraps=session.close) as close:
+        p_check.close_http_sessions([metrics_server.url])
+    close.assert_called_once_with()
+    assert p_check.connection_stats == {}
+
+    list(p_check.scrape_metrics(metrics_server.url))
+    assert p_check.get_http_session(metrics_server.url) is not session
+    assert len(set(metrics_server.ports)) == 2
+    assert p_check.connection_stats == {metrics_server.url: {'new': 1, 'reused': 0}}
+
+
+def test_poll_session_tls_config_change(p_check, metrics_server):
+    session = p_check.get_http_session(metrics_server.url)
+    assert p_check.get_http_session(metrics_server.url) is session
+
+    list(p_check.scrape_metrics(metrics_server.url))
+    p_check.ssl_ca_cert = False
+    list(p_check.scrape_metrics(metrics_server.url))
+
+    assert p_check.get_http_session(metrics_server.url, verify=False) is not session
+    assert len(set(metrics_server.ports)) == 2
+    assert p_check.connection_stats == {metrics_server.url: {'new': 2, 'reused': 0}}
+
+
 def test_submit_gauge_with_labels(mocked_prometheus_check, ref_gauge):
     """ submitting metrics that contain labels should result in tags on the gauge call """
     _l1 = ref_gauge.metric[0].label.add()
@@ -1161,6 +1252,227 @@ def test_parse_one_summary_with_none_values(p_check):
     assert expected_etcd_metric.__repr__() == current_metric.__repr__()
 
 
+def _family_repr(family):
+    """
+    Build a comparable representation of a protobuf or lightweight MetricFamily
+    """
+    metrics = []
+    for metric in family.metric:
+        metrics.append((
+            sorted((label.name, label.value) for label in metric.label),
+            repr(metric.counter.value) if family.type == 0 else None,
+            repr(metric.gauge.value) if family.type == 1 else None,
+            (metric.summary.sample_count, metric.summary.sample_sum,
+             [(q.quantile, repr(q.value)) for q in metric.summary.quantile]) if family.type == 2 else None,
+            (metric.histogram.sample_count, metric.histogram.sample_sum,
+             [(b.upper_bound, b.cumulative_count) for b in metric.histogram.bucket]) if family.type == 4 else None,
+        ))
+    return family.name, family.help, family.type, sorted(metrics)
+
+
+@pytest.mark.parametrize('fixture', ['metrics.txt', 'ksm.txt'])
+def test_stream_metric_family_matches_parse_metric_family(fixture, mocked_prometheus_check):
+    f_name = os.path.join(os.path.dirname(__file__), 'fixtures', 'prometheus', fixture)
+    with open(f_name, 'r') as f:
+        text_data = f.read()
+    check = mocked_prometheus_check
+    check.type_overrides = {"go_goroutines": "gauge"}
+
+    expected = sorted(_family_repr(m) for m in check.parse_metric_family(MockResponse(text_data, 'text/plain')))
+    streamed = [m for m in check.stream_metric_family(MockResponse(text_data, 'text/plain'))]
+
+    assert expected == sorted(_family_repr(m) for m in streamed)
+    assert not any(isinstance(m, metrics_pb2.MetricFamily) for m in streamed)
+
+
+def test_stream_metric_family_protobuf(bin_data, mocked_prometheus_check):
+    messages = list(mocked_prometheus_check.stream_metric_family(MockResponse(bin_data, protobuf_content_type)))
+    assert len(messages) == 61
+    assert isinstance(messages[-1], metrics_pb2.MetricFamily)
+
+
+def test_parse_text_metric_families_histogram_out_of_order():
+    """ _sum/_count are matched to the buckets by labels, whatever their order """
+    text_data = (
+        '# HELP request_duration_seconds Request duration.\n'
+        '# TYPE request_duration_seconds histogram\n'
+        'request_duration_seconds_sum{method="GET",code="200"} 3.5\n'
+        'request_duration_seconds_count{code="500",method="GET"} 1\n'
+        'request_duration_seconds_bucket{code="200",method="GET",le="0.5"} 3\n'
+        'request_duration_seconds_bucket{le="0.5",code="500",method="GET"} 0\n'
+        'request_duration_seconds_bucket{code="200",method="GET",le="+Inf"} 4\n'
+        'request_duration_seconds_bucket{method="GET",code="500",le="+Inf"} 1\n'
+        'request_duration_seconds_count{method="GET",code="200"} 4\n'
+        'request_duration_seconds_sum{method="GET",code="500"} 12\n')
+
+    families = list(parse_text_metric_families(text_data.split('\n')))
+
+    assert len(families) == 1
+    family = families[0]
+    assert family.name == 'request_duration_seconds'
+    assert family.help == 'Request duration.'
+    assert family.type == 4
+    assert len(family.metric) == 2
+    ok, error = family.metric
+    assert sorted((label.name, label.value) for label in ok.label) == [('code', '200'), ('method', 'GET')]
+    assert (ok.histogram.sample_count, ok.histogram.sample_sum) == (4, 3.5)
+    assert [(b.upper_bound, b.cumulative_count) for b in ok.histogram.bucket] == [(0.5, 3), (float('inf'), 4)]
+    assert sorted((label.name, label.value) for label in error.label) == [('code', '500'), ('method', 'GET')]
+    assert (error.histogram.sample_count, error.histogram.sample_sum) == (1, 12)
+    assert [(b.upper_bound, b.cumulative_count) for b in error.histogram.bucket] == [(0.5, 0), (float('inf'), 1)]
+
+
+def test_parse_text_metric_families_prefix_overrides_and_escapes():
+    text_data = (
+        '# HELP app_version Version \\\\ info\\nof the app.\n'
+        '# TYPE app_version gauge\n'
+        'app_version{version="1.0",quote="a \\"b\\" c\\\\d",brace="}"} 1 1520879607789\n'
+        'app_untyped_total 12\n'
+        'app_other_untyped 3\n')
+
+    families = list(parse_text_metric_families(
+        text_data.split('\n'), type_overrides={'untyped_total': 'counter'}, prefix='app_'))
+
+    assert [(f.name, f.type) for f in families] == [('version', 1), ('untyped_total', 0)]
+    version, untyped = families
+    assert version.help == 'Version \\ info\nof the app.'
+    assert [(label.name, label.value) for label in version.metric[0].label] == [
+        ('version', '1.0'), ('quote', 'a "b" c\\d'), ('brace', '}')]
+    assert version.metric[0].gauge.value == 1.0
+    assert untyped.metric[0].counter.value == 12.0
+
+
+def test_stream_metric_family_label_joins(sorted_tags_check):
+    """ Joined labels are tagged from the first run on, even when the target comes last in the payload """
+    text_data = (
+        '# TYPE kube_pod_status_ready gauge\n'
+        'kube_pod_status_ready{pod="foo",condition="true"} 1\n'
+        '# TYPE kube_pod_info gauge\n'
+        'kube_pod_info{pod="foo",node="node-1"} 1\n')
+    check = sorted_tags_check
+    check.NAMESPACE = 'ksm'
+    check.label_joins = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
+    check.gauge = mock.MagicMock()
+    check.poll = mock.MagicMock(side_effect=lambda endpoint: MockResponse(text_data, 'text/plain'))
+
+    check.process("http://fake.endpoint:10055/metrics")
+
+    check.gauge.assert_called_once_with(
+        'ksm.pod.ready', 1.0, ['condition:true', 'node:node-1', 'pod:foo'], hostname=None)
+
+
+def test_label_joins_magic_method(mocked_prometheus_check):
+    """ The messages handled by the check methods are left untouched, `join_labels` returns the joined tags """
+    text_data = (
+        '# TYPE kube_pod_status_ready gauge\n'
+        'kube_pod_status_ready{pod="foo",condition="true"} 1\n'
+        '# TYPE kube_pod_info gauge\n'
+        'kube_pod_info{pod="foo",node="node-1"} 1\n')
+    check = mocked_prometheus_check
+    check.label_joins = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    joined_tags = []
+
+    def kube_pod_status_ready(message, **kwargs):
+        for metric in message.metric:
+            joined_tags.append(check.join_labels(metric))
+        assert [(label.name, label.value) for label in message.metric[0].label] == [
+            ('pod', 'foo'), ('condition', 'true')]
+
+    check.kube_pod_status_ready = kube_pod_status_ready
+    check.poll = mock.MagicMock(side_effect=lambda endpoint: MockResponse(text_data, 'text/plain'))
+
+    check.process("http://fake.endpoint:10055/metrics")
+
+    assert joined_tags == [('node:node-1',)]
+
+
+def test_label_joins_magic_method_submit(sorted_tags_check):
+    """ A check method submitting through `_submit` gets each joined tag once """
+    text_data = (
+        '# TYPE kube_pod_status_ready gauge\n'
+        'kube_pod_status_ready{pod="foo",condition="true"} 1\n'
+        '# TYPE kube_pod_info gauge\n'
+        'kube_pod_info{pod="foo",node="node-1"} 1\n')
+    check = sorted_tags_check
+    check.NAMESPACE = 'ksm'
+    check.label_joins = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    check.kube_pod_status_ready = lambda message, **kwargs: check._submit('pod.ready', message)
+    check.gauge = mock.MagicMock()
+    check.poll = mock.MagicMock(side_effect=lambda endpoint: MockResponse(text_data, 'text/plain'))
+
+    check.process("http://fake.endpoint:10055/metrics")
+    check.process("http://fake.endpoint:10055/metrics")
+
+    assert check.gauge.call_count == 2
+    for call in check.gauge.call_args_list:
+        assert call == mock.call('ksm.pod.ready', 1.0, ['condition:true', 'node:node-1', 'pod:foo'], hostname=None)
+
+
+def test_family_filter():
+    family_filter = FamilyFilter(
+        names=['go_goroutines', 'kube_pod_info'],
+        wildcards=['kube_pod_status_*', 'kube_node_?nfo'],
+        ignored=['kube_pod_status_phase', 'kube_pod_info'],
+        partial={'kube_pod_info': ['pod', 'node']}
+    )
+
+    assert family_filter.wanted('go_goroutines') is True
+    assert family_filter.wanted('kube_pod_status_ready') is True
+    assert family_filter.wanted('kube_node_info') is True
+    assert family_filter.wanted('kube_pod_status_phase') is False
+    assert family_filter.wanted('go_threads') is False
+    assert family_filter.wanted('kube_pod_info') == frozenset(['pod', 'node'])
+
+
+def test_parse_text_metric_families_with_filter(text_data):
+    family_filter = FamilyFilter(
+        names=['go_memstats_heap_alloc_bytes', 'http_response_size_bytes'],
+        partial={'skydns_skydns_dns_cachemiss_count_total': []}
+    )
+
+    families = {f.name: f for f in parse_text_metric_families(text_data.split('\n'), family_filter=family_filter)}
+
+    assert sorted(families) == [
+        'go_memstats_heap_alloc_bytes', 'http_response_size_bytes', 'skydns_skydns_dns_cachemiss_count_total'
+    ]
+    assert families['go_memstats_heap_alloc_bytes'].metric[0].gauge.value == 6396288.0
+    summaries = families['http_response_size_bytes'].metric
+    assert [(label.name, label.value) for label in summaries[0].label] == [('handler', 'prometheus')]
+    assert summaries[0].summary.sample_count == 25
+    # partial families are only parsed for the requested labels
+    cachemiss = families['skydns_skydns_dns_cachemiss_count_total'].metric
+    assert cachemiss[0].counter.value == 1359194.0
+    assert list(cachemiss[0].label) == []
+
+
+def test_process_skips_unwanted_families(text_data, mocked_prometheus_check):
+    check = mocked_prometheus_check
+    check.metrics_mapper = {
+        'go_memstats_heap_alloc_bytes': 'heap.alloc',
+        'go_memstats_gc_sys_bytes': 'gc.sys',
+        'process_*': 'process',
+    }
+    check.ignore_metrics = ['go_memstats_gc_sys_bytes']
+    check.poll = mock.MagicMock(side_effect=lambda endpoint: MockResponse(text_data, 'text/plain'))
+    check.process_metric = mock.MagicMock()
+
+    check.process("http://fake.endpoint:10055/metrics")
+    assert [c[0][0].name for c in check.process_metric.call_args_list] == ['go_memstats_heap_alloc_bytes']
+
+    check.process_metric.reset_mock()
+    check.process("http://fake.endpoint:10055/metrics", ignore_unmapped=True)
+    assert sorted(c[0][0].name for c in check.process_metric.call_args_list) == [
+        'go_memstats_heap_alloc_bytes',
+        'process_cpu_seconds_total',
+        'process_max_fds',
+        'process_open_fds',
+        'process_resident_memory_bytes',
+        'process_start_time_seconds',
+        'process_virtual_memory_bytes',
+    ]
+
+
 def test_label_joins(sorted_tags_check):
     """ Tests label join on text format """
     text_data = None
@@ -1171,7 +1483,7 @@ def test_label_joins(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1191,9 +1503,6 @@ def test_label_joins(sorted_tags_check):
                             'kube_deployment_status_replicas': 'deploy.replicas.available'}
 
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
 
     # check a bunch of metrics
@@ -1344,7 +1653,7 @@ def test_label_joins_gc(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1356,9 +1665,6 @@ def test_label_joins_gc(sorted_tags_check):
     }
     check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
     # check a bunch of metrics
     check.gauge.assert_has_calls([
@@ -1375,19 +1681,19 @@ def test_label_joins_gc(sorted_tags_check):
                 'node:gke-foobar-test-kube-default-pool-9b4ff111-j75z',
                 'pod_ip:11.132.0.14']), hostname=None),
     ], any_order=True)
-    assert 15 == len(check._label_mapping['pod'])
+    assert 15 == len(check._label_join_index)
     text_data = text_data.replace('dd-agent-62bgh', 'dd-agent-1337')
     p.stop()
     mock_response = mock.MagicMock(
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check.process("http://fake.endpoint:10055/metrics")
-    assert 'dd-agent-1337' in check._label_mapping['pod']
-    assert 'dd-agent-62bgh' not in check._label_mapping['pod']
-    assert 15 == len(check._label_mapping['pod'])
+    assert check._label_join_index.get('pod', 'dd-agent-1337') is not None
+    assert check._label_join_index.get('pod', 'dd-agent-62bgh') is None
+    assert 15 == len(check._label_join_index)
     p.stop()
 
 
@@ -1401,7 +1707,7 @@ def test_label_joins_missconfigured(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1413,9 +1719,6 @@ def test_label_joins_missconfigured(sorted_tags_check):
     }
     check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
     # check a bunch of metrics
     check.gauge.assert_has_calls([
@@ -1443,7 +1746,7 @@ def test_label_join_not_existing(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1455,9 +1758,6 @@ def test_label_join_not_existing(sorted_tags_check):
     }
     check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
     # check a bunch of metrics
     check.gauge.assert_has_calls([
@@ -1483,7 +1783,7 @@ def test_label_join_metric_not_existing(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1495,9 +1795,6 @@ def test_label_join_metric_not_existing(sorted_tags_check):
     }
     check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
     # check a bunch of metrics
     check.gauge.assert_has_calls([
@@ -1523,7 +1820,7 @@ def test_label_join_with_hostname(sorted_tags_check):
         status_code=200,
         iter_lines=lambda **kwargs: text_data.split("\n"),
         headers={'Content-Type': "text/plain"})
-    p = mock.patch('requests.get', return_value=mock_response, __name__="get")
+    p = mock.patch('requests.Session.get', return_value=mock_response, __name__="get")
     p.start()
     check = sorted_tags_check
     check.NAMESPACE = 'ksm'
@@ -1536,9 +1833,6 @@ def test_label_join_with_hostname(sorted_tags_check):
     check.label_to_hostname = 'node'
     check.metrics_mapper = {'kube_pod_status_ready': 'pod.ready'}
     check.gauge = mock.MagicMock()
-    # dry run to build mapping
-    check.process("http://fake.endpoint:10055/metrics")
-    # run with submit
     check.process("http://fake.endpoint:10055/metrics")
     # check a bunch of metrics
     check.gauge.assert_has_calls([
@@ -1562,7 +1856,7 @@ def mock_get():
     with open(f_name, 'r') as f:
         text_data = f.read()
     mock_get = mock.patch(
-        'requests.get',
+        'requests.Session.get',
         return_value=mock.MagicMock(
             status_code=200,
             iter_lines=lambda **kwargs: text_data.split("\n"),
@@ -1,4 +1,39 @@
+import threading
+import time
+
+import mock
+import pytest
+
+from datadog_checks.checks import AgentCheck
 from datadog_checks.checks.prometheus import GenericPrometheusCheck
+from datadog_checks.stubs import aggregator as _aggregator
+
+
+@pytest.fixture
+def aggregator():
+    _aggregator.reset()
+    return _aggregator
+
+
+def mock_get(delays):
+    """
+    Return a `requests.Session.get` replacement serving a gauge whose value is the index of the endpoint,
+    after the delay configured for the endpoint. Records the threads the requests are sent from.
+    """
+    threads = []
+
+    def get(url, **kwargs):
+        threads.append(threading.current_thread())
+        time.sleep(delays[url])
+        payload = '# TYPE foo gauge\nfoo {}\n'.format(sorted(delays).index(url))
+        return mock.MagicMock(
+            status_code=200,
+            iter_lines=lambda **kwargs: payload.split("\n"),
+            headers={'Content-Type': "text/plain"}
+        )
+
+    get.threads = threads
+    return get
 
 def test_rate_override():
     endpoint = "none"
@@ -14,3 +49,131 @@ def test_rate_override():
     processed_type_overrides = check.scrapers_map[endpoint].type_overrides
     assert cmp(expected_type_overrides, processed_type_overrides) == 0
     assert ["test_rate"] == check.scrapers_map[endpoint].rate_metrics
+
+
+def test_concurrent_scrapes(aggregator):
+    endpoints = ['http://a/metrics', 'http://b/metrics', 'http://c/metrics']
+    instance = {'prometheus_url': endpoints, 'namespace': 'ns', 'metrics': ['foo'], 'scrape_workers': 3}
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    get = mock_get({'http://a/metrics': 0.2, 'http://b/metrics': 0, 'http://c/metrics': 0.1})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        check.check(instance)
+    check.stop()
+
+    assert threading.current_thread() not in get.threads
+    # submitted in the order of the endpoints, whatever the order they were fetched in
+    assert [m.value for m in aggregator.metrics('ns.foo')] == [0, 1, 2]
+    for endpoint in endpoints:
+        tags = ['endpoint:' + endpoint]
+        aggregator.assert_service_check('ns.prometheus.health', status=AgentCheck.OK, tags=tags, count=1)
+        aggregator.assert_metric('ns.prometheus.scrape.fetch_time', tags=tags, count=1)
+        aggregator.assert_metric('ns.prometheus.scrape.parse_time', tags=tags, count=1)
+        aggregator.assert_metric('ns.prometheus.scrape.samples', value=1, tags=tags, count=1)
+
+
+def test_removed_endpoints_are_evicted(aggregator):
+    instance = {'prometheus_url': ['http://a/metrics', 'http://b/metrics'], 'namespace': 'ns', 'metrics': ['foo']}
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    scraper_a = check.scrapers_map['http://a/metrics']
+    scraper_b = check.scrapers_map['http://b/metrics']
+    get = mock_get({'http://a/metrics': 0, 'http://b/metrics': 0})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        check.check(instance)
+        new_instance = dict(instance, prometheus_url='http://a/metrics')
+        check.instances = [new_instance]
+        with mock.patch.object(scraper_b, 'close_http_sessions') as close_b:
+            check.check(new_instance)
+
+    close_b.assert_called_once_with()
+    assert check.scrapers_map == {'http://a/metrics': scraper_a}
+
+    with mock.patch.object(scraper_a, 'close_http_sessions') as close_a:
+        check.stop()
+    close_a.assert_called_once_with()
+
+
+def test_concurrent_scrapes_timeout(aggregator):
+    endpoints = ['http://a/metrics', 'http://b/metrics']
+    instance = {
+        'prometheus_url': endpoints, 'namespace': 'ns', 'metrics': ['foo'], 'scrape_workers': 2, 'scrape_timeout': 0.1
+    }
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    get = mock_get({'http://a/metrics': 0.5, 'http://b/metrics': 0})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        check.check(instance)
+        # the slow endpoint isn't polled again while its previous scrape is running
+        check.check(instance)
+    check.stop()
+
+    assert len(get.threads) == 3
+    assert [m.value for m in aggregator.metrics('ns.foo')] == [1, 1]
+    aggregator.assert_service_check(
+        'ns.prometheus.health', status=AgentCheck.CRITICAL, tags=['endpoint:http://a/metrics'], count=2
+    )
+    aggregator.assert_service_check(
+        'ns.prometheus.health', status=AgentCheck.OK, tags=['endpoint:http://b/metrics'], count=2
+    )
+
+
+def test_sequential_scrapes(aggregator):
+    endpoints = ['http://a/metrics', 'http://b/metrics']
+    instance = {'prometheus_url': endpoints, 'namespace': 'ns', 'metrics': ['foo']}
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    get = mock_get({'http://a/metrics': 0, 'http://b/metrics': 0})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        check.check(instance)
+
+    assert check.pool is None
+    assert get.threads == [threading.current_thread()] * 2
+    assert [m.value for m in aggregator.metrics('ns.foo')] == [0, 1]
+    # the payloads are streamed, the scrape stats are only known when fetched concurrently
+    assert aggregator.metrics('ns.prometheus.scrape.fetch_time') == []
+    for endpoint in endpoints:
+        tags = ['endpoint:' + endpoint]
+        aggregator.assert_service_check('ns.prometheus.health', status=AgentCheck.OK, tags=tags, count=1)
+        aggregator.assert_metric('ns.prometheus.connections.new', value=1, tags=tags, count=1)
+        aggregator.assert_metric('ns.prometheus.connections.reused', value=0, tags=tags, count=1)
+
+
+def test_sequential_scrapes_timeout(aggregator):
+    endpoints = ['http://a/metrics', 'http://b/metrics']
+    instance = {'prometheus_url': endpoints, 'namespace': 'ns', 'metrics': ['foo'], 'scrape_timeout': 0.1}
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    get = mock_get({'http://a/metrics': 0.2, 'http://b/metrics': 0})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        check.check(instance)
+
+    # the timeout only applies to concurrent scrapes, all the endpoints are polled
+    assert len(get.threads) == 2
+    assert [m.value for m in aggregator.metrics('ns.foo')] == [0, 1]
+    for endpoint in endpoints:
+        aggregator.assert_service_check(
+            'ns.prometheus.health', status=AgentCheck.OK, tags=['endpoint:' + endpoint], count=1
+        )
+
+
+def test_concurrent_scrapes_timeout_is_overall(aggregator):
+    endpoints = ['http://a/metrics', 'http://b/metrics', 'http://c/metrics']
+    instance = {
+        'prometheus_url': endpoints, 'namespace': 'ns', 'metrics': ['foo'], 'scrape_workers': 3, 'scrape_timeout': 0.2
+    }
+    check = GenericPrometheusCheck('prometheus_check', {}, {}, [instance])
+    get = mock_get({'http://a/metrics': 1, 'http://b/metrics': 1, 'http://c/metrics': 1})
+
+    with mock.patch('requests.Session.get', side_effect=get):
+        start = time.time()
+        check.check(instance)
+        elapsed = time.time() - start
+    check.stop()
+
+    # the endpoints aren't waited for one timeout each
+    assert elapsed < 0.5
+    for endpoint in endpoints:
+        aggregator.assert_service_check(
+            'ns.prometheus.health', status=AgentCheck.CRITICAL, tags=['endpoint:' + endpoint], count=1
+        )
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+from datadog_checks.checks.libs.scheduler import Job, JobCancelled, JobScheduler, JobTimeout, Lane, QueueFull
+
+
+@pytest.fixture
+def scheduler_factory():
+    schedulers = []
+
+    def factory(*args, **kwargs):
+        scheduler = JobScheduler(*args, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield factory
+    for scheduler in schedulers:
+        scheduler.stop(timeout=1)
+
+
+def blocked_job(event):
+    """
+    A slow job, running until `event` is set
+    """
+    event.wait(5)
+    return 'done'
+
+
+def failing_job():
+    raise ValueError('boom')
+
+
+def test_results(scheduler_factory):
+    scheduler = scheduler_factory(2)
+    ok = scheduler.submit(lambda x, y=0: x + y, args=(1,), kwargs={'y': 2})
+    ko = scheduler.submit(failing_job)
+
+    assert ok.get(1) == 3
+    with pytest.raises(ValueError):
+        ko.get(1)
+    assert (ok.state, ko.state) == (Job.DONE, Job.FAILED)
+
+    stats = scheduler.pop_stats()[JobScheduler.DEFAULT_LANE]
+    assert (stats[Job.DONE], stats[Job.FAILED]) == (1, 1)
+    assert stats['run_time.max'] >= 0
+    assert scheduler.pop_stats()[JobScheduler.DEFAULT_LANE][Job.DONE] == 0
+
+
+def test_priority_lanes(scheduler_factory):
+    scheduler = scheduler_factory(1, lanes=[Lane('discovery', priority=1), Lane('collection', priority=0)])
+    release = threading.Event()
+    order = []
+    scheduler.submit(blocked_job, args=(release,), lane='discovery')
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+
+    jobs = [scheduler.submit(order.append, args=('discovery',), lane='discovery')]
+    jobs.append(scheduler.submit(order.append, args=('collection',), lane='collection'))
+    release.set()
+    for job in jobs:
+        job.get(1)
+
+    assert order == ['collection', 'discovery']
+
+
+def test_max_running(scheduler_factory):
+    """ A lane limited to one worker doesn't starve the others """
+    scheduler = scheduler_factory(2, lanes=[Lane('discovery', max_running=1), Lane('collection')])
+    release = threading.Event()
+    slow = [scheduler.submit(blocked_job, args=(release,), lane='discovery') for _ in range(2)]
+
+    assert scheduler.submit(lambda: 'collected', lane='collection').get(1) == 'collected'
+    assert scheduler.queue_size('discovery') == 1
+
+    release.set()
+    assert [job.get(1) for job in slow] == ['done', 'done']
+
+
+def test_backpressure(scheduler_factory):
+    scheduler = scheduler_factory(1, lanes=[Lane('default', max_queue_size=1)])
+    release = threading.Event()
+    scheduler.submit(blocked_job, args=(release,))
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+    queued = scheduler.submit(blocked_job, args=(release,))
+
+    with pytest.raises(QueueFull):
+        scheduler.submit(blocked_job, args=(release,), block=False)
+    start = time.time()
+    with pytest.raises(QueueFull):
+        scheduler.submit(blocked_job, args=(release,), queue_timeout=0.05)
+    assert time.time() - start >= 0.05
+
+    release.set()
+    assert queued.get(1) == 'done'
+    assert scheduler.submit(lambda: 'room').get(1) == 'room'
+
+
+def test_reap(scheduler_factory):
+    scheduler = scheduler_factory(1)
+    release = threading.Event()
+    slow = scheduler.submit(blocked_job, args=(release,), timeout=0.01)
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+
+    assert scheduler.reap() == []
+    time.sleep(0.02)
+    assert scheduler.reap() == [slow]
+    with pytest.raises(JobTimeout):
+        slow.get(0)
+
+    # the stuck worker was replaced
+    assert scheduler.submit(lambda: 'next').get(1) == 'next'
+    release.set()
+    time.sleep(0.01)
+    assert slow.state == Job.TIMED_OUT
+    assert scheduler.pop_stats()['default'][Job.TIMED_OUT] == 1
+
+
+def test_reap_deadline(scheduler_factory):
+    """ The deadline of a job holds however long it was queued """
+    scheduler = scheduler_factory(1)
+    release = threading.Event()
+    deadline = time.time() + 0.05
+    first = scheduler.submit(blocked_job, args=(release,), timeout=0.03)
+    queued = scheduler.submit(blocked_job, args=(release,), timeout=10, deadline=deadline)
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+    assert queued.deadline == deadline
+
+    time.sleep(0.04)
+    assert scheduler.reap() == [first]
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+    # started after the first one was reaped, its timeout would end after the deadline
+    assert queued.started + queued.timeout > deadline
+    time.sleep(max(deadline - time.time(), 0) + 0.01)
+    assert scheduler.reap() == [queued]
+    with pytest.raises(JobTimeout):
+        queued.get(0)
+    release.set()
+
+
+def test_cancel(scheduler_factory):
+    scheduler = scheduler_factory(1)
+    release = threading.Event()
+    running = scheduler.submit(blocked_job, args=(release,))
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+    pending = scheduler.submit(blocked_job, args=(release,))
+
+    assert running.cancel() is False
+    assert pending.cancel() is True
+    assert scheduler.queue_size() == 0
+    with pytest.raises(JobCancelled):
+        pending.get(0)
+
+    release.set()
+    assert running.get(1) == 'done'
+
+
+def test_stop(scheduler_factory):
+    scheduler = scheduler_factory(1)
+    release = threading.Event()
+    running = scheduler.submit(blocked_job, args=(release,))
+    while scheduler.running() < 1:
+        time.sleep(0.001)
+    pending = scheduler.submit(blocked_job, args=(release,))
+
+    scheduler.stop(timeout=0)
+    assert pending.state == Job.CANCELLED
+
+    # the running job is left to finish
+    release.set()
+    assert running.get(1) == 'done'
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None)
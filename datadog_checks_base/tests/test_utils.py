@@ -2,6 +2,7 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 from datadog_checks.utils.common import pattern_filter
+from datadog_checks.utils.lru_cache import LRUCache
 
 
 class Item:
@@ -50,3 +51,40 @@ class TestPatternFilter:
         assert pattern_filter(items, whitelist=whitelist, key=lambda item: item.name) == [
             Item('abc'), Item('def'), Item('abcdef')
         ]
+
+
+class TestLRUCache:
+    def test_get_set(self):
+        cache = LRUCache(4)
+        cache.set('foo', 1)
+
+        assert cache.get('foo') == 1
+        assert cache.get('bar') is None
+        assert cache.get('bar', 2) == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_bounded(self):
+        cache = LRUCache(10)
+        for i in range(100):
+            cache.set(i, i)
+
+        assert len(cache) <= 10
+        assert 99 in cache
+        assert 0 not in cache
+
+    def test_recently_used_entries_are_kept(self):
+        cache = LRUCache(4)
+        cache.set('hot', 0)
+        for i in range(20):
+            cache.set(i, i)
+            assert cache.get('hot') == 0
+
+        assert len(cache) <= 4
+        assert 0 not in cache
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set('foo', 1)
+
+        assert cache.get('foo') is None
+        assert len(cache) == 0
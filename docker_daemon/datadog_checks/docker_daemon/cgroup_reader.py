@@ -0,0 +1,192 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import errno
+import os
+
+# Files are read in a single call most of the time, memory.stat is the largest at ~1kB
+READ_SIZE = 8192
+# Keep a file descriptor per cgroup file up to this amount, files past it are opened at every read
+DEFAULT_MAX_OPEN_FILES = 512
+
+
+def parse_blkio(content, keys):
+    """Sum the bytes read and written on all the devices."""
+    metrics = {
+        'io_read': 0,
+        'io_write': 0,
+    }
+    for line in content.splitlines():
+        if 'Read' in line:
+            metrics['io_read'] += int(line.split()[2])
+        if 'Write' in line:
+            metrics['io_write'] += int(line.split()[2])
+    return metrics
+
+
+def parse_cpuacct_usage(content, keys):
+    return {'usage': int(content) / 10000000}
+
+
+def parse_soft_limit(content, keys):
+    value = int(content)
+    # do not report kernel max default value (uint64 * 4096)
+    # see https://github.com/torvalds/linux/blob/5b36577109be007a6ecf4b65b54cbc9118463c2b/mm/memcontrol.c#L2844-L2845
+    # 2 ** 60 is kept for consistency of other cgroups metrics
+    if value < 2 ** 60:
+        return {'softlimit': value}
+
+
+def parse_cpu_shares(content, keys):
+    return {'shares': int(content)}
+
+
+def parse_flat_keyed(content, keys):
+    """Parse the `key value` lines of the needed `keys` only, e.g. for memory.stat."""
+    stats = {}
+    for line in content.splitlines():
+        key, _, value = line.partition(' ')
+        if key in keys:
+            stats[key] = int(value)
+            if len(stats) == len(keys):
+                break
+    return stats
+
+
+PARSERS = {
+    'blkio.throttle.io_service_bytes': parse_blkio,
+    'cpuacct.usage': parse_cpuacct_usage,
+    'memory.soft_limit_in_bytes': parse_soft_limit,
+    'cpu.shares': parse_cpu_shares,
+}
+
+
+class CgroupFile(object):
+    """
+    A cgroup pseudo file, kept open and read again from its start at each run
+    """
+    __slots__ = ('path', 'fd')
+
+    def __init__(self, path, keep_open):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY) if keep_open else None
+
+    def read(self):
+        if self.fd is None:
+            with open(self.path, 'r') as f:
+                return f.read()
+
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+
+class CgroupReader(object):
+    """
+    Read the stats of the cgroup files of the containers listed in a set of metrics like `CGROUP_METRICS`.
+
+    The path of the files of a container is found once for its process, and the files are kept open
+    until the container goes away, up to `max_open_files` in total. Each file is parsed by a function
+    picked once from its name, for the keys used by the metrics only.
+    """
+    def __init__(self, cgroup_metrics, find_cgroup_file, log, max_open_files=DEFAULT_MAX_OPEN_FILES):
+        """
+        :param find_cgroup_file: function(cgroup, pid, filename) returning the path of a cgroup file
+        """
+        self.find_cgroup_file = find_cgroup_file
+        self.log = log
+        self.max_open_files = max_open_files
+        self.open_files = 0
+
+        # file name -> (parser, keys)
+        self._parsers = {}
+        for cgroup in cgroup_metrics:
+            keys = set(cgroup['metrics'])
+            for key_list, _, _ in cgroup.get('to_compute', {}).itervalues():
+                keys.update(key_list)
+            self._parsers[cgroup['file']] = (PARSERS.get(cgroup['file'], parse_flat_keyed), frozenset(keys))
+
+        # container id -> (pid, {file name -> CgroupFile, None when the file doesn't exist})
+        self._containers = {}
+
+    def stats(self, container_id, pid, cgroup):
+        """
+        Return the stats of the file of the `cgroup` metrics for the container, None if it can't be read.
+        Raises the exceptions of `find_cgroup_file` when the file can't be found.
+        """
+        filename = cgroup['file']
+        known = self._containers.get(container_id)
+        if known is None or known[0] != pid:
+            # new container, or its process changed
+            self.evict(container_id)
+            known = self._containers[container_id] = (pid, {})
+        files = known[1]
+
+        if filename in files:
+            cgroup_file = files[filename]
+        else:
+            cgroup_file = files[filename] = self._open(cgroup['cgroup'], pid, filename)
+        if cgroup_file is None:
+            return None
+
+        try:
+            content = cgroup_file.read()
+        except (IOError, OSError) as e:
+            # It is possible that the container got stopped between the API call and now.
+            self.log.debug("Can't read %s, container likely raced to finish: %s", cgroup_file.path, e)
+            self.evict(container_id)
+            return None
+
+        parser, keys = self._parsers[filename]
+        return parser(content, keys)
+
+    def _open(self, cgroup, pid, filename):
+        path = self.find_cgroup_file(cgroup, pid, filename)
+        self.log.debug("Opening cgroup file: %s", path)
+        try:
+            cgroup_file = CgroupFile(path, self.open_files < self.max_open_files)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise IOError(e.errno, e.strerror, path)
+            # Some files can be missing (like cpu.stat) and that's fine.
+            self.log.debug("Can't open %s. Its metrics will be missing.", path)
+            return None
+        if cgroup_file.fd is not None:
+            self.open_files += 1
+        return cgroup_file
+
+    def evict(self, container_id):
+        """
+        Close the files of a container
+        """
+        known = self._containers.pop(container_id, None)
+        if known is None:
+            return
+        for cgroup_file in known[1].itervalues():
+            if cgroup_file is not None and cgroup_file.fd is not None:
+                cgroup_file.close()
+                self.open_files -= 1
+
+    def retain(self, container_ids):
+        """
+        Close the files of the containers not in `container_ids`
+        """
+        for container_id in [c_id for c_id in self._containers if c_id not in container_ids]:
+            self.evict(container_id)
+
+    def close(self):
+        for container_id in self._containers.keys():
+            self.evict(container_id)
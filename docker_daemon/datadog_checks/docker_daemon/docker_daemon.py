@@ -8,6 +8,7 @@ import re
 import socket
 import urllib2
 from collections import defaultdict, Counter, deque
+from contextlib import contextmanager
 from math import ceil
 
 # project
@@ -25,13 +26,16 @@ from utils.platform import Platform
 from utils.service_discovery.sd_backend import get_sd_backend
 from utils.orchestrator import MetadataCollector
 
+from .cgroup_reader import CgroupReader, DEFAULT_MAX_OPEN_FILES
+from .proc_crawler import ProcCrawler
+from .tag_cache import ContainerTagCache, DEFAULT_TAG_CACHE_TTL
+
 
 EVENT_TYPE = 'docker'
 SERVICE_CHECK_NAME = 'docker.service_up'
 HEALTHCHECK_SERVICE_CHECK_NAME = 'docker.container_health'
 EXIT_SERVICE_CHECK_NAME = 'docker.exit'
 SIZE_REFRESH_RATE = 5  # Collect container sizes every 5 iterations of the check
-CONTAINER_ID_RE = re.compile('[0-9a-f]{64}')
 
 DISK_STATS_RE = re.compile('([0-9.]+)\s?([a-zA-Z]+)')
 
@@ -166,10 +170,17 @@ PERFORMANCE = "performance"
 FILTERED = "filtered"
 HEALTHCHECK = "healthcheck"
 IMAGE = "image"
+# Tag types of the containers, whose tags are cached
+CONTAINER_TAG_TYPES = (CONTAINER, PERFORMANCE, FILTERED, HEALTHCHECK)
 
 ERROR_ALERT_TYPE = ['oom', 'kill']
 
 
+@contextmanager
+def _no_batch():
+    yield
+
+
 def compile_filter_rules(rules):
     patterns = []
     tag_names = []
@@ -197,7 +208,7 @@ class DockerDaemon(AgentCheck):
         if global_labels_as_tags:
             self.collect_labels_as_tags = [label.strip() for label in global_labels_as_tags.split(',')]
         else:
-            self.collect_labels_as_tags = DEFAULT_LABELS_AS_TAGS
+            self.collect_labels_as_tags = list(DEFAULT_LABELS_AS_TAGS)
         self.init()
 
     def init(self):
@@ -225,6 +236,20 @@ class DockerDaemon(AgentCheck):
             # We configure the check with the right cgroup settings for this host
             # Just needs to be done once
             self._mountpoints = self.docker_util.get_mountpoints(CGROUP_METRICS)
+            self._proc_crawler = ProcCrawler(
+                os.path.join(self.docker_util._docker_root, 'proc'),
+                self.log,
+                cpuacct_mountpoint=self._mountpoints.get('cpuacct'),
+                use_cgroup_procs=_is_affirmative(instance.get('crawl_cgroup_procs', False))
+            )
+            if getattr(self, '_cgroup_reader', None) is not None:
+                self._cgroup_reader.close()
+            self._cgroup_reader = CgroupReader(
+                CGROUP_METRICS,
+                self._get_cgroup_from_proc,
+                self.log,
+                max_open_files=int(instance.get('cgroup_max_open_files', DEFAULT_MAX_OPEN_FILES))
+            )
             self._latest_size_query = 0
             self._filtered_containers = set()
             self._disable_net_metrics = False
@@ -234,7 +259,25 @@ class DockerDaemon(AgentCheck):
             # It is replaced by docker_labels_as_tags in datadog.conf.
             # We keep this line for backward compatibility.
             if "collect_labels_as_tags" in instance:
-                self.collect_labels_as_tags = instance.get("collect_labels_as_tags")
+                self.collect_labels_as_tags = list(instance.get("collect_labels_as_tags"))
+
+            self._is_k8s = Platform.is_k8s()
+            self._is_rancher = Platform.is_rancher()
+            self._is_swarm = Platform.is_swarm()
+
+            # Collect pod names as tags on kubernetes
+            if self._is_k8s and KubeUtil.POD_NAME_LABEL not in self.collect_labels_as_tags:
+                self.collect_labels_as_tags.append(KubeUtil.POD_NAME_LABEL)
+                self.collect_labels_as_tags.append(KubeUtil.CONTAINER_NAME_LABEL)
+
+            # Collect container names as tags on rancher
+            if self._is_rancher:
+                for label in (RANCHER_CONTAINER_NAME, RANCHER_SVC_NAME, RANCHER_STACK_NAME):
+                    if label not in self.collect_labels_as_tags:
+                        self.collect_labels_as_tags.append(label)
+
+            # Container tags cache, invalidated by the container events
+            self._tag_cache = ContainerTagCache(int(instance.get('tag_cache_ttl', DEFAULT_TAG_CACHE_TTL)))
 
             self.kube_pod_tags = {}
 
@@ -332,7 +375,8 @@ class DockerDaemon(AgentCheck):
                 self._process_events(containers_by_id)
 
             # Report performance container metrics (cpu, mem, net, io)
-            self._report_performance_metrics(containers_by_id)
+            with self._batch_metrics():
+                self._report_performance_metrics(containers_by_id)
 
             if self.collect_container_size:
                 self._report_container_size(containers_by_id)
@@ -353,6 +397,11 @@ class DockerDaemon(AgentCheck):
             self.log.exception("Docker_daemon check failed")
             self.warning("Check failed. Will retry at next iteration")
 
+        self._tag_cache.purge()
+        hit_rate = self._tag_cache.pop_hit_rate()
+        if hit_rate is not None:
+            self.gauge('datadog.agent.docker.tag_cache.hit_rate', hit_rate, tags=self.custom_tags)
+
         if self.capped_metrics:
             self.filter_capped_metrics()
 
@@ -451,22 +500,28 @@ class DockerDaemon(AgentCheck):
 
     def _get_tags(self, entity=None, tag_type=None):
         """Generate the tags for a given entity (container or image) according to a list of tag names."""
+        if entity is None or tag_type not in CONTAINER_TAG_TYPES or 'Id' not in entity:
+            tags, pod_key = self._build_tags(entity, tag_type)
+        else:
+            cached = self._tag_cache.get(entity['Id'], tag_type)
+            if cached is None:
+                cached = self._build_tags(entity, tag_type)
+                self._tag_cache.set(entity['Id'], tag_type, cached)
+            tags, pod_key = cached
+
+        tags = list(tags)
+        # Add kube labels and creator/service tags, they're refreshed at every run
+        if pod_key is not None:
+            kube_tags = self.kube_pod_tags.get(pod_key)
+            if kube_tags:
+                tags.extend(kube_tags)
+        return tags
+
+    def _build_tags(self, entity, tag_type):
+        """Return the tuple of the tags of an entity, and the namespace/name key of its pod on kubernetes."""
         # Start with custom tags
         tags = list(self.custom_tags)
-
-        # Collect pod names as tags on kubernetes
-        if Platform.is_k8s() and KubeUtil.POD_NAME_LABEL not in self.collect_labels_as_tags:
-            self.collect_labels_as_tags.append(KubeUtil.POD_NAME_LABEL)
-            self.collect_labels_as_tags.append(KubeUtil.CONTAINER_NAME_LABEL)
-
-        # Collect container names as tags on rancher
-        if Platform.is_rancher():
-            if RANCHER_CONTAINER_NAME not in self.collect_labels_as_tags:
-                self.collect_labels_as_tags.append(RANCHER_CONTAINER_NAME)
-            if RANCHER_SVC_NAME not in self.collect_labels_as_tags:
-                self.collect_labels_as_tags.append(RANCHER_SVC_NAME)
-            if RANCHER_STACK_NAME not in self.collect_labels_as_tags:
-                self.collect_labels_as_tags.append(RANCHER_STACK_NAME)
+        pod_key = None
 
         if entity is not None:
             pod_name = None
@@ -477,7 +532,7 @@ class DockerDaemon(AgentCheck):
                 for k in self.collect_labels_as_tags:
                     if k in labels:
                         v = labels[k]
-                        if k == KubeUtil.POD_NAME_LABEL and Platform.is_k8s():
+                        if k == KubeUtil.POD_NAME_LABEL and self._is_k8s:
                             pod_name = v
                             k = "pod_name"
                             if "-" in pod_name:
@@ -492,19 +547,19 @@ class DockerDaemon(AgentCheck):
                                 tags.append("kube_replication_controller:%s" % replication_controller)
                                 tags.append("pod_name:%s" % pod_name)
 
-                        elif k == KubeUtil.CONTAINER_NAME_LABEL and Platform.is_k8s():
+                        elif k == KubeUtil.CONTAINER_NAME_LABEL and self._is_k8s:
                             if v:
                                 tags.append("kube_container_name:%s" % v)
-                        elif k == SWARM_SVC_LABEL and Platform.is_swarm():
+                        elif k == SWARM_SVC_LABEL and self._is_swarm:
                             if v:
                                 tags.append("swarm_service:%s" % v)
-                        elif k == RANCHER_CONTAINER_NAME and Platform.is_rancher():
+                        elif k == RANCHER_CONTAINER_NAME and self._is_rancher:
                             if v:
                                 tags.append('rancher_container:%s' % v)
-                        elif k == RANCHER_SVC_NAME and Platform.is_rancher():
+                        elif k == RANCHER_SVC_NAME and self._is_rancher:
                             if v:
                                 tags.append('rancher_service:%s' % v)
-                        elif k == RANCHER_STACK_NAME and Platform.is_rancher():
+                        elif k == RANCHER_STACK_NAME and self._is_rancher:
                             if v:
                                 tags.append('rancher_stack:%s' % v)
 
@@ -514,7 +569,7 @@ class DockerDaemon(AgentCheck):
                         else:
                             tags.append("%s:%s" % (k, v))
 
-                    if k == KubeUtil.POD_NAME_LABEL and Platform.is_k8s() and k not in labels:
+                    if k == KubeUtil.POD_NAME_LABEL and self._is_k8s and k not in labels:
                         tags.append("pod_name:no_pod")
 
             # Get entity specific tags
@@ -526,17 +581,14 @@ class DockerDaemon(AgentCheck):
                         for t in tag_value:
                             tags.append('%s:%s' % (tag_name, str(t).strip()))
 
-            # Add kube labels and creator/service tags
-            if Platform.is_k8s() and namespace and pod_name:
-                kube_tags = self.kube_pod_tags.get("{0}/{1}".format(namespace, pod_name))
-                if kube_tags:
-                    tags.extend(list(kube_tags))
+            if self._is_k8s and namespace and pod_name:
+                pod_key = "{0}/{1}".format(namespace, pod_name)
 
             if self.metadata_collector.has_detected():
                 orch_tags = self.metadata_collector.get_container_tags(co=entity)
                 tags.extend(orch_tags)
 
-        return tags
+        return tuple(tags), pod_key
 
     def _extract_tag_value(self, entity, tag_name):
         """Extra tag information from the API result (containers or images).
@@ -657,17 +709,25 @@ class DockerDaemon(AgentCheck):
 
     # Performance metrics
 
+    def _batch_metrics(self):
+        """Buffer the submitted metrics and flush them at once, when the base class supports it (Agent 6)."""
+        if hasattr(AgentCheck, 'batch_metrics'):
+            return self.batch_metrics()
+        return _no_batch()
+
     def _report_performance_metrics(self, containers_by_id):
 
         containers_without_proc_root = []
+        reported = set()
         for container_id, container in containers_by_id.iteritems():
             if self._is_container_excluded(container) or not self._is_container_running(container):
                 continue
+            reported.add(container_id)
 
             tags = self._get_tags(container, PERFORMANCE)
 
             try:
-                self._report_cgroup_metrics(container, tags)
+                self._report_cgroup_metrics(container_id, container, tags)
                 if "_proc_root" not in container:
                     containers_without_proc_root.append(DockerUtil.container_name_extractor(container)[0])
                     continue
@@ -675,6 +735,9 @@ class DockerDaemon(AgentCheck):
             except BogusPIDException as e:
                 self.log.warning('Unable to report cgroup metrics for container %s: %s', container_id[:12], e)
 
+        # close the cgroup files of the containers that went away
+        self._cgroup_reader.retain(reported)
+
         if containers_without_proc_root:
             message = "Couldn't find pid directory for containers: {0}. They'll be missing network metrics".format(
                 ", ".join(containers_without_proc_root))
@@ -684,14 +747,14 @@ class DockerDaemon(AgentCheck):
                 # On kubernetes, this is kind of expected. Network metrics will be collected by the kubernetes integration anyway
                 self.log.debug(message)
 
-    def _report_cgroup_metrics(self, container, tags):
+    def _report_cgroup_metrics(self, container_id, container, tags):
         cgroup_stat_file_failures = 0
         if not container.get('_pid'):
             raise BogusPIDException('Cannot report on bogus pid(0)')
 
         for cgroup in CGROUP_METRICS:
             try:
-                stat_file = self._get_cgroup_from_proc(cgroup["cgroup"], container['_pid'], cgroup['file'])
+                stats = self._read_cgroup_stats(container_id, container['_pid'], cgroup)
             except MountException as e:
                 # We can't find a stat file
                 self.warning(str(e))
@@ -701,7 +764,6 @@ class DockerDaemon(AgentCheck):
             except IOError as e:
                 self.log.debug("Cannot read cgroup file, container likely raced to finish : %s", e)
             else:
-                stats = self._parse_cgroup_file(stat_file)
                 if stats:
                     for key, (dd_key, metric_func) in cgroup['metrics'].iteritems():
                         metric_func = FUNC_MAP[metric_func][self.use_histogram]
@@ -801,6 +863,7 @@ class DockerDaemon(AgentCheck):
         events, changed_container_ids = self.docker_util.get_events()
         if not self._disable_net_metrics:
             self._invalidate_network_mapping_cache(events)
+        self._tag_cache.invalidate_from_events(events)
         if changed_container_ids and self._service_discovery:
             get_sd_backend(self.agentConfig).update_checks(changed_container_ids)
         if changed_container_ids:
@@ -1017,65 +1080,19 @@ class DockerDaemon(AgentCheck):
         }
         return DockerUtil.find_cgroup_from_proc(self._mountpoints, pid, cgroup, self.docker_util._docker_root) % (params)
 
-    def _parse_cgroup_file(self, stat_file):
-        """Parse a cgroup pseudo file for key/values."""
-        self.log.debug("Opening cgroup file: %s" % stat_file)
-        try:
-            with open(stat_file, 'r') as fp:
-                if 'blkio' in stat_file:
-                    return self._parse_blkio_metrics(fp.read().splitlines())
-                elif 'cpuacct.usage' in stat_file:
-                    return dict({'usage': str(int(fp.read())/10000000)})
-                elif 'memory.soft_limit_in_bytes' in stat_file:
-                    value = int(fp.read())
-                    # do not report kernel max default value (uint64 * 4096)
-                    # see https://github.com/torvalds/linux/blob/5b36577109be007a6ecf4b65b54cbc9118463c2b/mm/memcontrol.c#L2844-L2845
-                    # 2 ** 60 is kept for consistency of other cgroups metrics
-                    if value < 2 ** 60:
-                        return dict({'softlimit': value})
-                elif 'cpu.shares' in stat_file:
-                    value = int(fp.read())
-                    return {'shares': value}
-                else:
-                    return dict(map(lambda x: x.split(' ', 1), fp.read().splitlines()))
-        except IOError:
-            # It is possible that the container got stopped between the API call and now.
-            # Some files can also be missing (like cpu.stat) and that's fine.
-            self.log.debug("Can't open %s. Its metrics will be missing." % stat_file)
-
-    def _parse_blkio_metrics(self, stats):
-        """Parse the blkio metrics."""
-        metrics = {
-            'io_read': 0,
-            'io_write': 0,
-        }
-        for line in stats:
-            if 'Read' in line:
-                metrics['io_read'] += int(line.split()[2])
-            if 'Write' in line:
-                metrics['io_write'] += int(line.split()[2])
-        return metrics
-
-    def _is_container_cgroup(self, line, selinux_policy):
-        if line[1] not in ('cpu,cpuacct', 'cpuacct,cpu', 'cpuacct') or line[2] == '/docker-daemon':
-            return False
-        if 'docker' in line[2]:  # general case
-            return True
-        if 'docker' in selinux_policy:  # selinux
-            return True
-        if line[2].startswith('/') and re.match(CONTAINER_ID_RE, line[2][1:]):  # kubernetes
-            return True
-        if line[2].startswith('/') and re.match(CONTAINER_ID_RE, line[2].split('/')[-1]): # kube 1.6+ qos hierarchy
-            return True
-        return False
+    def _read_cgroup_stats(self, container_id, pid, cgroup):
+        """Read the stats of a cgroup file of a container, for the metrics of `cgroup`."""
+        return self._cgroup_reader.stats(container_id, pid, cgroup)
 
     # proc files
     def _crawl_container_pids(self, container_dict, custom_cgroups=False):
         """Crawl `/proc` to find container PIDs and add them to `containers_by_id`."""
-        proc_path = os.path.join(self.docker_util._docker_root, 'proc')
-        pid_dirs = [_dir for _dir in os.listdir(proc_path) if _dir.isdigit()]
+        proc_path = self._proc_crawler.proc_path
+        # the exited containers have no process, looking for them would always crawl /proc
+        running_ids = [c_id for c_id, container in container_dict.iteritems() if self._is_container_running(container)]
+        pids, anonymous_pids = self._proc_crawler.crawl(running_ids, anonymous=custom_cgroups)
 
-        if len(pid_dirs) == 0:
+        if self._proc_crawler.pid_count == 0:
             self.warning("Unable to find any pid directory in {0}. "
                          "If you are running the agent in a container, make sure to "
                          'share the volume properly: "/proc:/host/proc:ro". '
@@ -1086,51 +1103,21 @@ class DockerDaemon(AgentCheck):
 
         self._disable_net_metrics = False
 
-        for folder in pid_dirs:
-            try:
-                path = os.path.join(proc_path, folder, 'cgroup')
-                with open(path, 'r') as f:
-                    content = [line.strip().split(':') for line in f.readlines()]
-
-                selinux_policy = ''
-                path = os.path.join(proc_path, folder, 'attr', 'current')
-                if os.path.exists(path):
-                    with open(path, 'r') as f:
-                        selinux_policy = f.readlines()[0]
-            except IOError, e:
-                #  Issue #2074
-                self.log.debug("Cannot read %s, process likely raced to finish : %s", path, e)
-            except Exception as e:
-                self.warning("Cannot read %s : %s" % (path, str(e)))
+        for container_id, pid in pids.iteritems():
+            container = container_dict.get(container_id)
+            if container is None:
+                self.log.debug("Container %s not in container_dict, it's likely excluded", container_id)
                 continue
+            container['_pid'] = pid
+            container['_proc_root'] = os.path.join(proc_path, pid)
 
-            try:
-                for line in content:
-                    if self._is_container_cgroup(line, selinux_policy):
-                        cpuacct = line[2]
-                        break
-                else:
-                    continue
+        if custom_cgroups and anonymous_pids:
+            # if we match by pid that should be enough (?)
+            for container in container_dict.itervalues():
+                pid = str(container.get('_pid'))
+                if pid in anonymous_pids:
+                    container['_proc_root'] = os.path.join(proc_path, pid)
 
-                matches = re.findall(CONTAINER_ID_RE, cpuacct)
-                if matches:
-                    container_id = matches[-1]
-                    if container_id not in container_dict:
-                        self.log.debug(
-                            "Container %s not in container_dict, it's likely excluded", container_id
-                        )
-                        continue
-                    container_dict[container_id]['_pid'] = folder
-                    container_dict[container_id]['_proc_root'] = os.path.join(proc_path, folder)
-                elif custom_cgroups:  # if we match by pid that should be enough (?) - O(n) ugh!
-                    for _, container in container_dict.iteritems():
-                        if container.get('_pid') == int(folder):
-                            container['_proc_root'] = os.path.join(proc_path, folder)
-                            break
-
-            except Exception, e:
-                self.warning("Cannot parse %s content: %s" % (path, str(e)))
-                continue
         return container_dict
 
     def filter_capped_metrics(self):
@@ -0,0 +1,182 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import os
+import re
+
+CONTAINER_ID_RE = re.compile('[0-9a-f]{64}')
+# cpuacct hierarchy lines of /proc/<pid>/cgroup, e.g. `4:cpu,cpuacct:/docker/<container id>`
+CPUACCT_CGROUP_RE = re.compile('^[0-9]+:(?:cpu,cpuacct|cpuacct,cpu|cpuacct):(.*)$', re.M)
+
+
+class ProcEntry(object):
+    """
+    What the crawler learnt about a process: the container it runs in, if any
+    """
+    __slots__ = ('start_time', 'container_id', 'cgroup', 'in_container')
+
+    def __init__(self, start_time, container_id=None, cgroup=None, in_container=False):
+        self.start_time = start_time
+        # id of the container, None for processes not in a container or in a custom cgroup
+        self.container_id = container_id
+        # path of the cpuacct cgroup of the container, relative to the root of the hierarchy
+        self.cgroup = cgroup
+        # whether the process runs in a container cgroup, even one without a container id
+        self.in_container = in_container
+
+
+class ProcCrawler(object):
+    """
+    Find the PIDs of the containers in `/proc`.
+
+    The container of a process is cached by PID and process start time: a run only reads the
+    `cgroup` (and `attr/current`) files of the new processes, and the `stat` file of the others
+    to tell a reused PID. With `use_cgroup_procs`, the PID of a container already found is read
+    from the `cgroup.procs` file of its cpuacct cgroup, and `/proc` is only crawled when a
+    container can't be found that way.
+    """
+    def __init__(self, proc_path, log, cpuacct_mountpoint=None, use_cgroup_procs=False):
+        self.proc_path = proc_path
+        self.log = log
+        self.cpuacct_mountpoint = cpuacct_mountpoint
+        self.use_cgroup_procs = use_cgroup_procs and cpuacct_mountpoint is not None
+        # pid -> ProcEntry
+        self._entries = {}
+        # container id -> (pid, cgroup)
+        self._containers = {}
+        # number of pid directories of the latest crawl of /proc
+        self.pid_count = None
+
+    def crawl(self, container_ids=(), anonymous=False):
+        """
+        Return a dict mapping the id of the containers found to the pid of their first process, and
+        the set of the pids of the processes running in a container cgroup without a container id.
+
+        :param container_ids: ids of the containers to find
+        :param anonymous: whether the pids of the container cgroups without a container id are needed,
+                          they are only known after crawling `/proc`
+        """
+        if self.use_cgroup_procs and container_ids and not anonymous:
+            pids = self._pids_from_cgroup_procs(container_ids)
+            if pids is not None:
+                return pids, set()
+
+        pid_dirs = [_dir for _dir in os.listdir(self.proc_path) if _dir.isdigit()]
+        self.pid_count = len(pid_dirs)
+
+        entries = {}
+        pids = {}
+        anonymous_pids = set()
+        for pid in pid_dirs:
+            entry = self._get_entry(pid)
+            if entry is None:
+                continue
+            entries[pid] = entry
+            if entry.container_id is not None:
+                # the first process of the container, usually its init, as long as it lives
+                known = pids.get(entry.container_id)
+                if known is None or int(pid) < int(known):
+                    pids[entry.container_id] = pid
+                    self._containers[entry.container_id] = (pid, entry.cgroup)
+            elif entry.in_container:
+                anonymous_pids.add(pid)
+
+        # forget the processes that are gone
+        self._entries = entries
+        for container_id in [c_id for c_id in self._containers if c_id not in pids]:
+            del self._containers[container_id]
+
+        return pids, anonymous_pids
+
+    def _pids_from_cgroup_procs(self, container_ids):
+        """
+        Return the pids of `container_ids` read from their cgroup, None if a container isn't known yet
+        """
+        pids = {}
+        for container_id in container_ids:
+            known = self._containers.get(container_id)
+            if known is None:
+                return None
+            path = os.path.join(self.cpuacct_mountpoint, known[1].lstrip('/'), 'cgroup.procs')
+            try:
+                with open(path, 'r') as f:
+                    procs = f.read().split()
+            except IOError:
+                return None
+            if not procs:
+                return None
+            # keep the same process as long as it lives
+            pids[container_id] = known[0] if known[0] in procs else procs[0]
+        return pids
+
+    def _get_entry(self, pid):
+        """
+        Return the `ProcEntry` of `pid`, from the cache if the process didn't change
+        """
+        try:
+            start_time = self._start_time(pid)
+        except (IOError, OSError, ValueError) as e:
+            # Issue #2074
+            self.log.debug("Cannot read the stat of pid %s, process likely raced to finish: %s", pid, e)
+            return None
+
+        entry = self._entries.get(pid)
+        if entry is not None and entry.start_time == start_time:
+            return entry
+
+        try:
+            return self._read_entry(pid, start_time)
+        except IOError as e:
+            self.log.debug("Cannot read the cgroup of pid %s, process likely raced to finish: %s", pid, e)
+        except Exception as e:
+            self.log.warning("Cannot parse the cgroup of pid %s: %s", pid, e)
+        return None
+
+    def _start_time(self, pid):
+        with open(os.path.join(self.proc_path, pid, 'stat'), 'r') as f:
+            stat = f.read()
+        # the command name can hold spaces and parenthesis, the fields after it are the state, ppid, ...
+        # and the start time is the 20th of them (22nd field of the file)
+        return stat[stat.rindex(')') + 2:].split(' ', 20)[19]
+
+    def _read_entry(self, pid, start_time):
+        with open(os.path.join(self.proc_path, pid, 'cgroup'), 'r') as f:
+            content = f.read()
+
+        selinux_policy = None
+        for match in CPUACCT_CGROUP_RE.finditer(content):
+            cgroup = match.group(1)
+            if cgroup == '/docker-daemon':
+                continue
+            if not self._is_container_cgroup(cgroup):
+                # the selinux policy is only needed for the cgroups that don't look like a container's
+                if selinux_policy is None:
+                    selinux_policy = self._selinux_policy(pid)
+                if 'docker' not in selinux_policy:
+                    continue
+
+            matches = CONTAINER_ID_RE.findall(cgroup)
+            if matches:
+                return ProcEntry(start_time, matches[-1], cgroup, True)
+            return ProcEntry(start_time, in_container=True)
+
+        return ProcEntry(start_time)
+
+    @staticmethod
+    def _is_container_cgroup(cgroup):
+        if 'docker' in cgroup:  # general case
+            return True
+        if cgroup.startswith('/'):
+            if CONTAINER_ID_RE.match(cgroup, 1):  # kubernetes
+                return True
+            if CONTAINER_ID_RE.match(cgroup.rsplit('/', 1)[-1]):  # kube 1.6+ qos hierarchy
+                return True
+        return False
+
+    def _selinux_policy(self, pid):
+        path = os.path.join(self.proc_path, pid, 'attr', 'current')
+        try:
+            with open(path, 'r') as f:
+                return f.readline()
+        except IOError:
+            return ''
@@ -0,0 +1,70 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import time
+
+# Container tags are built again after this many seconds, even if no event reported a change
+DEFAULT_TAG_CACHE_TTL = 300
+# Statuses of the container events that change its tags, or remove it
+INVALIDATING_STATUSES = frozenset(['die', 'start', 'rename', 'destroy'])
+
+
+class ContainerTagCache(object):
+    """
+    Tags of the containers by container id and tag type, built once and reused until an event
+    reports a change of the container, or for `ttl` seconds.
+    """
+    def __init__(self, ttl=DEFAULT_TAG_CACHE_TTL):
+        self.ttl = ttl
+        # container id -> {tag type -> (expiry time, cached value)}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, container_id, tag_type):
+        """
+        Return the value cached for the tag type of the container, None if it must be built
+        """
+        entry = self._entries.get(container_id, {}).get(tag_type)
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, container_id, tag_type, value):
+        self._entries.setdefault(container_id, {})[tag_type] = (time.time() + self.ttl, value)
+
+    def invalidate(self, container_id):
+        self._entries.pop(container_id, None)
+
+    def invalidate_from_events(self, api_events):
+        """
+        Forget the tags of the containers whose events may have changed them
+        """
+        for event in api_events:
+            if event.get('status') in INVALIDATING_STATUSES and 'id' in event:
+                self.invalidate(event['id'])
+
+    def purge(self):
+        """
+        Drop the expired entries, left by the containers gone without an event
+        """
+        now = time.time()
+        for container_id, entries in self._entries.items():
+            for tag_type in [t_type for t_type, entry in entries.iteritems() if entry[0] <= now]:
+                del entries[tag_type]
+            if not entries:
+                del self._entries[container_id]
+
+    def pop_hit_rate(self):
+        """
+        Return the ratio of lookups served by the cache since the previous call, None without lookups
+        """
+        lookups = self.hits + self.misses
+        hit_rate = float(self.hits) / lookups if lookups else None
+        self.hits = self.misses = 0
+        return hit_rate
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.itervalues())
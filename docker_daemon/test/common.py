@@ -0,0 +1,86 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import os
+
+CPUACCT_CGROUP = '4:cpu,cpuacct:{}\n'
+HOST_CGROUPS = '11:memory:/user.slice\n4:cpu,cpuacct:/user.slice\n1:name=systemd:/user.slice/session-1.scope\n'
+
+
+def container_id(index):
+    return '{:064x}'.format(index + 1)
+
+
+def add_process(proc_path, pid, cgroup=None, start_time=100, selinux_policy=None, comm='sleep'):
+    """
+    Add a process to a synthetic `/proc` tree, in the cpuacct `cgroup` or in the host cgroups
+    """
+    pid_dir = os.path.join(proc_path, str(pid))
+    if not os.path.isdir(pid_dir):
+        os.makedirs(os.path.join(pid_dir, 'attr'))
+    with open(os.path.join(pid_dir, 'stat'), 'w') as f:
+        f.write('{} ({}) S 1 {} {} 0 -1 4194560 123 0 0 0 1 2 0 0 20 0 1 0 {} 4542464 185 '
+                '18446744073709551615 1 1 0 0 0 0 0 0 0 0 0 0 17 3 0 0 0 0 0\n'.format(pid, comm, pid, pid, start_time))
+    with open(os.path.join(pid_dir, 'cgroup'), 'w') as f:
+        if cgroup is None:
+            f.write(HOST_CGROUPS)
+        else:
+            f.write('11:memory:{0}\n{1}1:name=systemd:{0}\n'.format(cgroup, CPUACCT_CGROUP.format(cgroup)))
+    if selinux_policy is not None:
+        with open(os.path.join(pid_dir, 'attr', 'current'), 'w') as f:
+            f.write(selinux_policy)
+
+
+def make_proc_tree(proc_path, containers, processes_per_container=1, host_processes=0):
+    """
+    Create a synthetic `/proc` tree with `containers` docker containers and return their ids
+    """
+    pid = 1
+    ids = []
+    for index in range(containers):
+        c_id = container_id(index)
+        ids.append(c_id)
+        for _ in range(processes_per_container):
+            add_process(proc_path, pid, '/docker/{}'.format(c_id))
+            pid += 1
+    for _ in range(host_processes):
+        add_process(proc_path, pid)
+        pid += 1
+    return ids
+
+
+CGROUP_FILES = {
+    'memory.stat': 'cache 4096\nrss 1024\nrss_huge 0\nmapped_file 0\nswap 0\npgpgin 1234\npgpgout 123\n'
+                   'hierarchical_memory_limit 9223372036854771712\nhierarchical_memsw_limit 9223372036854771712\n'
+                   'total_cache 4096\ntotal_rss 1024\ntotal_swap 0\n',
+    'memory.soft_limit_in_bytes': '9223372036854771712\n',
+    'cpuacct.stat': 'user 1234\nsystem 567\n',
+    'cpuacct.usage': '123456789000\n',
+    'cpu.stat': 'nr_periods 0\nnr_throttled 0\nthrottled_time 0\n',
+    'cpu.shares': '1024\n',
+    'blkio.throttle.io_service_bytes': '8:0 Read 100\n8:0 Write 20\n8:0 Sync 120\n8:0 Async 0\n8:0 Total 120\n'
+                                       'Total 120\n',
+}
+
+
+def make_cgroup_tree(root, containers):
+    """
+    Create the cgroup files of `containers` containers, whose pids are their indexes, and
+    return a set of metrics reading all of them with a function finding their files
+    """
+    for pid in range(containers):
+        path = os.path.join(root, str(pid))
+        os.makedirs(path)
+        for filename, content in CGROUP_FILES.iteritems():
+            with open(os.path.join(path, filename), 'w') as f:
+                f.write(content)
+
+    metrics = {'rss': None, 'user': None, 'nr_throttled': None}
+    cgroup_metrics = [
+        {'cgroup': filename.split('.')[0], 'file': filename, 'metrics': metrics} for filename in CGROUP_FILES
+    ]
+
+    def find_cgroup_file(cgroup, pid, filename):
+        return os.path.join(root, str(pid), filename)
+
+    return cgroup_metrics, find_cgroup_file
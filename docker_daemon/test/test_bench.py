@@ -0,0 +1,106 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import copy
+import logging
+import os
+
+import mock
+import pytest
+
+from datadog_checks.docker_daemon.cgroup_reader import CgroupReader
+from datadog_checks.docker_daemon.docker_daemon import (DockerDaemon,
+                                                        CONTAINER,
+                                                        PERFORMANCE,
+                                                        DEFAULT_CONTAINER_TAGS,
+                                                        DEFAULT_PERFORMANCE_TAGS)
+from datadog_checks.docker_daemon.proc_crawler import ProcCrawler
+from datadog_checks.docker_daemon.tag_cache import ContainerTagCache
+
+from .common import make_cgroup_tree, make_proc_tree
+
+log = logging.getLogger('tests')
+
+CONTAINERS = 300
+
+
+@pytest.fixture(scope='module', params=[2000, 10000], ids=['2k', '10k'])
+def proc_tree(request, tmpdir_factory):
+    """
+    Synthetic /proc with 300 containers of 2 processes, the rest being host processes
+    """
+    root = str(tmpdir_factory.mktemp('proc_tree'))
+    proc_path = os.path.join(root, 'proc')
+    host_processes = request.param - 2 * CONTAINERS
+    ids = make_proc_tree(proc_path, CONTAINERS, processes_per_container=2, host_processes=host_processes)
+
+    cgroup_root = os.path.join(root, 'cgroup', 'cpuacct')
+    for index, c_id in enumerate(ids):
+        os.makedirs(os.path.join(cgroup_root, 'docker', c_id))
+        with open(os.path.join(cgroup_root, 'docker', c_id, 'cgroup.procs'), 'w') as f:
+            f.write('{}\n{}\n'.format(2 * index + 1, 2 * index + 2))
+    return proc_path, cgroup_root, ids
+
+
+def test_crawl_cold(benchmark, proc_tree):
+    proc_path, _, ids = proc_tree
+    benchmark(lambda: ProcCrawler(proc_path, log).crawl(ids))
+
+
+def test_crawl_cached(benchmark, proc_tree):
+    proc_path, _, ids = proc_tree
+    crawler = ProcCrawler(proc_path, log)
+    crawler.crawl(ids)
+    benchmark(crawler.crawl, ids)
+
+
+def test_crawl_cgroup_procs(benchmark, proc_tree):
+    proc_path, cgroup_root, ids = proc_tree
+    crawler = ProcCrawler(proc_path, log, cpuacct_mountpoint=cgroup_root, use_cgroup_procs=True)
+    crawler.crawl(ids)
+    benchmark(crawler.crawl, ids)
+
+
+@pytest.mark.parametrize('max_open_files', [0, 4096], ids=['reopened', 'kept_open'])
+def test_read_cgroups(benchmark, tmpdir, max_open_files):
+    cgroup_metrics, find_cgroup_file = make_cgroup_tree(str(tmpdir), CONTAINERS)
+    reader = CgroupReader(cgroup_metrics, find_cgroup_file, log, max_open_files=max_open_files)
+
+    def read():
+        for pid in range(CONTAINERS):
+            for cgroup in cgroup_metrics:
+                reader.stats(pid, pid, cgroup)
+
+    read()
+    benchmark(read)
+    reader.close()
+
+
+@pytest.mark.parametrize('ttl', [0, 300], ids=['uncached', 'cached'])
+def test_get_tags(benchmark, ttl):
+    with mock.patch.object(DockerDaemon, 'init'):
+        check = DockerDaemon('docker_daemon', {}, {}, instances=[{}])
+    check.custom_tags = ['env:bench']
+    check.collect_labels_as_tags = ['com.docker.compose.service']
+    check.tag_names = {CONTAINER: DEFAULT_CONTAINER_TAGS, PERFORMANCE: DEFAULT_PERFORMANCE_TAGS}
+    check._is_k8s = check._is_rancher = check._is_swarm = False
+    check.kube_pod_tags = {}
+    check.metadata_collector = mock.MagicMock(has_detected=lambda: False)
+    check._tag_cache = ContainerTagCache(ttl)
+
+    containers = [{
+        'Id': '{:064x}'.format(index),
+        'Names': ['/app-{}'.format(index)],
+        'Image': 'registry.local/app:1.{}'.format(index % 10),
+        'Command': 'run --port 80',
+        'Labels': {'com.docker.compose.service': 'app-{}'.format(index % 50)},
+    } for index in range(500)]
+
+    def get_tags(containers):
+        # the containers are listed again at every run, like the tag values extracted from them
+        for container in containers:
+            check._get_tags(container, CONTAINER)
+            check._get_tags(container, PERFORMANCE)
+
+    get_tags(copy.deepcopy(containers))
+    benchmark.pedantic(get_tags, setup=lambda: ((copy.deepcopy(containers),), {}), rounds=20)
@@ -0,0 +1,134 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+
+# stdlib
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+# project
+from datadog_checks.docker_daemon.cgroup_reader import CgroupReader
+
+log = logging.getLogger('tests')
+
+CGROUP_METRICS = [
+    {
+        "cgroup": "memory",
+        "file": "memory.stat",
+        "metrics": {
+            "rss": ("docker.mem.rss", None),
+        },
+        "to_compute": {
+            "docker.mem.in_use": (["rss", "hierarchical_memory_limit"], None, None),
+        }
+    },
+    {
+        "cgroup": "cpuacct",
+        "file": "cpuacct.usage",
+        "metrics": {
+            "usage": ("docker.cpu.usage", None),
+        }
+    },
+    {
+        "cgroup": "cpu",
+        "file": "cpu.stat",
+        "metrics": {
+            "nr_throttled": ("docker.cpu.throttled", None)
+        },
+    },
+    {
+        "cgroup": "blkio",
+        "file": 'blkio.throttle.io_service_bytes',
+        "metrics": {
+            "io_read": ("docker.io.read_bytes", None),
+            "io_write": ("docker.io.write_bytes", None),
+        },
+    },
+]
+
+MEMORY_STAT = 'cache 4096\nrss 1024\nswap 0\nhierarchical_memory_limit 9223372036854771712\ntotal_rss 1024\n'
+BLKIO = '8:0 Read 100\n8:0 Write 20\n8:0 Sync 120\n8:16 Read 5\n8:16 Write 1\nTotal 126\n'
+
+
+class TestCgroupReader(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.found = []
+        for container_id in ('foo', 'bar'):
+            path = os.path.join(self.root, container_id)
+            os.makedirs(path)
+            self.write(container_id, 'memory.stat', MEMORY_STAT)
+            self.write(container_id, 'cpuacct.usage', '123456789000\n')
+            self.write(container_id, 'blkio.throttle.io_service_bytes', BLKIO)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, container_id, filename, content):
+        with open(os.path.join(self.root, container_id, filename), 'w') as f:
+            f.write(content)
+
+    def find_cgroup_file(self, cgroup, pid, filename):
+        self.found.append((cgroup, pid, filename))
+        return os.path.join(self.root, 'foo' if pid == 1 else 'bar', filename)
+
+    def test_stats(self):
+        reader = CgroupReader(CGROUP_METRICS, self.find_cgroup_file, log)
+        memory, usage, cpu, blkio = [reader.stats('foo', 1, cgroup) for cgroup in CGROUP_METRICS]
+
+        # only the needed keys are parsed
+        self.assertEqual(memory, {'rss': 1024, 'hierarchical_memory_limit': 9223372036854771712})
+        self.assertEqual(usage, {'usage': 12345})
+        self.assertIsNone(cpu)
+        self.assertEqual(blkio, {'io_read': 105, 'io_write': 21})
+        # the missing cpu.stat is not open
+        self.assertEqual(reader.open_files, 3)
+
+    def test_files_kept_open(self):
+        reader = CgroupReader(CGROUP_METRICS, self.find_cgroup_file, log)
+        for _ in range(2):
+            for cgroup in CGROUP_METRICS:
+                reader.stats('foo', 1, cgroup)
+        self.assertEqual(len(self.found), 4)
+
+        # the open file is read again from its start
+        self.write('foo', 'cpuacct.usage', '223456789000\n')
+        self.assertEqual(reader.stats('foo', 1, CGROUP_METRICS[1]), {'usage': 22345})
+
+        # a new process of the container, its files are found again
+        reader.stats('foo', 2, CGROUP_METRICS[1])
+        self.assertEqual(self.found[-1], ('cpuacct', 2, 'cpuacct.usage'))
+        self.assertEqual(reader.open_files, 1)
+
+    def test_max_open_files(self):
+        reader = CgroupReader(CGROUP_METRICS, self.find_cgroup_file, log, max_open_files=2)
+        for container_id, pid in (('foo', 1), ('bar', 2)):
+            for cgroup in CGROUP_METRICS:
+                reader.stats(container_id, pid, cgroup)
+        self.assertEqual(reader.open_files, 2)
+
+        self.write('bar', 'cpuacct.usage', '223456789000\n')
+        self.assertEqual(reader.stats('bar', 2, CGROUP_METRICS[1]), {'usage': 22345})
+
+    def test_retain(self):
+        reader = CgroupReader(CGROUP_METRICS, self.find_cgroup_file, log)
+        for container_id, pid in (('foo', 1), ('bar', 2)):
+            for cgroup in CGROUP_METRICS:
+                reader.stats(container_id, pid, cgroup)
+        self.assertEqual(reader.open_files, 6)
+
+        reader.retain({'bar'})
+        self.assertEqual(reader.open_files, 3)
+        reader.close()
+        self.assertEqual(reader.open_files, 0)
+
+    def test_container_gone(self):
+        reader = CgroupReader(CGROUP_METRICS, self.find_cgroup_file, log, max_open_files=0)
+        reader.stats('foo', 1, CGROUP_METRICS[0])
+        shutil.rmtree(os.path.join(self.root, 'foo'))
+
+        self.assertIsNone(reader.stats('foo', 1, CGROUP_METRICS[0]))
+        self.assertNotIn('foo', reader._containers)
@@ -879,22 +879,13 @@ class TestCheckDockerDaemon(AgentCheckTest):
                 expected_tags += tags
             self.assertMetric(mname, tags=expected_tags, count=1, at_least=1)
 
-    def mock_parse_cgroup_file(self, stat_file):
-        with open(stat_file, 'r') as fp:
-            if 'blkio' in stat_file:
-                return {}
-            elif 'cpuacct.usage' in stat_file:
-                return dict({'usage': str(int(fp.read())/10000000)})
-            # mocked part
-            elif 'cpu' in stat_file:
-                return {'user': 1000 * self.run, 'system': 1000 * self.run}
-                self.run += 1
-            elif 'memory.soft_limit_in_bytes' in stat_file:
-                    value = int(fp.read())
-                    if value < 2 ** 60:
-                        return dict({'softlimit': value})
-            else:
-                return dict(map(lambda x: x.split(' ', 1), fp.read().splitlines()))
+    def mock_read_cgroup_stats(self, container_id, pid, cgroup):
+        if cgroup['file'] == 'blkio.throttle.io_service_bytes':
+            return {}
+        # mocked part
+        elif cgroup['file'] == 'cpuacct.stat':
+            return {'user': 1000 * self.run, 'system': 1000 * self.run}
+        return self.check._cgroup_reader.stats(container_id, pid, cgroup)
 
     def test_filter_capped_metrics(self):
         config = {
@@ -908,7 +899,7 @@ class TestCheckDockerDaemon(AgentCheckTest):
             }]
         }
         self.run = 1
-        self.run_check_twice(config, mocks={'_parse_cgroup_file': self.mock_parse_cgroup_file})
+        self.run_check_twice(config, mocks={'_read_cgroup_stats': self.mock_read_cgroup_stats})
         # last 2 points should be dropped so the rate should be 0
         self.assertMetric('docker.cpu.user', value=0.0)
         self.assertMetric('docker.cpu.system', value=0.0)
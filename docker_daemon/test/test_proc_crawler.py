@@ -0,0 +1,130 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+
+# stdlib
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+# project
+from datadog_checks.docker_daemon.docker_daemon import DockerDaemon
+from datadog_checks.docker_daemon.proc_crawler import ProcCrawler
+
+from .common import add_process, container_id, make_proc_tree
+
+log = logging.getLogger('tests')
+
+
+class TestProcCrawler(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.proc_path = os.path.join(self.root, 'proc')
+        os.makedirs(self.proc_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_crawl(self):
+        ids = make_proc_tree(self.proc_path, 3, processes_per_container=2, host_processes=5)
+        crawler = ProcCrawler(self.proc_path, log)
+
+        pids, anonymous_pids = crawler.crawl()
+        self.assertEqual(pids, {ids[0]: '1', ids[1]: '3', ids[2]: '5'})
+        self.assertEqual(anonymous_pids, set())
+        self.assertEqual(crawler.pid_count, 11)
+
+    def test_cgroup_layouts(self):
+        kube_id, qos_id, scope_id, selinux_id = [container_id(i) for i in range(4)]
+        add_process(self.proc_path, 1, '/docker-daemon')
+        add_process(self.proc_path, 2, '/{}'.format(kube_id))
+        add_process(self.proc_path, 3, '/kubepods/burstable/pod1234/{}'.format(qos_id))
+        add_process(self.proc_path, 4, '/system.slice/docker-{}.scope'.format(scope_id))
+        add_process(self.proc_path, 5, '/custom/{}/app'.format(selinux_id), selinux_policy='system_u:docker_t:s0')
+        add_process(self.proc_path, 6, '/custom/{}/app'.format(container_id(5)))
+        add_process(self.proc_path, 7, '/custom', selinux_policy='system_u:svirt_lxc_net_t:docker')
+        add_process(self.proc_path, 8, comm='odd (name) ')
+
+        pids, anonymous_pids = ProcCrawler(self.proc_path, log).crawl()
+        self.assertEqual(pids, {kube_id: '2', qos_id: '3', scope_id: '4', selinux_id: '5'})
+        self.assertEqual(anonymous_pids, {'7'})
+
+    def test_cache(self):
+        ids = make_proc_tree(self.proc_path, 2, host_processes=2)
+        crawler = ProcCrawler(self.proc_path, log)
+        crawler.crawl()
+
+        # only the new and restarted processes are read again
+        add_process(self.proc_path, 1, '/docker/{}'.format(container_id(9)), start_time=200)
+        add_process(self.proc_path, 5, '/docker/{}'.format(ids[0]))
+        with mock.patch.object(crawler, '_read_entry', wraps=crawler._read_entry) as read_entry:
+            pids, _ = crawler.crawl()
+        self.assertEqual(sorted(call[0][0] for call in read_entry.call_args_list), ['1', '5'])
+        self.assertEqual(pids, {container_id(9): '1', ids[0]: '5', ids[1]: '2'})
+
+        # vanished processes are forgotten
+        shutil.rmtree(os.path.join(self.proc_path, '2'))
+        pids, _ = crawler.crawl()
+        self.assertNotIn(ids[1], pids)
+        self.assertNotIn('2', crawler._entries)
+
+    def test_cgroup_procs(self):
+        cgroup_root = os.path.join(self.root, 'cgroup', 'cpuacct')
+        ids = make_proc_tree(self.proc_path, 2, processes_per_container=2)
+        for index, c_id in enumerate(ids):
+            os.makedirs(os.path.join(cgroup_root, 'docker', c_id))
+            with open(os.path.join(cgroup_root, 'docker', c_id, 'cgroup.procs'), 'w') as f:
+                f.write('{}\n{}\n'.format(2 * index + 1, 2 * index + 2))
+
+        crawler = ProcCrawler(self.proc_path, log, cpuacct_mountpoint=cgroup_root, use_cgroup_procs=True)
+        self.assertEqual(crawler.crawl(ids)[0], {ids[0]: '1', ids[1]: '3'})
+
+        with mock.patch('os.listdir') as listdir:
+            pids, _ = crawler.crawl(ids)
+        self.assertFalse(listdir.called)
+        self.assertEqual(pids, {ids[0]: '1', ids[1]: '3'})
+
+        # the cached process exited, another one of the container is picked
+        with open(os.path.join(cgroup_root, 'docker', ids[0], 'cgroup.procs'), 'w') as f:
+            f.write('2\n')
+        self.assertEqual(crawler.crawl(ids)[0], {ids[0]: '2', ids[1]: '3'})
+
+        # unknown containers and custom cgroups need a crawl
+        new_id = container_id(9)
+        add_process(self.proc_path, 9, '/docker/{}'.format(new_id))
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            pids, _ = crawler.crawl(ids + [new_id])
+            crawler.crawl(ids, anonymous=True)
+        self.assertEqual(listdir.call_count, 2)
+        self.assertEqual(pids[new_id], '9')
+
+    def test_crawl_container_pids_running_only(self):
+        cgroup_root = os.path.join(self.root, 'cgroup', 'cpuacct')
+        ids = make_proc_tree(self.proc_path, 2)
+        for index, c_id in enumerate(ids):
+            os.makedirs(os.path.join(cgroup_root, 'docker', c_id))
+            with open(os.path.join(cgroup_root, 'docker', c_id, 'cgroup.procs'), 'w') as f:
+                f.write('{}\n'.format(index + 1))
+
+        with mock.patch.object(DockerDaemon, 'init'):
+            check = DockerDaemon('docker_daemon', {}, {}, instances=[{}])
+        check._proc_crawler = ProcCrawler(self.proc_path, log, cpuacct_mountpoint=cgroup_root, use_cgroup_procs=True)
+        exited_id = container_id(9)
+
+        def containers():
+            by_id = {c_id: {'Id': c_id, 'Status': 'Up 2 hours'} for c_id in ids}
+            by_id[exited_id] = {'Id': exited_id, 'Status': 'Exited (0) 3 hours ago'}
+            return by_id
+
+        check._crawl_container_pids(containers())
+        # the exited container isn't looked for, the pids of the running ones are read from their cgroup
+        with mock.patch('os.listdir') as listdir:
+            containers_by_id = check._crawl_container_pids(containers())
+        self.assertFalse(listdir.called)
+        self.assertEqual(containers_by_id[ids[0]]['_pid'], '1')
+        self.assertEqual(containers_by_id[ids[1]]['_pid'], '2')
+        self.assertNotIn('_pid', containers_by_id[exited_id])
@@ -0,0 +1,56 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+
+# stdlib
+import unittest
+
+import mock
+
+# project
+from datadog_checks.docker_daemon.tag_cache import ContainerTagCache
+
+
+class TestContainerTagCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = ContainerTagCache()
+        self.assertIsNone(cache.get('foo', 'performance'))
+        cache.set('foo', 'performance', ('a:b',))
+        cache.set('foo', 'container', ('c:d',))
+
+        self.assertEqual(cache.get('foo', 'performance'), ('a:b',))
+        self.assertEqual(cache.get('foo', 'container'), ('c:d',))
+        self.assertIsNone(cache.get('bar', 'container'))
+        self.assertEqual(len(cache), 2)
+
+        self.assertEqual(cache.pop_hit_rate(), 0.5)
+        self.assertIsNone(cache.pop_hit_rate())
+
+    def test_ttl(self):
+        cache = ContainerTagCache(ttl=10)
+        with mock.patch('time.time', return_value=100):
+            cache.set('foo', 'performance', ('a:b',))
+            cache.set('bar', 'performance', ('c:d',))
+        with mock.patch('time.time', return_value=105):
+            cache.set('bar', 'container', ('e:f',))
+            self.assertEqual(cache.get('foo', 'performance'), ('a:b',))
+        with mock.patch('time.time', return_value=110):
+            self.assertIsNone(cache.get('foo', 'performance'))
+            cache.purge()
+        self.assertEqual(len(cache), 1)
+        self.assertNotIn('foo', cache._entries)
+
+    def test_events(self):
+        cache = ContainerTagCache()
+        for container_id in ('foo', 'bar', 'baz'):
+            cache.set(container_id, 'performance', ('a:b',))
+
+        cache.invalidate_from_events([
+            {'status': 'rename', 'id': 'foo', 'Type': 'container'},
+            {'status': 'exec_start: ls', 'id': 'bar', 'Type': 'container'},
+            {'Type': 'network', 'Action': 'connect'},
+            {'status': 'die', 'id': 'baz', 'Type': 'container'},
+        ])
+        self.assertIsNone(cache.get('foo', 'performance'))
+        self.assertEqual(cache.get('bar', 'performance'), ('a:b',))
+        self.assertIsNone(cache.get('baz', 'performance'))
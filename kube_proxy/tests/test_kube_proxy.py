@@ -25,13 +25,18 @@ def aggregator():
     aggregator.reset()
     return aggregator
 
+def assert_connection_stats(aggregator, endpoint):
+    tags = ['endpoint:' + endpoint]
+    for stat in ('new', 'reused'):
+        aggregator.assert_metric(NAMESPACE + '.prometheus.connections.' + stat, tags=tags)
+
 @pytest.fixture()
 def mock_iptables():
     f_name = os.path.join(os.path.dirname(__file__), 'fixtures', 'metrics_iptables.txt')
     with open(f_name, 'r') as f:
         text_data = f.read()
     mock_iptables = mock.patch(
-        'requests.get',
+        'requests.Session.get',
         return_value=mock.MagicMock(
             status_code=200,
             iter_lines=lambda **kwargs: text_data.split("\n"),
@@ -47,7 +52,7 @@ def mock_userspace():
     with open(f_name, 'r') as f:
         text_data = f.read()
     mock_userspace = mock.patch(
-        'requests.get',
+        'requests.Session.get',
         return_value=mock.MagicMock(
             status_code=200,
             iter_lines=lambda **kwargs: text_data.split("\n"),
@@ -72,6 +77,7 @@ def test_check_iptables(aggregator, mock_iptables):
     aggregator.assert_metric(NAMESPACE + '.client.http.requests', tags=['method:GET', 'code:404', 'host:127.0.0.1:8080'])
     aggregator.assert_metric(NAMESPACE + '.sync_rules.latency.count')
     aggregator.assert_metric(NAMESPACE + '.sync_rules.latency.sum')
+    assert_connection_stats(aggregator, instance['prometheus_url'])
 
     assert aggregator.metrics_asserted_pct == 100.0
 
@@ -89,5 +95,6 @@ def test_check_userspace(aggregator, mock_userspace):
     aggregator.assert_metric(NAMESPACE + '.client.http.requests', tags=['method:POST', 'host:127.0.0.1:8080', 'code:201'])
     aggregator.assert_metric(NAMESPACE + '.client.http.requests', tags=['method:GET', 'host:127.0.0.1:8080', 'code:200'])
     aggregator.assert_metric(NAMESPACE + '.client.http.requests', tags=['method:POST', 'host:127.0.0.1:8080', 'code:201'])
+    assert_connection_stats(aggregator, instance['prometheus_url'])
 
     assert aggregator.metrics_asserted_pct == 100.0
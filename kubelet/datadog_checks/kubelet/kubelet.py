@@ -9,9 +9,11 @@ from urlparse import urljoin
 
 # 3p
 import requests
+from requests.adapters import HTTPAdapter
 
 # project
 from datadog_checks.checks import AgentCheck
+from datadog_checks.checks.libs.scheduler import JobScheduler
 from datadog_checks.errors import CheckException
 from datadog_checks.checks.prometheus import PrometheusScraper
 from kubeutil import get_connection_info
@@ -19,6 +21,7 @@ from tagger import get_tags
 
 # check
 from .common import CADVISOR_DEFAULT_PORT, ContainerFilter
+from .podlist import decode_pod_list
 from .cadvisor import CadvisorScraper
 from .prometheus import CadvisorPrometheusScraper
 
@@ -28,6 +31,11 @@ POD_LIST_PATH = '/pods/'
 CADVISOR_METRICS_PATH = '/metrics/cadvisor'
 KUBELET_METRICS_PATH = '/metrics'
 
+# One worker per kubelet endpoint fetched at each run: pod list, node spec, healthz and the two metrics endpoints
+FETCH_WORKERS = 5
+# The pod list is decoded a pod at a time, as these chunks come
+POD_LIST_CHUNK_SIZE = 64 * 1024
+
 # Suffixes per
 # https://github.com/kubernetes/kubernetes/blob/8fd414537b5143ab039cb910590237cabf4af783/pkg/api/resource/suffix.go#L108
 FACTORS = {
@@ -79,6 +87,17 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
             'kubelet_runtime_operations_errors': 'kubelet.runtime.errors',
         }
 
+        # The kubelet endpoints are fetched concurrently, over a single session kept across runs
+        # so that its connections, and their TLS handshakes, are reused
+        self._http_session = None
+        self._fetch_scheduler = None
+        for scraper in (self.cadvisor_scraper, self.kubelet_scraper):
+            scraper.get_http_session = self.get_http_session
+        # url -> size in bytes of the payload of the latest query
+        self._payload_sizes = {}
+        # ETag, resourceVersion and pod list of the latest pod list retrieved
+        self._pod_list_cache = (None, None, None)
+
     def check(self, instance):
         self.kubelet_conn_info = get_connection_info()
         endpoint = self.kubelet_conn_info.get('url')
@@ -113,8 +132,11 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
         else:
             send_buckets = True
 
+        self.instance_tags = instance.get('tags', [])
+        fetches = self._fetch_endpoints()
+
         try:
-            self.pod_list = self.retrieve_pod_list()
+            self.pod_list = fetches['pod_list'].get()
             if self.pod_list.get("items") is None:
                 # Sanitize input: if no pod are running, 'items' is a NoneObject
                 self.pod_list['items'] = []
@@ -123,9 +145,8 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
 
         self.container_filter = ContainerFilter(self.pod_list)
 
-        self.instance_tags = instance.get('tags', [])
-        self._perform_kubelet_check(self.instance_tags)
-        self._report_node_metrics(self.instance_tags)
+        self._perform_kubelet_check(self.instance_tags, fetches['healthz'].get)
+        self._report_node_metrics(self.instance_tags, fetches['node_spec'].get())
         self._report_pods_running(self.pod_list, self.instance_tags)
         self._report_container_spec_metrics(self.pod_list, self.instance_tags)
 
@@ -139,8 +160,8 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
             )
         elif self.cadvisor_metrics_url:  # Prometheus
             self.log.debug('processing cadvisor metrics')
-            self.cadvisor_scraper.process(
-                self.cadvisor_metrics_url,
+            self.cadvisor_scraper.process_metric_families(
+                self._scrape_result(fetches['cadvisor'], self.cadvisor_metrics_url),
                 send_histograms_buckets=send_buckets,
                 instance=instance,
                 pod_list=self.pod_list,
@@ -149,20 +170,91 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
 
         if self.kubelet_metrics_url:  # Prometheus
             self.log.debug('processing kubelet metrics')
-            self.kubelet_scraper.process(
-                self.kubelet_metrics_url,
+            self.kubelet_scraper.process_metric_families(
+                self._scrape_result(fetches['kubelet'], self.kubelet_metrics_url),
                 send_histograms_buckets=send_buckets,
                 instance=instance,
                 ignore_unmapped=True
             )
 
+        self._report_fetch_metrics(fetches, self.instance_tags)
+
         # Free up memory
         self.pod_list = None
         self.container_filter = None
 
-    def perform_kubelet_query(self, url, verbose=True, timeout=10):
+    def _fetch_endpoints(self):
+        """
+        Start fetching the kubelet endpoints needed by the run in parallel, return the `Job`s of the fetches
+        by endpoint name. The payloads are downloaded and decoded by the workers, the processing of their
+        results is left to the caller.
+        """
+        if self._fetch_scheduler is None:
+            self._fetch_scheduler = JobScheduler(FETCH_WORKERS, name='kubelet-fetch')
+        self._payload_sizes = {}
+
+        submit = self._fetch_scheduler.submit
+        fetches = {
+            'pod_list': submit(self.retrieve_pod_list),
+            'node_spec': submit(self._retrieve_node_spec),
+            'healthz': submit(self.perform_kubelet_query, args=(self.kube_health_url,)),
+        }
+        if self.cadvisor_metrics_url and not self.cadvisor_legacy_url:
+            fetches['cadvisor'] = submit(
+                self.cadvisor_scraper.fetch_metric_families,
+                args=(self.cadvisor_metrics_url, self.cadvisor_scraper.get_family_filter())
+            )
+        if self.kubelet_metrics_url:
+            fetches['kubelet'] = submit(
+                self.kubelet_scraper.fetch_metric_families,
+                args=(self.kubelet_metrics_url, self.kubelet_scraper.get_family_filter(True))
+            )
+        return fetches
+
+    def _scrape_result(self, job, url):
+        """
+        Wait for the prometheus endpoint fetched by `job`, return its metric families
+        """
+        result = job.get()
+        self._payload_sizes[url] = result.size
+        return result.metric_families
+
+    def _report_fetch_metrics(self, fetches, instance_tags):
+        """
+        Report how long the fetch of each endpoint took, and the size of its payload
+        """
+        urls = {
+            'pod_list': self.pod_list_url,
+            'node_spec': self.node_spec_url,
+            'healthz': self.kube_health_url,
+            'cadvisor': self.cadvisor_metrics_url,
+            'kubelet': self.kubelet_metrics_url,
+        }
+        for name, job in fetches.iteritems():
+            tags = instance_tags + ['endpoint:{}'.format(name)]
+            if job.started is not None and job.finished is not None:
+                self.gauge('datadog.agent.kubelet.fetch.duration', job.finished - job.started, tags=tags)
+            size = self._payload_sizes.get(urls[name])
+            if size is not None:
+                self.gauge('datadog.agent.kubelet.fetch.size', size, tags=tags)
+
+    def get_http_session(self, endpoint=None, cert=None, verify=True):
+        """
+        Return the requests.Session shared by the queries to the kubelet and the scrapers. The TLS
+        settings are passed along each request, so they don't change the session.
+        """
+        if self._http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=FETCH_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._http_session = session
+        return self._http_session
+
+    def perform_kubelet_query(self, url, verbose=True, timeout=10, stream=False, extra_headers=None):
         """
         Perform and return a GET request against kubelet. Support auth and TLS validation.
+        The response of a `stream` query is left unread.
         """
         headers = None
         cert = (self.kubelet_conn_info.get('client_crt'), self.kubelet_conn_info.get('client_key'))
@@ -184,11 +276,44 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
             headers = {'Authorization': 'Bearer {}'.format(self.kubelet_conn_info['token'])}
             self.extra_headers = headers  # prometheus check setting
 
-        return requests.get(url, timeout=timeout, verify=verify,
-                            cert=cert, headers=headers, params={'verbose': verbose})
+        if extra_headers:
+            headers = dict(headers or {}, **extra_headers)
+
+        response = self.get_http_session().get(url, timeout=timeout, verify=verify, cert=cert, headers=headers,
+                                               params={'verbose': verbose}, stream=stream)
+        if not stream:
+            self._payload_sizes[url] = len(response.content)
+        return response
 
     def retrieve_pod_list(self):
-        return self.perform_kubelet_query(self.pod_list_url).json()
+        """
+        Retrieve the pod list from kubelet, with the `POD_FIELDS` of the pods only.
+        The pod list of the previous call is returned as is when the kubelet reports it unchanged, through
+        its ETag or its resourceVersion.
+        """
+        etag, resource_version, previous = self._pod_list_cache
+        extra_headers = None
+        if previous is not None and etag:
+            extra_headers = {'If-None-Match': etag}
+
+        response = self.perform_kubelet_query(self.pod_list_url, stream=True, extra_headers=extra_headers)
+        try:
+            if response.status_code == 304 and previous is not None:
+                self._payload_sizes[self.pod_list_url] = 0
+                return previous
+            pod_list, size = decode_pod_list(
+                response.iter_content(chunk_size=POD_LIST_CHUNK_SIZE),
+                resource_version=resource_version if previous is not None else None
+            )
+        finally:
+            response.close()
+        self._payload_sizes[self.pod_list_url] = size
+        if pod_list is None:
+            return previous
+
+        resource_version = (pod_list.get('metadata') or {}).get('resourceVersion')
+        self._pod_list_cache = (response.headers.get('ETag'), resource_version, pod_list)
+        return pod_list
 
     def _retrieve_node_spec(self):
         """
@@ -199,8 +324,9 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
         # if we can get it locally or thru the DCA instead of the /nodes endpoint directly
         return node_spec
 
-    def _report_node_metrics(self, instance_tags):
-        node_spec = self._retrieve_node_spec()
+    def _report_node_metrics(self, instance_tags, node_spec=None):
+        if node_spec is None:
+            node_spec = self._retrieve_node_spec()
         num_cores = node_spec.get('num_cores', 0)
         memory_capacity = node_spec.get('memory_capacity', 0)
 
@@ -208,14 +334,17 @@ class KubeletCheck(AgentCheck, CadvisorScraper):
         self.gauge(self.NAMESPACE + '.cpu.capacity', float(num_cores), tags)
         self.gauge(self.NAMESPACE + '.memory.capacity', float(memory_capacity), tags)
 
-    def _perform_kubelet_check(self, instance_tags):
-        """Runs local service checks"""
+    def _perform_kubelet_check(self, instance_tags, get_response=None):
+        """
+        Runs local service checks
+        `get_response` returns the response of the health endpoint once fetched, it is queried here by default.
+        """
         service_check_base = self.NAMESPACE + '.kubelet.check'
         is_ok = True
         url = self.kube_health_url
 
         try:
-            req = self.perform_kubelet_query(url)
+            req = get_response() if get_response is not None else self.perform_kubelet_query(url)
             for line in req.iter_lines():
                 # avoid noise; this check is expected to fail since we override the container hostname
                 if line.find('hostname') != -1:
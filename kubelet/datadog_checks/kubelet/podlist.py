@@ -0,0 +1,185 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import codecs
+import json
+
+# Fields of the pods kept from the pod list, everything the check and its scrapers read:
+# a dict of the fields kept under a key, or None to keep its whole value. Lists are projected item by item.
+POD_FIELDS = {
+    'metadata': {
+        'uid': None,
+        'name': None,
+        'namespace': None,
+        'annotations': {
+            'kubernetes.io/config.source': None,
+        },
+    },
+    'spec': {
+        'hostNetwork': None,
+        'containers': {
+            'name': None,
+            'resources': None,
+        },
+    },
+    'status': {
+        'phase': None,
+        'containerStatuses': {
+            'name': None,
+            'containerID': None,
+            'image': None,
+        },
+    },
+}
+
+WHITESPACE = u' \t\n\r'
+# The decoded buffer is trimmed of the values already decoded past this size
+COMPACT_SIZE = 64 * 1024
+
+
+def project(value, fields):
+    """
+    Return a copy of `value` with only the `fields`, see `POD_FIELDS`
+    """
+    if fields is None:
+        return value
+    if isinstance(value, dict):
+        return {key: project(value[key], sub_fields) for key, sub_fields in fields.iteritems() if key in value}
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    return value
+
+
+class JSONStream(object):
+    """
+    Decode the JSON values of a payload one at a time, as its chunks come. Only the
+    part of the payload that wasn't decoded yet is kept in memory.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = u''
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+
+    def _read(self):
+        """
+        Append the next chunk to the buffer, return False at the end of the payload
+        """
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self.bytes_read += len(chunk)
+                self._buffer += self._decoder.decode(chunk)
+                return True
+        self._buffer += self._decoder.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def _compact(self):
+        if self._pos > COMPACT_SIZE and self._pos * 2 > len(self._buffer):
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+    def peek(self):
+        """
+        Return the next character that isn't whitespace, without consuming it, '' at the end of the payload
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ''
+
+    def next_char(self):
+        """
+        Consume and return the next character that isn't whitespace
+        """
+        char = self.peek()
+        if not char:
+            raise ValueError("Unexpected end of the JSON payload")
+        self._pos += 1
+        return char
+
+    def expect(self, expected):
+        char = self.next_char()
+        if char != expected:
+            raise ValueError("Expected {!r} in the JSON payload, got {!r}".format(expected, char))
+
+    def value(self):
+        """
+        Decode the next JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # a number at the end of the buffer may go on in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    break
+            except ValueError:
+                if self._eof:
+                    raise
+            # wait for the value to be twice as long before trying again, so that
+            # a large value isn't decoded over and over as its chunks come
+            wanted = 2 * (len(self._buffer) - self._pos)
+            while len(self._buffer) - self._pos < wanted and self._read():
+                pass
+        self._pos = end
+        self._compact()
+        return value
+
+
+def decode_pod_list(chunks, fields=POD_FIELDS, resource_version=None):
+    """
+    Decode the pod list of the kubelet from the chunks of its JSON payload, keeping only
+    the `fields` of the pods. The pods are decoded one at a time, the whole payload is never
+    held in memory.
+
+    :param chunks: iterable of the chunks of the payload, as bytes
+    :param resource_version: resourceVersion of the pod list already known
+    :return: the pod list dict and the number of bytes read, the pod list is None when its
+             resourceVersion is `resource_version`, the rest of the payload is then left unread.
+    """
+    stream = JSONStream(chunks)
+    pod_list = {}
+
+    stream.expect('{')
+    if stream.peek() == '}':
+        stream.next_char()
+        return pod_list, stream.bytes_read
+
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == 'items' and stream.peek() == '[':
+            stream.next_char()
+            pod_list['items'] = pods = []
+            if stream.peek() == ']':
+                stream.next_char()
+            else:
+                while True:
+                    pods.append(project(stream.value(), fields))
+                    char = stream.next_char()
+                    if char == ']':
+                        break
+                    if char != ',':
+                        raise ValueError("Expected ',' or ']' between the pods, got {!r}".format(char))
+        else:
+            pod_list[key] = stream.value()
+            if key == 'metadata' and resource_version and \
+                    (pod_list[key] or {}).get('resourceVersion') == resource_version:
+                return None, stream.bytes_read
+
+        char = stream.next_char()
+        if char == '}':
+            break
+        if char != ',':
+            raise ValueError("Expected ',' or '}}' in the pod list, got {!r}".format(char))
+
+    return pod_list, stream.bytes_read
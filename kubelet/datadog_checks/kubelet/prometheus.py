@@ -7,7 +7,7 @@ from datadog_checks.checks.prometheus import PrometheusScraper
 from tagger import get_tags
 
 # check
-from .common import is_static_pending_pod, get_pod_by_uid
+from .common import is_static_pending_pod
 
 METRIC_TYPES = ['counter', 'gauge', 'summary']
 # container-specific metrics should have all these labels
@@ -56,45 +56,93 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         self.fs_usage_bytes = {}
         self.mem_usage_bytes = {}
 
+        # pod list the index was built from, and pod uid -> pod
+        self._pod_index = (None, {})
+        # entity -> tags returned by the tagger during the run
+        self._tags_memo = {}
+
     @staticmethod
-    def _is_container_metric(metric):
+    def _get_labels(labels):
         """
-        Return whether a metric is about a container or not.
+        Return the dict of the labels of a series, read in one pass
+        :param labels: metric labels: iterable
+        :return: dict
+        """
+        return {label.name: label.value for label in labels}
+
+    @staticmethod
+    def _is_container_series(labels):
+        """
+        Return whether a series is about a container or not.
         It can be about pods, or even higher levels in the cgroup hierarchy
         and we don't want to report on that.
-        :param metric:
+        :param labels: dict
         :return: bool
         """
         for lbl in CONTAINER_LABELS:
-            if lbl == 'container_name':
-                for ml in metric.label:
-                    if ml.name == lbl:
-                        if ml.value == '' or ml.value == 'POD':
-                            return False
-            if lbl not in [ml.name for ml in metric.label]:
+            if lbl not in labels:
                 return False
-        return True
+        return labels['container_name'] not in ('', 'POD')
 
     @staticmethod
-    def _is_pod_metric(metric):
+    def _is_pod_series(labels):
         """
-        Return whether a metric is about a pod or not.
+        Return whether a series is about a pod or not.
         It can be about containers, pods, or higher levels in the cgroup hierarchy
         and we don't want to report on that.
+        :param labels: dict
+        :return bool
+        """
+        if labels.get('container_name') == 'POD':
+            return True
+        # container_cpu_usage_seconds_total has an id label that is a cgroup path
+        # eg: /kubepods/burstable/pod531c80d9-9fc4-11e7-ba8b-42010af002bb
+        # FIXME: this was needed because of a bug:
+        # https://github.com/kubernetes/kubernetes/pull/51473
+        # starting from k8s 1.8 we can remove this
+        return 'id' in labels and labels['id'].split('/')[-1].startswith('pod')
+
+    @staticmethod
+    def _series_container_id(labels):
+        """
+        Return the last part of the cgroup hierarchy of a series
+        :param labels: dict
+        :return str or None
+        """
+        container_id = labels.get('id')
+        if container_id:
+            return container_id.split('/')[-1]
+
+    @staticmethod
+    def _series_pod_uid(labels):
+        """
+        Return the id of the pod of a series
+        :param labels: dict
+        :return: str or None
+        """
+        pod_id = labels.get('id')
+        if pod_id:
+            for part in pod_id.split('/'):
+                if part.startswith('pod'):
+                    return part[3:]
+
+    @staticmethod
+    def _is_container_metric(metric):
+        """
+        Return whether a metric is about a container or not.
+        :param metric:
+        :return: bool
+        """
+        return CadvisorPrometheusScraper._is_container_series(CadvisorPrometheusScraper._get_labels(metric.label))
+
+    @staticmethod
+    def _is_pod_metric(metric):
+        """
+        Return whether a metric is about a pod or not.
         :param metric
         :return bool
         """
-        for ml in metric.label:
-            if ml.name == 'container_name' and ml.value == 'POD':
-                return True
-            # container_cpu_usage_seconds_total has an id label that is a cgroup path
-            # eg: /kubepods/burstable/pod531c80d9-9fc4-11e7-ba8b-42010af002bb
-            # FIXME: this was needed because of a bug:
-            # https://github.com/kubernetes/kubernetes/pull/51473
-            # starting from k8s 1.8 we can remove this
-            elif ml.name == 'id' and ml.value.split('/')[-1].startswith('pod'):
-                return True
-        return False
+        return CadvisorPrometheusScraper._is_pod_series(CadvisorPrometheusScraper._get_labels(metric.label))
 
     @staticmethod
     def _get_container_label(labels, l_name):
@@ -117,9 +165,7 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         :param labels
         :return str or None
         """
-        container_id = CadvisorPrometheusScraper._get_container_label(labels, "id")
-        if container_id:
-            return container_id.split('/')[-1]
+        return CadvisorPrometheusScraper._series_container_id(CadvisorPrometheusScraper._get_labels(labels))
 
     @staticmethod
     def _get_pod_uid(labels):
@@ -128,11 +174,28 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         :param labels:
         :return: str or None
         """
-        pod_id = CadvisorPrometheusScraper._get_container_label(labels, "id")
-        if pod_id:
-            for part in pod_id.split('/'):
-                if part.startswith('pod'):
-                    return part[3:]
+        return CadvisorPrometheusScraper._series_pod_uid(CadvisorPrometheusScraper._get_labels(labels))
+
+    def _get_pod_by_uid(self, pod_uid):
+        """
+        Return the pod of the pod list with this uid, from an index built once per pod list
+        :param pod_uid: str
+        :return: pod dict object if found, None if not found
+        """
+        if self._pod_index[0] is not self.pod_list:
+            self._index_pods()
+        return self._pod_index[1].get(pod_uid)
+
+    def _index_pods(self):
+        """
+        Index the pods of the pod list by uid
+        """
+        index = {}
+        for pod in (self.pod_list or {}).get('items') or []:
+            uid = pod.get('metadata', {}).get('uid')
+            if uid is not None:
+                index[uid] = pod
+        self._pod_index = (self.pod_list, index)
 
     def _is_pod_host_networked(self, pod_uid):
         """
@@ -141,18 +204,17 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         :param pod_uid: str
         :return: bool
         """
-        for pod in self.pod_list['items']:
-            if pod.get('metadata', {}).get('uid', '') == pod_uid:
-                return pod.get('spec', {}).get('hostNetwork', False)
-        return False
+        pod = self._get_pod_by_uid(pod_uid)
+        if pod is None:
+            return False
+        return pod.get('spec', {}).get('hostNetwork', False)
 
     def _get_pod_by_metric_label(self, labels):
         """
         :param labels: metric labels: iterable
         :return:
         """
-        pod_uid = self._get_pod_uid(labels)
-        return get_pod_by_uid(pod_uid, self.pod_list)
+        return self._get_pod_by_uid(self._get_pod_uid(labels))
 
     @staticmethod
     def _get_kube_container_name(labels):
@@ -165,20 +227,60 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         :param labels: metric labels: iterable
         :return: list
         """
-        container_name = CadvisorPrometheusScraper._get_container_label(labels, "container_name")
+        return CadvisorPrometheusScraper._series_kube_container_name(CadvisorPrometheusScraper._get_labels(labels))
+
+    @staticmethod
+    def _series_kube_container_name(labels):
+        container_name = labels.get('container_name')
         if container_name:
             return ["kube_container_name:%s" % container_name]
         return []
 
-    def process(self, endpoint, **kwargs):
+    def _get_tags(self, entity):
+        """
+        Return a copy of the high cardinality tags of the entity, the tagger is queried once per run
+        :param entity: str
+        :return: list
+        """
+        tags = self._tags_memo.get(entity)
+        if tags is None:
+            tags = self._tags_memo[entity] = get_tags(entity, True)
+        return list(tags)
+
+    def _get_container_tags(self, c_id, pod_uid, labels):
+        """
+        Return the tags of a container series
+        :param labels: dict
+        :return: list
+        """
+        tags = self._get_tags('docker://%s' % c_id) + self.instance_tags
+
+        # FIXME we are forced to do that because the Kubelet PodList isn't updated
+        # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
+        pod = self._get_pod_by_uid(pod_uid)
+        if pod is not None and is_static_pending_pod(pod):
+            tags += self._get_tags('kubernetes_pod://%s' % pod["metadata"]["uid"])
+            tags += self._series_kube_container_name(labels)
+            tags = list(set(tags))
+        return tags
+
+    def _process_metric_families(self, metric_families, **kwargs):
+        # called by both `process` and `process_metric_families`
         self.pod_list = kwargs.get('pod_list')
         self.container_filter = kwargs.get('container_filter')
+        self._index_pods()
+        self._tags_memo = {}
 
         instance = kwargs.get('instance')
         if instance:
             self.instance_tags = instance.get('tags', [])
 
-        super(CadvisorPrometheusScraper, self).process(endpoint, **kwargs)
+        try:
+            super(CadvisorPrometheusScraper, self)._process_metric_families(metric_families, **kwargs)
+        finally:
+            # Free up memory
+            self._pod_index = (None, {})
+            self._tags_memo = {}
 
     def _process_container_rate(self, metric_name, message):
         """Takes a simple metric about a container, reports it as a rate."""
@@ -187,23 +289,14 @@ class CadvisorPrometheusScraper(PrometheusScraper):
             return
 
         for metric in message.metric:
-            if self._is_container_metric(metric):
-                c_id = self._get_container_id(metric.label)
-                pod_uid = self._get_pod_uid(metric.label)
+            labels = self._get_labels(metric.label)
+            if self._is_container_series(labels):
+                c_id = self._series_container_id(labels)
+                pod_uid = self._series_pod_uid(labels)
                 if self.container_filter.is_excluded(c_id, pod_uid):
                     continue
 
-                tags = get_tags('docker://%s' % c_id, True)
-                tags += self.instance_tags
-
-                # FIXME we are forced to do that because the Kubelet PodList isn't updated
-                # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-                pod = self._get_pod_by_metric_label(metric.label)
-                if pod is not None and is_static_pending_pod(pod):
-                    tags += get_tags('kubernetes_pod://%s' % pod["metadata"]["uid"], True)
-                    tags += self._get_kube_container_name(metric.label)
-                    tags = list(set(tags))
-
+                tags = self._get_container_tags(c_id, pod_uid, labels)
                 val = getattr(metric, METRIC_TYPES[message.type]).value
 
                 self.check.rate(metric_name, val, tags)
@@ -215,12 +308,12 @@ class CadvisorPrometheusScraper(PrometheusScraper):
             return
 
         for metric in message.metric:
-            if self._is_pod_metric(metric):
-                pod_uid = self._get_pod_uid(metric.label)
+            labels = self._get_labels(metric.label)
+            if self._is_pod_series(labels):
+                pod_uid = self._series_pod_uid(labels)
                 if '.network.' in metric_name and self._is_pod_host_networked(pod_uid):
                     continue
-                tags = get_tags('kubernetes_pod://%s' % pod_uid, True)
-                tags += self.instance_tags
+                tags = self._get_tags('kubernetes_pod://%s' % pod_uid) + self.instance_tags
                 val = getattr(metric, METRIC_TYPES[message.type]).value
                 self.check.rate(metric_name, val, tags)
 
@@ -233,25 +326,17 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         # track containers that still exist in the cache
         seen_keys = {k: False for k in cache}
         for metric in message.metric:
-            if self._is_container_metric(metric):
-                c_id = self._get_container_id(metric.label)
-                c_name = self._get_container_label(metric.label, 'name')
+            labels = self._get_labels(metric.label)
+            if self._is_container_series(labels):
+                c_id = self._series_container_id(labels)
+                c_name = labels.get('name')
                 if not c_name:
                     continue
-                pod_uid = self._get_pod_uid(metric.label)
+                pod_uid = self._series_pod_uid(labels)
                 if self.container_filter.is_excluded(c_id, pod_uid):
                     continue
 
-                tags = get_tags('docker://%s' % c_id, True)
-                tags += self.instance_tags
-
-                # FIXME we are forced to do that because the Kubelet PodList isn't updated
-                # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-                pod = self._get_pod_by_metric_label(metric.label)
-                if pod is not None and is_static_pending_pod(pod):
-                    tags += get_tags('kubernetes_pod://%s' % pod["metadata"]["uid"], True)
-                    tags += self._get_kube_container_name(metric.label)
-                    tags = list(set(tags))
+                tags = self._get_container_tags(c_id, pod_uid, labels)
 
                 val = getattr(metric, METRIC_TYPES[message.type]).value
                 cache[c_name] = (val, tags)
@@ -270,21 +355,21 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         for each metric in the message and reports the usage_pct
         """
         for metric in message.metric:
-            if self._is_container_metric(metric):
+            labels = self._get_labels(metric.label)
+            if self._is_container_series(labels):
                 limit = getattr(metric, METRIC_TYPES[message.type]).value
-                c_id = self._get_container_id(metric.label)
-                pod_uid = self._get_pod_uid(metric.label)
+                c_id = self._series_container_id(labels)
+                pod_uid = self._series_pod_uid(labels)
                 if self.container_filter.is_excluded(c_id, pod_uid):
                     continue
 
-                tags = get_tags('docker://%s' % c_id, True)
-                tags += self.instance_tags
+                tags = self._get_tags('docker://%s' % c_id) + self.instance_tags
 
                 if m_name:
                     self.check.gauge(m_name, limit, tags)
 
                 if pct_m_name and limit > 0:
-                    c_name = self._get_container_label(metric.label, 'name')
+                    c_name = labels.get('name')
                     if not c_name:
                         continue
                     usage, tags = cache.get(c_name, (None, None))
@@ -299,7 +384,7 @@ class CadvisorPrometheusScraper(PrometheusScraper):
         cpu_usage_sum = {}
 
         for metric in message.metric:
-            c_id = self._get_container_id(metric.label)
+            c_id = self._series_container_id(self._get_labels(metric.label))
             if not c_id:
                 continue
             # Convert cores in nano cores
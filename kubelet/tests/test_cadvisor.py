@@ -8,6 +8,7 @@ import pytest
 import requests_mock
 from requests.exceptions import HTTPError
 
+from datadog_checks.checks.prometheus.mixins import ScrapeResult
 from datadog_checks.kubelet import KubeletCheck
 
 from .test_kubelet import mock_from_file, EXPECTED_METRICS_COMMON, NODE_SPEC
@@ -59,8 +60,10 @@ def test_kubelet_check_cadvisor(monkeypatch, aggregator):
     monkeypatch.setattr(check, '_perform_kubelet_check', mock.Mock(return_value=None))
     monkeypatch.setattr(check, '_retrieve_cadvisor_metrics',
                         mock.Mock(return_value=json.loads(mock_from_file('cadvisor_1.2.json'))))
-    monkeypatch.setattr(check.cadvisor_scraper, 'process', mock.Mock(return_value=None))
-    monkeypatch.setattr(check.kubelet_scraper, 'process', mock.Mock(return_value=None))
+    monkeypatch.setattr(check.kubelet_scraper, 'fetch_metric_families',
+                        mock.Mock(return_value=ScrapeResult([], 0, 0, 0)))
+    monkeypatch.setattr(check.cadvisor_scraper, 'process_metric_families', mock.Mock(return_value=None))
+    monkeypatch.setattr(check.kubelet_scraper, 'process_metric_families', mock.Mock(return_value=None))
     monkeypatch.setattr(check, 'detect_cadvisor', mock.Mock(return_value=cadvisor_url))
 
     # We filter out slices unknown by the tagger, mock a non-empty taglist
@@ -75,8 +78,9 @@ def test_kubelet_check_cadvisor(monkeypatch, aggregator):
     check._retrieve_node_spec.assert_called_once()
     check._retrieve_cadvisor_metrics.assert_called_once()
     check._perform_kubelet_check.assert_called_once()
-    check.cadvisor_scraper.process.assert_not_called()
-    check.kubelet_scraper.process.assert_called_once()
+    check.kubelet_scraper.fetch_metric_families.assert_called_once()
+    check.cadvisor_scraper.process_metric_families.assert_not_called()
+    check.kubelet_scraper.process_metric_families.assert_called_once()
 
     # called twice so pct metrics are guaranteed to be there
     check.check(instance_with_tag)
@@ -86,4 +90,6 @@ def test_kubelet_check_cadvisor(monkeypatch, aggregator):
     for metric in EXPECTED_METRICS_CADVISOR:
         aggregator.assert_metric(metric)
         aggregator.assert_metric_has_tag(metric, "instance:tag")
+    aggregator.assert_metric('datadog.agent.kubelet.fetch.duration')
+    aggregator.assert_metric('datadog.agent.kubelet.fetch.size', value=0, tags=['instance:tag', 'endpoint:kubelet'])
     assert aggregator.metrics_asserted_pct == 100.0
@@ -4,12 +4,14 @@
 import json
 import os
 import sys
+import threading
 
 import mock
 import pytest
 from datadog_checks.kubelet import KubeletCheck
 from datadog_checks.kubelet.prometheus import CadvisorPrometheusScraper
 from datadog_checks.checks.prometheus import PrometheusScraper
+from datadog_checks.checks.prometheus.mixins import ScrapeResult
 
 # Skip the whole tests module on Windows
 pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='tests for linux only')
@@ -89,18 +91,20 @@ def mock_kubelet_check(monkeypatch, instances):
     # Mock response for "/metrics/cadvisor"
     attrs = {
         'close.return_value': True,
+        'content': mock_from_file('cadvisor_metrics.txt'),
         'iter_lines.return_value': mock_from_file('cadvisor_metrics.txt').split('\n')
     }
     mock_resp = mock.Mock(headers={'Content-Type': 'text/plain'}, **attrs)
-    monkeypatch.setattr(check.cadvisor_scraper, 'poll', mock.Mock(return_value=mock_resp))
+    monkeypatch.setattr(check.cadvisor_scraper, 'send_request', mock.Mock(return_value=mock_resp))
 
     # Mock response for "/metrics"
     attrs = {
         'close.return_value': True,
+        'content': mock_from_file('kubelet_metrics.txt'),
         'iter_lines.return_value': mock_from_file('kubelet_metrics.txt').split('\n')
     }
     mock_resp = mock.Mock(headers={'Content-Type': 'text/plain'}, **attrs)
-    monkeypatch.setattr(check.kubelet_scraper, 'poll', mock.Mock(return_value=mock_resp))
+    monkeypatch.setattr(check.kubelet_scraper, 'send_request', mock.Mock(return_value=mock_resp))
 
     return check
 
@@ -141,8 +145,8 @@ def test_kubelet_check_prometheus(monkeypatch, aggregator):
     check.retrieve_pod_list.assert_called_once()
     check._retrieve_node_spec.assert_called_once()
     check._perform_kubelet_check.assert_called_once()
-    check.cadvisor_scraper.poll.assert_called_once()
-    check.kubelet_scraper.poll.assert_called_once()
+    check.cadvisor_scraper.send_request.assert_called_once()
+    check.kubelet_scraper.send_request.assert_called_once()
     check.process_cadvisor.assert_not_called()
 
     # called twice so pct metrics are guaranteed to be there
@@ -153,6 +157,12 @@ def test_kubelet_check_prometheus(monkeypatch, aggregator):
     for metric in EXPECTED_METRICS_PROMETHEUS:
         aggregator.assert_metric(metric)
         aggregator.assert_metric_has_tag(metric, "instance:tag")
+    for endpoint in ['pod_list', 'node_spec', 'healthz', 'cadvisor', 'kubelet']:
+        aggregator.assert_metric('datadog.agent.kubelet.fetch.duration', tags=['instance:tag', 'endpoint:' + endpoint])
+    aggregator.assert_metric('datadog.agent.kubelet.fetch.size', value=len(mock_from_file('cadvisor_metrics.txt')),
+                             tags=['instance:tag', 'endpoint:cadvisor'])
+    aggregator.assert_metric('datadog.agent.kubelet.fetch.size', value=len(mock_from_file('kubelet_metrics.txt')),
+                             tags=['instance:tag', 'endpoint:kubelet'])
     assert aggregator.metrics_asserted_pct == 100.0
 
 
@@ -186,8 +196,8 @@ def test_kubelet_check_instance_config(monkeypatch):
     def mock_kubelet_check_no_prom():
         check = mock_kubelet_check(monkeypatch, [{}])
 
-        monkeypatch.setattr(check.cadvisor_scraper, 'process', mock.Mock(return_value=None))
-        monkeypatch.setattr(check.kubelet_scraper, 'process', mock.Mock(return_value=None))
+        monkeypatch.setattr(check.cadvisor_scraper, 'process_metric_families', mock.Mock(return_value=None))
+        monkeypatch.setattr(check.kubelet_scraper, 'process_metric_families', mock.Mock(return_value=None))
         monkeypatch.setattr(check, 'process_cadvisor', mock.Mock(return_value=None))
 
         return check
@@ -200,14 +210,14 @@ def test_kubelet_check_instance_config(monkeypatch):
     check._retrieve_node_spec.assert_called_once()
     check._perform_kubelet_check.assert_called_once()
     check.process_cadvisor.assert_not_called()
-    check.cadvisor_scraper.process.assert_not_called()
-    check.kubelet_scraper.process.assert_not_called()
+    check.cadvisor_scraper.process_metric_families.assert_not_called()
+    check.kubelet_scraper.process_metric_families.assert_not_called()
 
     check = mock_kubelet_check_no_prom()
     check.check({"cadvisor_port": 0, "metrics_endpoint": "", "kubelet_metrics_endpoint": "http://dummy"})
 
-    check.cadvisor_scraper.process.assert_not_called()
-    check.kubelet_scraper.process.assert_called()
+    check.cadvisor_scraper.process_metric_families.assert_not_called()
+    check.kubelet_scraper.process_metric_families.assert_called()
 
 
 def mocked_get_tags(entity, _):
@@ -267,6 +277,8 @@ def test_report_container_spec_metrics(monkeypatch):
 
 
 class MockResponse(mock.Mock):
+    content = ''
+
     @staticmethod
     def iter_lines():
         return []
@@ -280,12 +292,12 @@ def test_perform_kubelet_check(monkeypatch):
 
     instance_tags = ["one:1"]
     get = MockResponse()
-    with mock.patch("requests.get", side_effect=get):
+    with mock.patch("requests.Session.get", side_effect=get):
         check._perform_kubelet_check(instance_tags)
 
     get.assert_has_calls([
         mock.call('http://127.0.0.1:10255/healthz', cert=None, headers=None, params={'verbose': True}, timeout=10,
-                  verify=None)])
+                  stream=False, verify=None)])
     calls = [mock.call('kubernetes.kubelet.check', 0, tags=instance_tags)]
     check.service_check.assert_has_calls(calls)
 
@@ -300,3 +312,42 @@ def test_report_node_metrics(monkeypatch):
         mock.call('kubernetes.memory.capacity', 512.0, ['foo:bar'])
     ]
     check.gauge.assert_has_calls(calls, any_order=False)
+
+
+def test_fetch_endpoints_in_parallel(monkeypatch):
+    check = mock_kubelet_check(monkeypatch, [{}])
+    arrived = []
+    all_arrived = threading.Event()
+
+    def wait_for_the_others(result):
+        def fetch(*args):
+            arrived.append(1)
+            if len(arrived) == 5:
+                all_arrived.set()
+            # every endpoint is fetched at the same time, or this times out
+            assert all_arrived.wait(1)
+            return result
+        return fetch
+
+    pod_list = json.loads(mock_from_file('pods.json'))
+    monkeypatch.setattr(check, 'retrieve_pod_list', wait_for_the_others(pod_list))
+    monkeypatch.setattr(check, '_retrieve_node_spec', wait_for_the_others(NODE_SPEC))
+    monkeypatch.setattr(check, 'perform_kubelet_query', wait_for_the_others(None))
+    scrape_result = ScrapeResult([], 0, 0, 0)
+    monkeypatch.setattr(check.cadvisor_scraper, 'fetch_metric_families', wait_for_the_others(scrape_result))
+    monkeypatch.setattr(check.kubelet_scraper, 'fetch_metric_families', wait_for_the_others(scrape_result))
+    monkeypatch.setattr(check.cadvisor_scraper, 'process_metric_families', mock.Mock())
+    monkeypatch.setattr(check.kubelet_scraper, 'process_metric_families', mock.Mock())
+
+    check.check({})
+
+    assert check.cadvisor_scraper.process_metric_families.call_args[0][0] == []
+    assert check.cadvisor_scraper.process_metric_families.call_args[1]['pod_list'] is pod_list
+    check.kubelet_scraper.process_metric_families.assert_called_once()
+
+
+def test_shared_session():
+    check = KubeletCheck('kubelet', None, {}, [{}])
+    session = check.get_http_session()
+    assert check.cadvisor_scraper.get_http_session('http://127.0.0.1:10255/metrics/cadvisor') is session
+    assert check.kubelet_scraper.get_http_session('http://127.0.0.1:10255/metrics', cert=None, verify=False) is session
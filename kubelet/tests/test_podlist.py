@@ -0,0 +1,125 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import json
+import os
+
+import mock
+import pytest
+
+from datadog_checks.kubelet import KubeletCheck
+from datadog_checks.kubelet.common import ContainerFilter, is_static_pending_pod
+from datadog_checks.kubelet.podlist import POD_FIELDS, decode_pod_list, project
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def fixture_bytes(fname):
+    with open(os.path.join(HERE, 'fixtures', fname), 'rb') as f:
+        return f.read()
+
+
+def chunked(payload, size):
+    return [payload[i:i + size] for i in range(0, len(payload), size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000, 1024 * 1024])
+def test_decode_pod_list(chunk_size):
+    payload = fixture_bytes('pods.json')
+    full = json.loads(payload)
+
+    pod_list, size = decode_pod_list(chunked(payload, chunk_size))
+
+    assert size == len(payload)
+    assert pod_list['kind'] == 'PodList'
+    assert pod_list['items'] == [project(pod, POD_FIELDS) for pod in full['items']]
+
+
+def test_projection_keeps_what_consumers_read():
+    full = json.loads(fixture_bytes('pods.json'))
+    pod_list, _ = decode_pod_list([fixture_bytes('pods.json')])
+
+    pod = pod_list['items'][0]
+    assert set(pod) == {'metadata', 'spec', 'status'}
+    assert set(pod['spec']['containers'][0]) <= {'name', 'resources'}
+    assert 'volumes' not in pod['spec']
+
+    assert [is_static_pending_pod(p) for p in pod_list['items']] == [is_static_pending_pod(p) for p in full['items']]
+    projected_filter, full_filter = ContainerFilter(pod_list), ContainerFilter(full)
+    assert projected_filter.static_pod_uids == full_filter.static_pod_uids
+    for cid, ctr in full_filter.containers.iteritems():
+        assert projected_filter.containers[cid]['name'] == ctr['name']
+        assert projected_filter.containers[cid]['image'] == ctr['image']
+
+
+def test_decode_non_ascii_split_across_chunks():
+    payload = json.dumps({'items': [{'metadata': {'name': u'pod-\xe9t\xe9', 'labels': {'a': 'b'}}}]},
+                         ensure_ascii=False).encode('utf-8')
+    # every multi-byte character is split in two
+    pod_list, _ = decode_pod_list(chunked(payload, 1))
+    assert pod_list['items'] == [{'metadata': {'name': u'pod-\xe9t\xe9'}}]
+
+
+@pytest.mark.parametrize('payload, expected', [
+    (b'{}', {}),
+    (b' { "items" : [ ] } ', {'items': []}),
+    (b'{"items": null, "kind": "PodList"}', {'items': None, 'kind': 'PodList'}),
+    (b'{"metadata": {"resourceVersion": "1"}, "n": 12345}', {'metadata': {'resourceVersion': '1'}, 'n': 12345}),
+])
+def test_decode_edge_cases(payload, expected):
+    assert decode_pod_list(chunked(payload, 3))[0] == expected
+
+
+@pytest.mark.parametrize('payload', [b'', b'{"items": [{}', b'{"items": [{}} ', b'[]'])
+def test_decode_invalid(payload):
+    with pytest.raises(ValueError):
+        decode_pod_list(chunked(payload, 3))
+
+
+def test_unchanged_resource_version():
+    payload = b'{"metadata": {"resourceVersion": "42"}, "items": [{"metadata": {"uid": "1"}}'
+
+    def chunks():
+        yield payload
+        raise AssertionError("the pods shouldn't be read")
+
+    assert decode_pod_list(chunks(), resource_version='42') == (None, len(payload))
+
+
+class MockPodListResponse(object):
+    def __init__(self, payload, status_code=200, etag=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = {'ETag': etag} if etag else {}
+
+    def iter_content(self, chunk_size=1):
+        return chunked(self.payload, chunk_size)
+
+    def close(self):
+        pass
+
+
+def test_retrieve_pod_list_reuse(monkeypatch):
+    check = KubeletCheck('kubelet', None, {}, [{}])
+    check.pod_list_url = 'http://127.0.0.1:10255/pods/'
+    payload = fixture_bytes('pods.json')
+
+    # unchanged ETag
+    query = mock.Mock(return_value=MockPodListResponse(payload, etag='"v1"'))
+    monkeypatch.setattr(check, 'perform_kubelet_query', query)
+    pod_list = check.retrieve_pod_list()
+    assert len(pod_list['items']) == 5
+    query.assert_called_once_with(check.pod_list_url, stream=True, extra_headers=None)
+
+    query.return_value = MockPodListResponse(b'', status_code=304)
+    assert check.retrieve_pod_list() is pod_list
+    query.assert_called_with(check.pod_list_url, stream=True, extra_headers={'If-None-Match': '"v1"'})
+
+    # new pod list
+    query.return_value = MockPodListResponse(b'{"metadata": {"resourceVersion": "7"}, "items": []}')
+    pod_list = check.retrieve_pod_list()
+    assert pod_list['items'] == []
+
+    # unchanged resourceVersion
+    query.return_value = MockPodListResponse(b'{"metadata": {"resourceVersion": "7"}, "items": [{}]}')
+    assert check.retrieve_pod_list() is pod_list
@@ -6,6 +6,7 @@ import os
 import sys
 from collections import namedtuple
 
+import mock
 import pytest
 from datadog_checks.kubelet import KubeletCheck
 from datadog_checks.kubelet.prometheus import CadvisorPrometheusScraper
@@ -195,3 +196,22 @@ def test_get_kube_container_name():
 
     tags = CadvisorPrometheusScraper._get_kube_container_name([])
     assert tags == []
+
+
+def test_pod_index(cadvisor_scraper):
+    pod = cadvisor_scraper._get_pod_by_uid('260c2b1d43b094af6d6b4ccba082c2db')
+    assert pod["metadata"]["name"] == "kube-proxy-gke-haissam-default-pool-be5066f1-wnvn"
+    assert cadvisor_scraper._get_pod_by_uid('not-here') is None
+
+    # the index is rebuilt for a new pod list
+    cadvisor_scraper.pod_list = {'items': []}
+    assert cadvisor_scraper._get_pod_by_uid('260c2b1d43b094af6d6b4ccba082c2db') is None
+
+
+def test_tags_memo(cadvisor_scraper):
+    with mock.patch("datadog_checks.kubelet.prometheus.get_tags", return_value=['foo:bar']) as get_tags:
+        tags = cadvisor_scraper._get_tags('docker://deadbeef')
+        tags.append('mutated:tag')
+        assert cadvisor_scraper._get_tags('docker://deadbeef') == ['foo:bar']
+        assert cadvisor_scraper._get_tags('kubernetes_pod://deadbeef') == ['foo:bar']
+    assert get_tags.call_count == 2
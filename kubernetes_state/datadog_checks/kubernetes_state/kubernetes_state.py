@@ -309,6 +309,15 @@ class KubernetesState(PrometheusCheck):
         else:
             return None
 
+    def _joined_tags(self, metric):
+        """
+        Returns the tags of the `label_joins` labels of `metric`.
+        The Agent5 scraper adds the joined labels to the metric labels instead.
+        """
+        if hasattr(self, '_label_join_index'):
+            return list(self.join_labels(metric))
+        return []
+
     def _trim_job_tag(self, name):
         """
         Trims suffix of job names if they match -(\d{4,10}$)
@@ -373,6 +382,7 @@ class KubernetesState(PrometheusCheck):
         for metric in message.metric:
             on_schedule = int(metric.gauge.value) - curr_time
             tags = [self._format_tag(label.name, label.value) for label in metric.label] + self.custom_tags
+            tags += self._joined_tags(metric)
             if on_schedule < 0:
                 message = "The service check scheduled at %s is %s seconds late" % (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(metric.gauge.value))), on_schedule)
                 self.service_check(check_basename, self.CRITICAL, tags=tags, message=message)
@@ -389,6 +399,7 @@ class KubernetesState(PrometheusCheck):
                     tags.append(self._format_tag(label.name, trimmed_job))
                 else:
                     tags.append(self._format_tag(label.name, label.value))
+            tags += self._joined_tags(metric)
             self.service_check(service_check_name, self.OK, tags=tags + self.custom_tags)
 
     def kube_job_failed(self, message, **kwargs):
@@ -401,6 +412,7 @@ class KubernetesState(PrometheusCheck):
                     tags.append(self._format_tag(label.name, trimmed_job))
                 else:
                     tags.append(self._format_tag(label.name, label.value))
+            tags += self._joined_tags(metric)
             self.service_check(service_check_name, self.CRITICAL, tags=tags + self.custom_tags)
 
     def kube_job_status_failed(self, message, **kwargs):
@@ -412,6 +424,7 @@ class KubernetesState(PrometheusCheck):
                     tags.append(self._format_tag(label.name, trimmed_job))
                 else:
                     tags.append(self._format_tag(label.name, label.value))
+            tags += self._joined_tags(metric)
             self.job_failed_count[frozenset(tags)] += metric.gauge.value
 
 
@@ -424,6 +437,7 @@ class KubernetesState(PrometheusCheck):
                     tags.append(self._format_tag(label.name, trimmed_job))
                 else:
                     tags.append(self._format_tag(label.name, label.value))
+            tags += self._joined_tags(metric)
             self.job_succeeded_count[frozenset(tags)] += metric.gauge.value
 
     def kube_node_status_condition(self, message, **kwargs):
@@ -485,6 +499,7 @@ class KubernetesState(PrometheusCheck):
         if message.type < len(METRIC_TYPES):
             for metric in message.metric:
                 tags = [self._format_tag(label.name, label.value) for label in metric.label] + self.custom_tags
+                tags += self._joined_tags(metric)
                 status = statuses[int(getattr(metric, METRIC_TYPES[message.type]).value)]  # value can be 0 or 1
                 tags.append(self._format_tag('status', status))
                 self.gauge(metric_name, 1, tags)  # metric value is always one, value is on the tags
@@ -0,0 +1,94 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+
+# 3p
+from pymongo import monitoring
+
+
+class TopologyListener(monitoring.TopologyListener):
+    """
+    Count the changes of the topology seen by the monitor threads of a client, e.g. a new
+    primary or a member going down, which the client recovers from by itself.
+    """
+    def __init__(self):
+        self.changes = 0
+        self.topology_type_name = None
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        self.changes += 1
+        self.topology_type_name = event.new_description.topology_type_name
+
+    def closed(self, event):
+        pass
+
+    def pop_changes(self):
+        changes, self.changes = self.changes, 0
+        return changes
+
+
+class CachedClient(object):
+    __slots__ = ('client', 'server', 'options', 'listener')
+
+    def __init__(self, client, server, options, listener):
+        self.client = client
+        self.server = server
+        self.options = options
+        self.listener = listener
+
+
+class MongoClientCache(object):
+    """
+    MongoClients kept across the runs of the check, so that their connection pools, the discovery of
+    the servers and the authentication are done once instead of at every run.
+
+    Clients are cached by a key made of the sanitized server URI and the SSL parameters, and the role of
+    the client. A client is replaced when the URI (e.g. the password) or the options it was built with change.
+    """
+    def __init__(self, log):
+        self.log = log
+        # key -> CachedClient
+        self._clients = {}
+
+    def get(self, key, server, options, connect):
+        """
+        Return the `CachedClient` of `key`, and whether it was reused. A new client is built by
+        `connect(listener)`, which must register the `TopologyListener` it gets on the client,
+        and authenticate it. It isn't cached if `connect` raises.
+
+        :param server: the server URI the client is built from
+        :param options: dict of the options the client is built with
+        """
+        cached = self._clients.get(key)
+        if cached is not None:
+            if cached.server == server and cached.options == options:
+                return cached, True
+            self.log.debug(u"The configuration of the client of %s changed, replacing it", key[0])
+            self.evict(key)
+
+        listener = TopologyListener()
+        client = connect(listener)
+        cached = self._clients[key] = CachedClient(client, server, options, listener)
+        return cached, False
+
+    def evict(self, key):
+        cached = self._clients.pop(key, None)
+        if cached is not None:
+            cached.client.close()
+
+    def evict_server(self, server):
+        """
+        Close the clients built from the `server` URI
+        """
+        for key in [key for key, cached in self._clients.iteritems() if cached.server == server]:
+            self.evict(key)
+
+    def close(self):
+        for key in self._clients.keys():
+            self.evict(key)
+
+    def __len__(self):
+        return len(self._clients)
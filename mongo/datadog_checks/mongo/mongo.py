@@ -11,12 +11,39 @@ from checks import AgentCheck
 from urlparse import urlsplit
 from config import _is_affirmative
 from distutils.version import LooseVersion # pylint: disable=E0611,E0401
+from datadog_checks.checks.libs.scheduler import JobCancelled, JobScheduler, JobTimeout
+
+# check
+from .client_cache import MongoClientCache
 
 DEFAULT_TIMEOUT = 30
+# Seconds the commands run concurrently with `collection_workers` have to complete
+DEFAULT_COLLECTION_DEADLINE = 10
 GAUGE = AgentCheck.gauge
 RATE = AgentCheck.rate
 
 
+# Names of the tags of the keys of the commands run by `MongoDb._run_commands`, after the command name
+COMMAND_TAGS = {
+    'current_op': (),
+    'dbstats': ('db',),
+    'indexstats': ('collection',),
+    'collstats': ('collection',),
+}
+
+
+def _run_command(func, args):
+    """
+    Run a command, return its result, exception and latency
+    """
+    start = time.time()
+    try:
+        result, exception = func(*args), None
+    except Exception as e:
+        result, exception = None, e
+    return result, exception, time.time() - start
+
+
 class MongoDb(AgentCheck):
     """
     MongoDB agent check.
@@ -419,6 +446,19 @@ class MongoDb(AgentCheck):
         for (key, value) in self.COLLECTION_METRICS.iteritems():
             self.collection_metrics_names.append(key.split('.')[1])
 
+        # Clients kept across runs, by sanitized server URI and SSL parameters
+        self._clients = MongoClientCache(self.log)
+
+        # Number of workers and schedulers of the threads running the commands concurrently, by server URI
+        self._schedulers = {}
+
+    def stop(self):
+        self._clients.close()
+        for _, scheduler in self._schedulers.itervalues():
+            # don't wait for the commands still running
+            scheduler.stop(timeout=0)
+        self._schedulers = {}
+
     def get_library_versions(self):
         return {"pymongo": pymongo.version}
 
@@ -626,23 +666,101 @@ class MongoDb(AgentCheck):
 
         return username, password, db_name, nodelist, clean_server_name, auth_source
 
-    def _collect_indexes_stats(self, instance, db, tags):
+    @staticmethod
+    def _get_indexes_stats(db, coll_name):
         """
-        Collect indexes statistics for all collections in the configuration.
-        This use the "$indexStats" command.
+        Return the indexes statistics of a collection, from the "$indexStats" command.
         """
-        for coll_name in instance.get('collections', []):
-            try:
-                for stats in db[coll_name].aggregate([{"$indexStats": {}}], cursor={}):
-                    idx_tags = tags + [
-                        "name:{0}".format(stats.get('name', 'unknown')),
-                        "collection:{0}".format(coll_name),
-                    ]
-                    self.gauge('mongodb.collection.indexes.accesses.ops', int(stats.get('accesses', {}).get('ops', 0)), idx_tags)
-            except Exception as e:
-                self.log.error("Could not fetch indexes stats for collection %s: %s", coll_name, e)
+        return list(db[coll_name].aggregate([{"$indexStats": {}}], cursor={}))
+
+    def _report_indexes_stats(self, coll_name, indexes_stats, tags):
+        for stats in indexes_stats:
+            idx_tags = tags + [
+                "name:{0}".format(stats.get('name', 'unknown')),
+                "collection:{0}".format(coll_name),
+            ]
+            self.gauge('mongodb.collection.indexes.accesses.ops', int(stats.get('accesses', {}).get('ops', 0)), idx_tags)
+
+    def _get_scheduler(self, server, workers):
+        scheduler_workers, scheduler = self._schedulers.get(server, (None, None))
+        if scheduler is not None and scheduler_workers != workers:
+            scheduler.stop(timeout=0)
+            scheduler = None
+        if scheduler is None:
+            scheduler = JobScheduler(workers, name='mongo')
+            self._schedulers[server] = (workers, scheduler)
+        return scheduler
+
+    def _run_commands(self, commands, server, workers, deadline, tags):
+        """
+        Run the `commands`, a list of `(key, func, args)` tuples, and return the dicts of their results
+        and of their exceptions by key.
+
+        With `workers`, the commands are run by a scheduler of as many threads, and those not done `deadline`
+        seconds after the start are left out of the results, for the check to report what it got so far:
+        the ones that haven't started yet are cancelled, the workers stuck on the others are replaced.
+        The latency of each command is reported.
+        """
+        results, errors = {}, {}
+
+        if workers:
+            end = time.time() + deadline
+            scheduler = self._get_scheduler(server, workers)
+            pending = [
+                (key, scheduler.submit(_run_command, args=(func, args), deadline=end)) for key, func, args in commands
+            ]
+        else:
+            pending = [(key, _run_command(func, args)) for key, func, args in commands]
+
+        timed_out = 0
+        for key, outcome in pending:
+            if workers:
+                job = outcome
+                try:
+                    outcome = job.get(max(end - time.time(), 0))
+                except (JobTimeout, JobCancelled):
+                    job.cancel()
+                    timed_out += 1
+                    continue
+
+            result, exception, latency = outcome
+            if exception is None:
+                results[key] = result
+            else:
+                errors[key] = exception
+            command_tags = tags + ["command:{0}".format(key[0])] + \
+                ["{0}:{1}".format(tag_name, value) for tag_name, value in zip(COMMAND_TAGS[key[0]], key[1:])]
+            self.gauge('datadog.agent.mongo.command.latency', latency, tags=command_tags)
+
+        if workers:
+            scheduler.reap()
+            if timed_out:
+                self.log.warning(u"%d of the %d commands run against %s didn't complete within %ss",
+                                 timed_out, len(commands), server, deadline)
+            self.gauge('datadog.agent.mongo.commands.timed_out', timed_out, tags=tags)
+        return results, errors
+
+    def _get_client(self, key, server, options, connect, tags):
+        """
+        Return the client of `key` from the cache, or the new one built by `connect(listener)`,
+        and report whether it was reused and the topology changes it went through.
+        """
+        cached, reused = self._clients.get(key, server, options, connect)
+        client_tags = tags + ['client:{0}'.format(key[-1])]
+        self.gauge('datadog.agent.mongo.client.reused', 1 if reused else 0, tags=client_tags)
+        self.gauge('datadog.agent.mongo.client.topology_changes', cached.listener.pop_changes(), tags=client_tags)
+        return cached.client
 
     def check(self, instance):
+        try:
+            self._check(instance)
+        except pymongo.errors.ConnectionFailure:
+            # pymongo recovers from the changes of topology it sees, start over from
+            # the seed list of the URI when it couldn't
+            self._clients.evict_server(instance.get('server'))
+            raise
+
+    def _check(self, instance):
         """
         Returns a dictionary that looks a lot like what's sent back by
         db.serverStatus()
@@ -715,23 +833,6 @@ class MongoDb(AgentCheck):
             ]
 
         timeout = float(instance.get('timeout', DEFAULT_TIMEOUT)) * 1000
-        try:
-            cli = pymongo.mongo_client.MongoClient(
-                server,
-                socketTimeoutMS=timeout,
-                connectTimeoutMS=timeout,
-                serverSelectionTimeoutMS=timeout,
-                read_preference=pymongo.ReadPreference.PRIMARY_PREFERRED,
-                **ssl_params)
-            # some commands can only go against the admin DB
-            admindb = cli['admin']
-            db = cli[db_name]
-        except Exception:
-            self.service_check(
-                self.SERVICE_CHECK_NAME,
-                AgentCheck.CRITICAL,
-                tags=service_check_tags)
-            raise
 
         # Authenticate
         do_auth = True
@@ -743,12 +844,47 @@ class MongoDb(AgentCheck):
             )
             do_auth = False
 
-        if do_auth:
-            if auth_source:
-                self.log.info("authSource was specified in the the server URL: using '%s' as the authentication database", auth_source)
-                self._authenticate(cli[auth_source], username, password, use_x509, clean_server_name, service_check_tags)
-            else:
-                self._authenticate(db, username, password, use_x509, clean_server_name, service_check_tags)
+        if do_auth and auth_source:
+            self.log.info("authSource was specified in the the server URL: using '%s' as the authentication database", auth_source)
+
+        def connect(server_name, **options):
+            """
+            Return the function building an authenticated client with `options`, for the cache
+            """
+            def _connect(listener):
+                try:
+                    cli = pymongo.mongo_client.MongoClient(
+                        server,
+                        event_listeners=[listener],
+                        **dict(options, **ssl_params))
+                except Exception:
+                    self.service_check(
+                        self.SERVICE_CHECK_NAME,
+                        AgentCheck.CRITICAL,
+                        tags=service_check_tags)
+                    raise
+
+                if do_auth:
+                    try:
+                        self._authenticate(cli[auth_source or db_name], username, password, use_x509, server_name, service_check_tags)
+                    except Exception:
+                        cli.close()
+                        raise
+                return cli
+            return _connect
+
+        client_key = (clean_server_name, tuple(sorted(ssl_params.iteritems())))
+        client_options = {
+            'socketTimeoutMS': timeout,
+            'connectTimeoutMS': timeout,
+            'serverSelectionTimeoutMS': timeout,
+            'read_preference': pymongo.ReadPreference.PRIMARY_PREFERRED,
+        }
+        cli = self._get_client(client_key + ('main',), server, client_options,
+                               connect(clean_server_name, **client_options), tags)
+        # some commands can only go against the admin DB
+        admindb = cli['admin']
+        db = cli[db_name]
 
         try:
             status = db.command('serverStatus', tcmalloc=collect_tcmalloc_metrics)
@@ -767,13 +903,6 @@ class MongoDb(AgentCheck):
         if status['ok'] == 0:
             raise Exception(status['errmsg'].__str__())
 
-        ops = db.current_op()
-        status['fsyncLocked'] = 1 if ops.get('fsyncLock') else 0
-
-        status['stats'] = db.command('dbstats')
-        dbstats = {}
-        dbstats[db_name] = {'stats': status['stats']}
-
         # Handle replica data, if any
         # See
         # http://www.mongodb.org/display/DOCS/Replica+Set+Commands#ReplicaSetCommands-replSetGetStatus  # noqa
@@ -789,20 +918,15 @@ class MongoDb(AgentCheck):
 
                     # need a new connection to deal with replica sets
                     setname = replSet.get('set')
-                    cli_rs = pymongo.mongo_client.MongoClient(
-                        server,
-                        socketTimeoutMS=timeout,
-                        connectTimeoutMS=timeout,
-                        serverSelectionTimeoutMS=timeout,
-                        replicaset=setname,
-                        read_preference=pymongo.ReadPreference.NEAREST,
-                        **ssl_params)
-
-                    if do_auth:
-                        if auth_source:
-                            self._authenticate(cli_rs[auth_source], username, password, use_x509, server, service_check_tags)
-                        else:
-                            self._authenticate(cli_rs[db_name], username, password, use_x509, server, service_check_tags)
+                    rs_options = {
+                        'socketTimeoutMS': timeout,
+                        'connectTimeoutMS': timeout,
+                        'serverSelectionTimeoutMS': timeout,
+                        'replicaset': setname,
+                        'read_preference': pymongo.ReadPreference.NEAREST,
+                    }
+                    cli_rs = self._get_client(client_key + ('replset',), server, rs_options,
+                                              connect(server, **rs_options), tags)
 
                     # Replication set information
                     replset_name = replSet['set']
@@ -866,9 +990,46 @@ class MongoDb(AgentCheck):
         dbnames = cli.database_names()
         self.gauge('mongodb.dbs', len(dbnames), tags=tags)
 
-        for db_n in dbnames:
-            db_aux = cli[db_n]
-            dbstats[db_n] = {'stats': db_aux.command('dbstats')}
+        # Run the commands about the databases and the collections, concurrently with `collection_workers`
+        coll_names = instance.get('collections', [])
+        commands = [(('current_op',), db.current_op, ())]
+        for db_n in [db_name] + [db_n for db_n in dbnames if db_n != db_name]:
+            commands.append((('dbstats', db_n), cli[db_n].command, ('dbstats',)))
+
+        collect_indexes_stats = False
+        if _is_affirmative(instance.get('collections_indexes_stats')):
+            mongo_version = cli.server_info().get('version', '0.0')
+            if LooseVersion(mongo_version) >= LooseVersion("3.2"):
+                collect_indexes_stats = True
+                for coll_name in coll_names:
+                    commands.append((('indexstats', coll_name), self._get_indexes_stats, (db, coll_name)))
+            else:
+                self.log.error("'collections_indexes_stats' is only available starting from mongo 3.2: your mongo version is %s", mongo_version)
+
+        for coll_name in coll_names:
+            commands.append((('collstats', coll_name), db.command, ('collstats', coll_name)))
+
+        results, errors = self._run_commands(
+            commands, server,
+            int(instance.get('collection_workers', 0)),
+            float(instance.get('collection_deadline', DEFAULT_COLLECTION_DEADLINE)),
+            tags
+        )
+
+        if ('current_op',) in errors:
+            raise errors[('current_op',)]
+        if ('current_op',) in results:
+            status['fsyncLocked'] = 1 if results[('current_op',)].get('fsyncLock') else 0
+
+        dbstats = {}
+        for db_n in [db_name] + dbnames:
+            key = ('dbstats', db_n)
+            if key in errors:
+                raise errors[key]
+            if key in results:
+                dbstats[db_n] = {'stats': results[key]}
+        if db_name in dbstats:
+            status['stats'] = dbstats[db_name]['stats']
 
         # Go through the metrics and save the values
         for metric_name in metrics_to_collect:
@@ -925,12 +1086,13 @@ class MongoDb(AgentCheck):
                     self._resolve_metric(metric_name, metrics_to_collect)
                 submit_method(self, metric_name_alias, val, tags=metrics_tags)
 
-        if _is_affirmative(instance.get('collections_indexes_stats')):
-            mongo_version = cli.server_info().get('version', '0.0')
-            if LooseVersion(mongo_version) >= LooseVersion("3.2"):
-                self._collect_indexes_stats(instance, db, tags)
-            else:
-                self.log.error("'collections_indexes_stats' is only available starting from mongo 3.2: your mongo version is %s", mongo_version)
+        if collect_indexes_stats:
+            for coll_name in coll_names:
+                key = ('indexstats', coll_name)
+                if key in errors:
+                    self.log.error("Could not fetch indexes stats for collection %s: %s", coll_name, errors[key])
+                elif key in results:
+                    self._report_indexes_stats(coll_name, results[key], tags)
 
         # Report the usage metrics for dbs/collections
         if 'top' in additional_metrics:
@@ -1021,14 +1183,15 @@ class MongoDb(AgentCheck):
 
         # get collection level stats
         try:
-            # Ensure that you're on the right db
-            db = cli[db_name]
-            # grab the collections from the configutation
-            coll_names = instance.get('collections', [])
             # loop through the collections
             for coll_name in coll_names:
                 # grab the stats from the collection
-                stats = db.command("collstats", coll_name)
+                key = ('collstats', coll_name)
+                if key in errors:
+                    raise errors[key]
+                if key not in results:
+                    continue
+                stats = results[key]
                 # loop through the metrics
                 for m in self.collection_metrics_names:
                     coll_tags = tags + ["db:%s" % db_name, "collection:%s" % coll_name]
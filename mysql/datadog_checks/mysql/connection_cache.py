@@ -0,0 +1,77 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import time
+
+# Seconds a connection is kept for before reconnecting
+DEFAULT_MAX_AGE = 3600
+
+
+class CachedConnection(object):
+    __slots__ = ('db', 'params', 'created_at')
+
+    def __init__(self, db, params, created_at):
+        self.db = db
+        self.params = params
+        self.created_at = created_at
+
+
+class ConnectionCache(object):
+    """
+    Connections kept across the runs of the check, so that the TCP and SSL handshakes and the
+    authentication are done once instead of at every run.
+
+    Connections are cached by the host key of the instance. A connection is replaced when the parameters it
+    was made with (e.g. the password) change, when it gets older than its max age, or when it doesn't
+    answer a ping anymore, e.g. after being closed by the server's wait_timeout.
+    """
+    def __init__(self, log):
+        self.log = log
+        # host key -> CachedConnection
+        self._connections = {}
+
+    def get(self, key, params, connect, max_age):
+        """
+        Return the connection of `key`, and whether it was reused. A new connection is made by `connect()`,
+        it isn't cached if `connect` raises.
+
+        :param params: dict of the parameters the connection is made with
+        :param max_age: seconds the connection is reused for
+        """
+        cached = self._connections.get(key)
+        if cached is not None:
+            if cached.params != params:
+                self.log.debug("The configuration of the connection to %s changed, reconnecting", key)
+            elif time.time() - cached.created_at >= max_age:
+                self.log.debug("The connection to %s is older than %ss, reconnecting", key, max_age)
+            elif self._is_alive(key, cached.db):
+                return cached.db, True
+            self.evict(key)
+
+        db = connect()
+        self._connections[key] = CachedConnection(db, params, time.time())
+        return db, False
+
+    def _is_alive(self, key, db):
+        try:
+            db.ping(reconnect=False)
+            return True
+        except Exception as e:
+            self.log.debug("The connection to %s is lost, reconnecting: %s", key, e)
+            return False
+
+    def evict(self, key):
+        cached = self._connections.pop(key, None)
+        if cached is not None:
+            try:
+                cached.db.close()
+            except Exception:
+                # already closed, by the server or the network
+                pass
+
+    def close(self):
+        for key in self._connections.keys():
+            self.evict(key)
+
+    def __len__(self):
+        return len(self._connections)
@@ -0,0 +1,455 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import re
+from collections import defaultdict
+
+# Header of the sections of SHOW ENGINE INNODB STATUS, e.g.
+# ------------
+# TRANSACTIONS
+# ------------
+SECTION_HEADER = re.compile(r'^-{3,}[ \t\r]*\n([A-Z][^\n]*?)[ \t\r]*\n-{3,}[ \t\r]*$', re.M)
+
+
+def _tokenize(line):
+    # 8782182 OS file reads, 15635445 OS file writes, 947800 OS fsyncs
+    # -> ['8782182', 'OS', 'file', 'reads', '15635445', 'OS', 'file', 'writes', '947800', 'OS', 'fsyncs']
+    return [token.strip(',;[]') for token in line.split()]
+
+
+def _are_values_numeric(array):
+    return all([v.isdigit() for v in array])
+
+
+# SEMAPHORES
+
+def _mutex_spin_waits(results, line):
+    # Mutex spin waits 79626940, rounds 157459864, OS waits 698719
+    # Mutex spin waits 0, rounds 247280272495, OS waits 316513438
+    row = _tokenize(line)
+    results['Innodb_mutex_spin_waits'] = long(row[3])
+    results['Innodb_mutex_spin_rounds'] = long(row[5])
+    results['Innodb_mutex_os_waits'] = long(row[8])
+
+
+def _rw_shared_spins(results, line):
+    row = _tokenize(line)
+    if ';' in line:
+        # RW-shared spins 3859028, OS waits 2100750; RW-excl spins
+        # 4641946, OS waits 1530310
+        results['Innodb_s_lock_spin_waits'] = long(row[2])
+        results['Innodb_x_lock_spin_waits'] = long(row[8])
+        results['Innodb_s_lock_os_waits'] = long(row[5])
+        results['Innodb_x_lock_os_waits'] = long(row[11])
+    else:
+        # Post 5.5.17 SHOW ENGINE INNODB STATUS syntax
+        # RW-shared spins 604733, rounds 8107431, OS waits 241268
+        results['Innodb_s_lock_spin_waits'] = long(row[2])
+        results['Innodb_s_lock_spin_rounds'] = long(row[4])
+        results['Innodb_s_lock_os_waits'] = long(row[7])
+
+
+def _rw_excl_spins(results, line):
+    # Post 5.5.17 SHOW ENGINE INNODB STATUS syntax
+    # RW-excl spins 604733, rounds 8107431, OS waits 241268
+    row = _tokenize(line)
+    results['Innodb_x_lock_spin_waits'] = long(row[2])
+    results['Innodb_x_lock_spin_rounds'] = long(row[4])
+    results['Innodb_x_lock_os_waits'] = long(row[7])
+
+
+def _semaphore_wait(results, line):
+    # --Thread 907205 has waited at handler/ha_innodb.cc line 7156 for 1.00 seconds the semaphore:
+    row = _tokenize(line)
+    results['Innodb_semaphore_waits'] += 1
+    results['Innodb_semaphore_wait_time'] += long(float(row[9])) * 1000
+
+
+# TRANSACTIONS
+
+def _history_list_length(results, line):
+    # History list length 132
+    results['Innodb_history_list_length'] = long(_tokenize(line)[3])
+
+
+def _transaction(results, line):
+    # ---TRANSACTION 0, not started, process no 13510, OS thread id 1170446656
+    results['Innodb_current_transactions'] += 1
+    if 'ACTIVE' in line:
+        results['Innodb_active_transactions'] += 1
+
+
+def _tables_in_use(results, line):
+    # mysql tables in use 2, locked 2
+    row = _tokenize(line)
+    results['Innodb_tables_in_use'] += long(row[4])
+    results['Innodb_locked_tables'] += long(row[6])
+
+
+def _lock_wait_structs(results, line):
+    # LOCK WAIT 12 lock struct(s), heap size 3024, undo log entries 5
+    # LOCK WAIT 2 lock struct(s), heap size 368
+    results['Innodb_lock_structs'] += long(_tokenize(line)[2])
+    results['Innodb_locked_transactions'] += 1
+
+
+def _rolling_back_structs(results, line):
+    # ROLLING BACK 127539 lock struct(s), heap size 15201832,
+    # 4411492 row lock(s), undo log entries 1042488
+    results['Innodb_lock_structs'] += long(_tokenize(line)[2])
+
+
+def _lock_structs(results, line):
+    # 23 lock struct(s), heap size 3024, undo log entries 27
+    results['Innodb_lock_structs'] += long(_tokenize(line)[0])
+
+
+# FILE I/O
+
+def _os_file_reads(results, line):
+    # 8782182 OS file reads, 15635445 OS file writes, 947800 OS
+    # fsyncs
+    row = _tokenize(line)
+    results['Innodb_os_file_reads'] = long(row[0])
+    results['Innodb_os_file_writes'] = long(row[4])
+    results['Innodb_os_file_fsyncs'] = long(row[8])
+
+
+def _pending_normal_aio(results, line):
+    row = _tokenize(line)
+    if len(row) == 8:
+        # (len(row) == 8)  Pending normal aio reads: 0, aio writes: 0,
+        results['Innodb_pending_normal_aio_reads'] = long(row[4])
+        results['Innodb_pending_normal_aio_writes'] = long(row[7])
+    elif len(row) == 14:
+        # (len(row) == 14) Pending normal aio reads: 0 [0, 0] , aio writes: 0 [0, 0] ,
+        results['Innodb_pending_normal_aio_reads'] = long(row[4])
+        results['Innodb_pending_normal_aio_writes'] = long(row[10])
+    elif len(row) == 16:
+        # (len(row) == 16) Pending normal aio reads: [0, 0, 0, 0] , aio writes: [0, 0, 0, 0] ,
+        if _are_values_numeric(row[4:8]) and _are_values_numeric(row[11:15]):
+            results['Innodb_pending_normal_aio_reads'] = (long(row[4]) + long(row[5]) +
+                                                          long(row[6]) + long(row[7]))
+            results['Innodb_pending_normal_aio_writes'] = (long(row[11]) + long(row[12]) +
+                                                           long(row[13]) + long(row[14]))
+
+        # (len(row) == 16) Pending normal aio reads: 0 [0, 0, 0, 0] , aio writes: 0 [0, 0] ,
+        elif _are_values_numeric(row[4:9]) and _are_values_numeric(row[12:15]):
+            results['Innodb_pending_normal_aio_reads'] = long(row[4])
+            results['Innodb_pending_normal_aio_writes'] = long(row[12])
+        else:
+            raise ValueError("unknown format")
+    elif len(row) == 18:
+        # (len(row) == 18) Pending normal aio reads: 0 [0, 0, 0, 0] , aio writes: 0 [0, 0, 0, 0] ,
+        results['Innodb_pending_normal_aio_reads'] = long(row[4])
+        results['Innodb_pending_normal_aio_writes'] = long(row[12])
+    elif len(row) == 22:
+        # (len(row) == 22)
+        # Pending normal aio reads: 0 [0, 0, 0, 0, 0, 0, 0, 0] , aio writes: 0 [0, 0, 0, 0] ,
+        results['Innodb_pending_normal_aio_reads'] = long(row[4])
+        results['Innodb_pending_normal_aio_writes'] = long(row[16])
+
+
+def _ibuf_aio_reads(results, line):
+    #  ibuf aio reads: 0, log i/o's: 0, sync i/o's: 0
+    #  or ibuf aio reads:, log i/o's:, sync i/o's:
+    row = _tokenize(line)
+    if len(row) == 10:
+        results['Innodb_pending_ibuf_aio_reads'] = long(row[3])
+        results['Innodb_pending_aio_log_ios'] = long(row[6])
+        results['Innodb_pending_aio_sync_ios'] = long(row[9])
+    elif len(row) == 7:
+        results['Innodb_pending_ibuf_aio_reads'] = 0
+        results['Innodb_pending_aio_log_ios'] = 0
+        results['Innodb_pending_aio_sync_ios'] = 0
+
+
+def _pending_flushes(results, line):
+    # Pending flushes (fsync) log: 0; buffer pool: 0
+    row = _tokenize(line)
+    results['Innodb_pending_log_flushes'] = long(row[4])
+    results['Innodb_pending_buffer_pool_flushes'] = long(row[7])
+
+
+# INSERT BUFFER AND ADAPTIVE HASH INDEX
+
+def _ibuf_for_space(results, line):
+    # Older InnoDB code seemed to be ready for an ibuf per tablespace.  It
+    # had two lines in the output.  Newer has just one line, see below.
+    # Ibuf for space 0: size 1, free list len 887, seg size 889, is not empty
+    # Ibuf for space 0: size 1, free list len 887, seg size 889,
+    row = _tokenize(line)
+    results['Innodb_ibuf_size'] = long(row[5])
+    results['Innodb_ibuf_free_list'] = long(row[9])
+    results['Innodb_ibuf_segment_size'] = long(row[12])
+
+
+def _ibuf_size(results, line):
+    # Ibuf: size 1, free list len 4634, seg size 4636,
+    row = _tokenize(line)
+    results['Innodb_ibuf_size'] = long(row[2])
+    results['Innodb_ibuf_free_list'] = long(row[6])
+    results['Innodb_ibuf_segment_size'] = long(row[9])
+
+    if 'merges' in line:
+        results['Innodb_ibuf_merges'] = long(row[10])
+
+
+def _merged_operations(results, line):
+    # Output of show engine innodb status has changed in 5.5
+    # merged operations:
+    # insert 593983, delete mark 387006, delete 73092
+    return _merged_operations_counts
+
+
+def _merged_operations_counts(results, line):
+    if ', delete mark ' not in line:
+        return
+    row = _tokenize(line)
+    results['Innodb_ibuf_merged_inserts'] = long(row[1])
+    results['Innodb_ibuf_merged_delete_marks'] = long(row[4])
+    results['Innodb_ibuf_merged_deletes'] = long(row[6])
+    results['Innodb_ibuf_merged'] = results['Innodb_ibuf_merged_inserts'] + results[
+        'Innodb_ibuf_merged_delete_marks'] + results['Innodb_ibuf_merged_deletes']
+
+
+def _merged_recs(results, line):
+    # 19817685 inserts, 19817684 merged recs, 3552620 merges
+    row = _tokenize(line)
+    results['Innodb_ibuf_merged_inserts'] = long(row[0])
+    results['Innodb_ibuf_merged'] = long(row[2])
+    results['Innodb_ibuf_merges'] = long(row[5])
+
+
+def _hash_table_size(results, line):
+    # In some versions of InnoDB, the used cells is omitted.
+    # Hash table size 4425293, used cells 4229064, ....
+    # Hash table size 57374437, node heap has 72964 buffer(s) <--
+    # no used cells
+    row = _tokenize(line)
+    results['Innodb_hash_index_cells_total'] = long(row[3])
+    results['Innodb_hash_index_cells_used'] = long(row[6]) if 'used cells' in line else 0
+
+
+# LOG
+
+def _log_ios_done(results, line):
+    # 3430041 log i/o's done, 17.44 log i/o's/second
+    # 520835887 log i/o's done, 17.28 log i/o's/second, 518724686
+    # syncs, 2980893 checkpoints
+    results['Innodb_log_writes'] = long(_tokenize(line)[0])
+
+
+def _pending_log_writes(results, line):
+    # 0 pending log writes, 0 pending chkp writes
+    row = _tokenize(line)
+    results['Innodb_pending_log_writes'] = long(row[0])
+    results['Innodb_pending_checkpoint_writes'] = long(row[4])
+
+
+def _log_sequence_number(results, line):
+    # This number is NOT printed in hex in InnoDB plugin.
+    # Log sequence number 272588624
+    results['Innodb_lsn_current'] = long(_tokenize(line)[3])
+
+
+def _log_flushed_up_to(results, line):
+    # This number is NOT printed in hex in InnoDB plugin.
+    # Log flushed up to   272588624
+    results['Innodb_lsn_flushed'] = long(_tokenize(line)[4])
+
+
+def _last_checkpoint_at(results, line):
+    # Last checkpoint at  272588624
+    results['Innodb_lsn_last_checkpoint'] = long(_tokenize(line)[3])
+
+
+# BUFFER POOL AND MEMORY
+
+def _total_memory_allocated(results, line):
+    # Total memory allocated 29642194944; in additional pool allocated 0
+    row = _tokenize(line)
+    results['Innodb_mem_total'] = long(row[3])
+    results['Innodb_mem_additional_pool'] = long(row[8])
+
+
+def _value(name, index):
+    """
+    Return a function parsing the value at `index` of a line, e.g. for
+    Buffer pool size        1769471
+    Page hash           11688584
+    """
+    def handler(results, line):
+        results[name] = long(_tokenize(line)[index])
+    return handler
+
+
+def _pages_read(results, line):
+    # Pages read 15240822, created 1770238, written 21705836
+    row = _tokenize(line)
+    results['Innodb_pages_read'] = long(row[2])
+    results['Innodb_pages_created'] = long(row[4])
+    results['Innodb_pages_written'] = long(row[6])
+
+
+# ROW OPERATIONS
+
+def _queries_inside(results, line):
+    # 0 queries inside InnoDB, 0 queries in queue
+    row = _tokenize(line)
+    results['Innodb_queries_inside'] = long(row[0])
+    results['Innodb_queries_queued'] = long(row[4])
+
+
+def _read_views(results, line):
+    # 1 read views open inside InnoDB
+    results['Innodb_read_views'] = long(_tokenize(line)[0])
+
+
+def _rows_inserted(results, line):
+    # Number of rows inserted 50678311, updated 66425915, deleted
+    # 20605903, read 454561562
+    row = _tokenize(line)
+    results['Innodb_rows_inserted'] = long(row[4])
+    results['Innodb_rows_updated'] = long(row[6])
+    results['Innodb_rows_deleted'] = long(row[8])
+    results['Innodb_rows_read'] = long(row[10])
+
+
+# Lines parsed in each section: a regex matching the start of the stripped line, and the function
+# parsing it into the results. A function can return the function parsing the next line.
+# The lines of the other sections, e.g. INDIVIDUAL BUFFER POOL INFO, aren't read.
+SECTION_LINES = {
+    'SEMAPHORES': [
+        (r'Mutex spin waits ', _mutex_spin_waits),
+        (r'RW-shared spins ', _rw_shared_spins),
+        (r'RW-excl spins ', _rw_excl_spins),
+        (r'--Thread .* seconds the semaphore:', _semaphore_wait),
+    ],
+    'TRANSACTIONS': [
+        (r'History list length ', _history_list_length),
+        (r'---TRANSACTION', _transaction),
+        (r'mysql tables in use ', _tables_in_use),
+        (r'LOCK WAIT \d+ lock struct\(s\)', _lock_wait_structs),
+        (r'ROLLING BACK \d+ lock struct\(s\)', _rolling_back_structs),
+        (r'\d+ lock struct\(s\)', _lock_structs),
+    ],
+    'FILE I/O': [
+        (r'\d+ OS file reads, ', _os_file_reads),
+        (r'Pending normal aio reads:', _pending_normal_aio),
+        (r'ibuf aio reads', _ibuf_aio_reads),
+        (r'Pending flushes \(fsync\)', _pending_flushes),
+    ],
+    'INSERT BUFFER AND ADAPTIVE HASH INDEX': [
+        (r'Ibuf for space 0: size ', _ibuf_for_space),
+        (r'Ibuf: size ', _ibuf_size),
+        (r'merged operations:', _merged_operations),
+        (r'\d+ inserts, \d+ merged recs, ', _merged_recs),
+        (r'Hash table size ', _hash_table_size),
+    ],
+    'LOG': [
+        (r"\d+ log i/o's done, ", _log_ios_done),
+        (r'\d+ pending log writes, ', _pending_log_writes),
+        (r'Log sequence number', _log_sequence_number),
+        (r'Log flushed up to', _log_flushed_up_to),
+        (r'Last checkpoint at', _last_checkpoint_at),
+    ],
+    'BUFFER POOL AND MEMORY': [
+        (r'Total memory allocated \d+; in additional pool allocated', _total_memory_allocated),
+        (r'Adaptive hash index ', _value('Innodb_mem_adaptive_hash', 3)),
+        (r'Page hash {11}', _value('Innodb_mem_page_hash', 2)),
+        (r'Dictionary cache {4}', _value('Innodb_mem_dictionary', 2)),
+        (r'File system {9}', _value('Innodb_mem_file_system', 2)),
+        (r'Lock system {9}', _value('Innodb_mem_lock_system', 2)),
+        (r'Recovery system {5}', _value('Innodb_mem_recovery_system', 2)),
+        (r'Threads {13}', _value('Innodb_mem_thread_hash', 1)),
+        # The " " after size is necessary to avoid matching the wrong line:
+        # Buffer pool size, bytes 28991012864
+        (r'Buffer pool size ', _value('Innodb_buffer_pool_pages_total', 3)),
+        (r'Free buffers', _value('Innodb_buffer_pool_pages_free', 2)),
+        (r'Database pages', _value('Innodb_buffer_pool_pages_data', 2)),
+        (r'Modified db pages', _value('Innodb_buffer_pool_pages_dirty', 3)),
+        # Not the line of the new plugin:
+        # Pages read ahead 0.00/s, evicted without access 0.06/s
+        (r'Pages read \d', _pages_read),
+    ],
+    'ROW OPERATIONS': [
+        (r'\d+ queries inside InnoDB, ', _queries_inside),
+        (r'\d+ read views open inside InnoDB', _read_views),
+        (r'Number of rows inserted', _rows_inserted),
+    ],
+}
+
+
+def _compile(lines):
+    """
+    Return a regex matching any of the `lines` of a section, whose lastindex is the position of
+    the line matched + 1, and the list of their functions
+    """
+    pattern = re.compile('|'.join('({})'.format(line) for line, _ in lines))
+    return pattern, [handler for _, handler in lines]
+
+
+SECTION_PARSERS = {name: _compile(lines) for name, lines in SECTION_LINES.iteritems()}
+
+
+# Sections without metrics, only their headers are matched
+SKIPPED_SECTIONS = frozenset([
+    'BACKGROUND THREAD',
+    'LATEST FOREIGN KEY ERROR',
+    'LATEST DETECTED DEADLOCK',
+    'INDIVIDUAL BUFFER POOL INFO',
+])
+SECTIONS = SKIPPED_SECTIONS.union(SECTION_PARSERS)
+
+
+def _sections(text):
+    """
+    Split the status into its sections, return the name and the text of each
+    """
+    name, start = None, 0
+    for header in SECTION_HEADER.finditer(text):
+        if header.group(1) not in SECTIONS:
+            # e.g. the dashes around a line of a query
+            continue
+        yield name, text[start:header.start()]
+        name, start = header.group(1), header.end()
+    yield name, text[start:]
+
+
+def parse_innodb_status(text, log, transactions=True):
+    """
+    Parse the output of SHOW ENGINE INNODB STATUS into the Innodb_* values it reports.
+
+    The status is split into its sections, and each line of a section is matched once against
+    the lines parsed in it, only the lines matched are tokenized.
+
+    :param transactions: whether to count the transactions of the TRANSACTIONS section, their
+                         list is the largest part of the status on busy servers
+    :return: a defaultdict(int) of the values
+    """
+    results = defaultdict(int)
+
+    for name, section in _sections(text):
+        if name not in SECTION_PARSERS or (name == 'TRANSACTIONS' and not transactions):
+            continue
+        pattern, handlers = SECTION_PARSERS[name]
+        match = pattern.match
+        next_handler = None
+
+        for line in section.splitlines():
+            line = line.strip()
+            if next_handler is not None:
+                handler, next_handler = next_handler, None
+            else:
+                matched = match(line)
+                if matched is None:
+                    continue
+                handler = handlers[matched.lastindex - 1]
+
+            try:
+                next_handler = handler(results, line)
+            except (ValueError, IndexError) as e:
+                log.warning("Can't parse result line %s: %s", line, e)
+
+    return results
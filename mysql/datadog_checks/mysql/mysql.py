@@ -21,6 +21,9 @@ except ImportError:
 # project
 from datadog_checks.checks import AgentCheck
 from datadog_checks.config import _is_affirmative
+from .connection_cache import DEFAULT_MAX_AGE, ConnectionCache
+from .innodb_status import parse_innodb_status
+from .query_scheduler import SCHEDULED_QUERIES, QueryScheduler
 
 GAUGE = "gauge"
 RATE = "rate"
@@ -284,14 +287,24 @@ class MySql(AgentCheck):
     def __init__(self, name, init_config, agentConfig, instances=None):
         AgentCheck.__init__(self, name, init_config, agentConfig, instances)
         self.mysql_version = {}
+        # host key -> whether the server is MariaDB, whether InnoDB is enabled on the server
+        self.is_mariadb = {}
+        self.innodb_enabled = {}
         self.qcache_stats = {}
+        # Connections kept across runs, by host key
+        self._connections = ConnectionCache(self.log)
+        # host key -> QueryScheduler
+        self.query_schedulers = defaultdict(QueryScheduler)
+
+    def stop(self):
+        self._connections.close()
 
     def get_library_versions(self):
         return {"pymysql": pymysql.__version__}
 
     def check(self, instance):
-        host, port, user, password, mysql_sock, defaults_file, tags, options, queries, ssl, connect_timeout = \
-            self._get_config(instance)
+        host, port, user, password, mysql_sock, defaults_file, tags, options, queries, ssl, connect_timeout, \
+            connection_max_age = self._get_config(instance)
 
         self._set_qcache_stats()
 
@@ -299,7 +312,7 @@ class MySql(AgentCheck):
             raise Exception("Mysql host and user are needed.")
 
         with self._connect(host, port, mysql_sock, user,
-                           password, defaults_file, ssl, connect_timeout, tags) as db:
+                           password, defaults_file, ssl, connect_timeout, tags, connection_max_age) as db:
             try:
                 # Metadata collection
                 self._collect_metadata(db, host)
@@ -327,9 +340,10 @@ class MySql(AgentCheck):
         queries = instance.get('queries', [])
         ssl = instance.get('ssl', {})
         connect_timeout = instance.get('connect_timeout', 10)
+        connection_max_age = float(instance.get('connection_max_age', DEFAULT_MAX_AGE))
 
         return (self.host, self.port, user, password, self.mysql_sock,
-                self.defaults_file, tags, options, queries, ssl, connect_timeout)
+                self.defaults_file, tags, options, queries, ssl, connect_timeout, connection_max_age)
 
     def _set_qcache_stats(self):
         host_key = self._get_host_key()
@@ -360,7 +374,8 @@ class MySql(AgentCheck):
         return hostkey
 
     @contextmanager
-    def _connect(self, host, port, mysql_sock, user, password, defaults_file, ssl, connect_timeout, tags):
+    def _connect(self, host, port, mysql_sock, user, password, defaults_file, ssl, connect_timeout, tags,
+                 connection_max_age):
         self.service_check_tags = [
             'server:%s' % (mysql_sock if mysql_sock != '' else host),
             'port:%s' % ('unix_socket' if port == 0 else port)
@@ -369,56 +384,96 @@ class MySql(AgentCheck):
         if tags is not None:
             self.service_check_tags.extend(tags)
 
-        db = None
-        try:
-            ssl = dict(ssl) if ssl else None
+        if defaults_file == '' and mysql_sock != '':
+            self.service_check_tags = [
+                'server:{0}'.format(mysql_sock),
+                'port:unix_socket'
+            ] + tags
 
-            if defaults_file != '':
-                db = pymysql.connect(
-                    read_default_file=defaults_file,
-                    ssl=ssl,
-                    connect_timeout=connect_timeout
-                )
-            elif mysql_sock != '':
-                self.service_check_tags = [
-                    'server:{0}'.format(mysql_sock),
-                    'port:unix_socket'
-                ] + tags
-                db = pymysql.connect(
-                    unix_socket=mysql_sock,
-                    user=user,
-                    passwd=password,
-                    connect_timeout=connect_timeout
-                )
-            elif port:
-                db = pymysql.connect(
-                    host=host,
-                    port=port,
-                    user=user,
-                    passwd=password,
-                    ssl=ssl,
-                    connect_timeout=connect_timeout
-                )
+        host_key = self._get_host_key()
+        params = {
+            'host': host,
+            'port': port,
+            'mysql_sock': mysql_sock,
+            'user': user,
+            'password': password,
+            'defaults_file': defaults_file,
+            'ssl': ssl,
+            'connect_timeout': connect_timeout,
+        }
+
+        try:
+            db, reused = self._connections.get(
+                host_key, params,
+                lambda: self._new_connection(host, port, mysql_sock, user, password, defaults_file, ssl,
+                                             connect_timeout),
+                connection_max_age
+            )
+            if reused:
+                self.log.debug("Reusing the connection to MySQL")
             else:
-                db = pymysql.connect(
-                    host=host,
-                    user=user,
-                    passwd=password,
-                    ssl=ssl,
-                    connect_timeout=connect_timeout
-                )
-            self.log.debug("Connected to MySQL")
+                self.log.debug("Connected to MySQL")
+                # the server may have been upgraded or replaced since the last connection
+                self._forget_server_info(host_key)
             self.service_check_tags = list(set(self.service_check_tags))
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.OK,
                                tags=self.service_check_tags)
+            self.gauge('datadog.agent.mysql.connection.reused', 1 if reused else 0, tags=tags)
             yield db
         except Exception:
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL,
                                tags=self.service_check_tags)
+            # the connection may be left in an unknown state, start over at the next run
+            self._connections.evict(host_key)
             raise
         finally:
-            if db:
-                db.close()
+            if connection_max_age <= 0:
+                self._connections.evict(host_key)
+
+    def _new_connection(self, host, port, mysql_sock, user, password, defaults_file, ssl, connect_timeout):
+        # The connection is kept across runs: without autocommit, the consistent snapshot of
+        # the first SELECT on an InnoDB table would be read by all the following runs
+        ssl = dict(ssl) if ssl else None
+
+        if defaults_file != '':
+            return pymysql.connect(
+                read_default_file=defaults_file,
+                ssl=ssl,
+                connect_timeout=connect_timeout,
+                autocommit=True
+            )
+        elif mysql_sock != '':
+            return pymysql.connect(
+                unix_socket=mysql_sock,
+                user=user,
+                passwd=password,
+                connect_timeout=connect_timeout,
+                autocommit=True
+            )
+        elif port:
+            return pymysql.connect(
+                host=host,
+                port=port,
+                user=user,
+                passwd=password,
+                ssl=ssl,
+                connect_timeout=connect_timeout,
+                autocommit=True
+            )
+        else:
+            return pymysql.connect(
+                host=host,
+                user=user,
+                passwd=password,
+                ssl=ssl,
+                connect_timeout=connect_timeout,
+                autocommit=True
+            )
+
+    def _forget_server_info(self, host_key):
+        self.mysql_version.pop(host_key, None)
+        self.is_mariadb.pop(host_key, None)
+        self.innodb_enabled.pop(host_key, None)
 
     def _collect_metrics(self, host, db, tags, options, queries):
 
@@ -430,7 +485,9 @@ class MySql(AgentCheck):
         results.update(self._get_stats_from_variables(db))
 
         if (not _is_affirmative(options.get('disable_innodb_metrics', False)) and self._is_innodb_engine_enabled(db)):
-            results.update(self._get_stats_from_innodb_status(db))
+            # The transactions are only counted for the extra metrics
+            extra_innodb_metrics = _is_affirmative(options.get('extra_innodb_metrics', False))
+            results.update(self._get_stats_from_innodb_status(db, transactions=extra_innodb_metrics))
 
             innodb_keys = [
                 'Innodb_page_size',
@@ -474,7 +531,7 @@ class MySql(AgentCheck):
             except (KeyError, TypeError) as e:
                 self.log.error("Not all InnoDB buffer pool metrics are available, unable to compute: {0}".format(e))
 
-            if _is_affirmative(options.get('extra_innodb_metrics', False)):
+            if extra_innodb_metrics:
                 self.log.debug("Collecting Extra Innodb Metrics")
                 metrics.update(OPTIONAL_INNODB_VARS)
 
@@ -523,13 +580,16 @@ class MySql(AgentCheck):
         if _is_affirmative(options.get('extra_performance_metrics', False)) and above_560 and \
                 performance_schema_enabled:
             # report avg query response time per schema to Datadog
-            results['perf_digest_95th_percentile_avg_us'] = self._get_query_exec_time_95th_us(db)
-            results['query_run_time_avg'] = self._query_exec_time_per_schema(db)
+            results['perf_digest_95th_percentile_avg_us'] = self._run_scheduled_query(
+                'exec_time_95th', self._get_query_exec_time_95th_us, db, host, options, tags)
+            results['query_run_time_avg'] = self._run_scheduled_query(
+                'exec_time_per_schema', self._query_exec_time_per_schema, db, host, options, tags)
             metrics.update(PERFORMANCE_VARS)
 
         if _is_affirmative(options.get('schema_size_metrics', False)):
             # report avg query response time per schema to Datadog
-            results['information_schema_size'] = self._query_size_per_schema(db)
+            results['information_schema_size'] = self._run_scheduled_query(
+                'schema_size', self._query_size_per_schema, db, host, options, tags)
             metrics.update(SCHEMA_VARS)
 
         if _is_affirmative(options.get('replication', False)):
@@ -688,11 +748,16 @@ class MySql(AgentCheck):
             return version
 
     def _get_is_mariadb(self, db, host):
+        hostkey = self._get_host_key()
+        if hostkey in self.is_mariadb:
+            return self.is_mariadb[hostkey]
+
         with closing(db.cursor()) as cursor:
             cursor.execute('SELECT VERSION() LIKE "%MariaDB%"')
             result = cursor.fetchone()
 
-            return result[0] == 1
+            self.is_mariadb[hostkey] = result[0] == 1
+            return self.is_mariadb[hostkey]
 
     def _collect_all_scalars(self, key, dictionary):
         if key not in dictionary or dictionary[key] is None:
@@ -865,6 +930,10 @@ class MySql(AgentCheck):
         # Whether InnoDB engine is available or not can be found out either
         # from the output of SHOW ENGINES or from information_schema.ENGINES
         # table. Later is choosen because that involves no string parsing.
+        hostkey = self._get_host_key()
+        if hostkey in self.innodb_enabled:
+            return self.innodb_enabled[hostkey]
+
         try:
             with closing(db.cursor()) as cursor:
                 cursor.execute(
@@ -872,7 +941,8 @@ class MySql(AgentCheck):
                     support != 'no' and support != 'disabled'"
                 )
 
-                return (cursor.rowcount > 0)
+                self.innodb_enabled[hostkey] = cursor.rowcount > 0
+                return self.innodb_enabled[hostkey]
 
         except (pymysql.err.InternalError, pymysql.err.OperationalError, pymysql.err.NotSupportedError) as e:
             self.warning("Possibly innodb stats unavailable - error querying engines table: %s" % str(e))
@@ -944,10 +1014,7 @@ class MySql(AgentCheck):
             self.warning("Privileges error accessing the process tables (must grant PROCESS): %s" % str(e))
             return {}
 
-    def _are_values_numeric(self, array):
-        return all([v.isdigit() for v in array])
-
-    def _get_stats_from_innodb_status(self, db):
+    def _get_stats_from_innodb_status(self, db, transactions=True):
         # There are a number of important InnoDB metrics that are reported in
         # InnoDB status but are not otherwise present as part of the STATUS
         # variables in MySQL. Majority of these metrics are reported though
@@ -972,288 +1039,7 @@ class MySql(AgentCheck):
         innodb_status = cursor.fetchone()
         innodb_status_text = innodb_status[2]
 
-        results = defaultdict(int)
-
-        # Here we now parse InnoDB STATUS one line at a time
-        # This is heavily inspired by the Percona monitoring plugins work
-        txn_seen = False
-        prev_line = ''
-        # Only return aggregated buffer pool metrics
-        buffer_id = -1
-        for line in innodb_status_text.splitlines():
-            line = line.strip()
-            row = re.split(" +", line)
-            row = [item.strip(',') for item in row]
-            row = [item.strip(';') for item in row]
-            row = [item.strip('[') for item in row]
-            row = [item.strip(']') for item in row]
-
-            if line.startswith('---BUFFER POOL'):
-                buffer_id = long(row[2])
-
-            # SEMAPHORES
-            if line.find('Mutex spin waits') == 0:
-                # Mutex spin waits 79626940, rounds 157459864, OS waits 698719
-                # Mutex spin waits 0, rounds 247280272495, OS waits 316513438
-                results['Innodb_mutex_spin_waits'] = long(row[3])
-                results['Innodb_mutex_spin_rounds'] = long(row[5])
-                results['Innodb_mutex_os_waits'] = long(row[8])
-            elif line.find('RW-shared spins') == 0 and line.find(';') > 0:
-                # RW-shared spins 3859028, OS waits 2100750; RW-excl spins
-                # 4641946, OS waits 1530310
-                results['Innodb_s_lock_spin_waits'] = long(row[2])
-                results['Innodb_x_lock_spin_waits'] = long(row[8])
-                results['Innodb_s_lock_os_waits'] = long(row[5])
-                results['Innodb_x_lock_os_waits'] = long(row[11])
-            elif line.find('RW-shared spins') == 0 and line.find('; RW-excl spins') == -1:
-                # Post 5.5.17 SHOW ENGINE INNODB STATUS syntax
-                # RW-shared spins 604733, rounds 8107431, OS waits 241268
-                results['Innodb_s_lock_spin_waits'] = long(row[2])
-                results['Innodb_s_lock_spin_rounds'] = long(row[4])
-                results['Innodb_s_lock_os_waits'] = long(row[7])
-            elif line.find('RW-excl spins') == 0:
-                # Post 5.5.17 SHOW ENGINE INNODB STATUS syntax
-                # RW-excl spins 604733, rounds 8107431, OS waits 241268
-                results['Innodb_x_lock_spin_waits'] = long(row[2])
-                results['Innodb_x_lock_spin_rounds'] = long(row[4])
-                results['Innodb_x_lock_os_waits'] = long(row[7])
-            elif line.find('seconds the semaphore:') > 0:
-                # --Thread 907205 has waited at handler/ha_innodb.cc line 7156 for 1.00 seconds the semaphore:
-                results['Innodb_semaphore_waits'] += 1
-                results[
-                    'Innodb_semaphore_wait_time'] += long(float(row[9])) * 1000
-
-            # TRANSACTIONS
-            elif line.find('Trx id counter') == 0:
-                # The beginning of the TRANSACTIONS section: start counting
-                # transactions
-                # Trx id counter 0 1170664159
-                # Trx id counter 861B144C
-                txn_seen = True
-            elif line.find('History list length') == 0:
-                # History list length 132
-                results['Innodb_history_list_length'] = long(row[3])
-            elif txn_seen and line.find('---TRANSACTION') == 0:
-                # ---TRANSACTION 0, not started, process no 13510, OS thread id 1170446656
-                results['Innodb_current_transactions'] += 1
-                if line.find('ACTIVE') > 0:
-                    results['Innodb_active_transactions'] += 1
-            elif txn_seen and line.find('------- TRX HAS BEEN') == 0:
-                # ------- TRX HAS BEEN WAITING 32 SEC FOR THIS LOCK TO BE GRANTED:
-                results['Innodb_row_lock_time'] += long(row[5]) * 1000
-            elif line.find('read views open inside InnoDB') > 0:
-                # 1 read views open inside InnoDB
-                results['Innodb_read_views'] = long(row[0])
-            elif line.find('mysql tables in use') == 0:
-                # mysql tables in use 2, locked 2
-                results['Innodb_tables_in_use'] += long(row[4])
-                results['Innodb_locked_tables'] += long(row[6])
-            elif txn_seen and line.find('lock struct(s)') > 0:
-                # 23 lock struct(s), heap size 3024, undo log entries 27
-                # LOCK WAIT 12 lock struct(s), heap size 3024, undo log entries 5
-                # LOCK WAIT 2 lock struct(s), heap size 368
-                if line.find('LOCK WAIT') == 0:
-                    results['Innodb_lock_structs'] += long(row[2])
-                    results['Innodb_locked_transactions'] += 1
-                elif line.find('ROLLING BACK') == 0:
-                    # ROLLING BACK 127539 lock struct(s), heap size 15201832,
-                    # 4411492 row lock(s), undo log entries 1042488
-                    results['Innodb_lock_structs'] += long(row[2])
-                else:
-                    results['Innodb_lock_structs'] += long(row[0])
-
-            # FILE I/O
-            elif line.find(' OS file reads, ') > 0:
-                # 8782182 OS file reads, 15635445 OS file writes, 947800 OS
-                # fsyncs
-                results['Innodb_os_file_reads'] = long(row[0])
-                results['Innodb_os_file_writes'] = long(row[4])
-                results['Innodb_os_file_fsyncs'] = long(row[8])
-            elif line.find('Pending normal aio reads:') == 0:
-                try:
-                    if len(row) == 8:
-                        # (len(row) == 8)  Pending normal aio reads: 0, aio writes: 0,
-                        results['Innodb_pending_normal_aio_reads'] = long(row[4])
-                        results['Innodb_pending_normal_aio_writes'] = long(row[7])
-                    elif len(row) == 14:
-                        # (len(row) == 14) Pending normal aio reads: 0 [0, 0] , aio writes: 0 [0, 0] ,
-                        results['Innodb_pending_normal_aio_reads'] = long(row[4])
-                        results['Innodb_pending_normal_aio_writes'] = long(row[10])
-                    elif len(row) == 16:
-                        # (len(row) == 16) Pending normal aio reads: [0, 0, 0, 0] , aio writes: [0, 0, 0, 0] ,
-                        if self._are_values_numeric(row[4:8]) and self._are_values_numeric(row[11:15]):
-                            results['Innodb_pending_normal_aio_reads'] = (long(row[4]) + long(row[5]) +
-                                                                          long(row[6]) + long(row[7]))
-                            results['Innodb_pending_normal_aio_writes'] = (long(row[11]) + long(row[12]) +
-                                                                           long(row[13]) + long(row[14]))
-
-                        # (len(row) == 16) Pending normal aio reads: 0 [0, 0, 0, 0] , aio writes: 0 [0, 0] ,
-                        elif self._are_values_numeric(row[4:9]) and self._are_values_numeric(row[12:15]):
-                            results['Innodb_pending_normal_aio_reads'] = long(row[4])
-                            results['Innodb_pending_normal_aio_writes'] = long(row[12])
-                        else:
-                            self.log.warning("Can't parse result line %s" % line)
-                    elif len(row) == 18:
-                        # (len(row) == 18) Pending normal aio reads: 0 [0, 0, 0, 0] , aio writes: 0 [0, 0, 0, 0] ,
-                        results['Innodb_pending_normal_aio_reads'] = long(row[4])
-                        results['Innodb_pending_normal_aio_writes'] = long(row[12])
-                    elif len(row) == 22:
-                        # (len(row) == 22)
-                        # Pending normal aio reads: 0 [0, 0, 0, 0, 0, 0, 0, 0] , aio writes: 0 [0, 0, 0, 0] ,
-                        results['Innodb_pending_normal_aio_reads'] = long(row[4])
-                        results['Innodb_pending_normal_aio_writes'] = long(row[16])
-                except ValueError as e:
-                    self.log.warning("Can't parse result line %s: %s", line, e)
-            elif line.find('ibuf aio reads') == 0:
-                #  ibuf aio reads: 0, log i/o's: 0, sync i/o's: 0
-                #  or ibuf aio reads:, log i/o's:, sync i/o's:
-                if len(row) == 10:
-                    results['Innodb_pending_ibuf_aio_reads'] = long(row[3])
-                    results['Innodb_pending_aio_log_ios'] = long(row[6])
-                    results['Innodb_pending_aio_sync_ios'] = long(row[9])
-                elif len(row) == 7:
-                    results['Innodb_pending_ibuf_aio_reads'] = 0
-                    results['Innodb_pending_aio_log_ios'] = 0
-                    results['Innodb_pending_aio_sync_ios'] = 0
-            elif line.find('Pending flushes (fsync)') == 0:
-                # Pending flushes (fsync) log: 0; buffer pool: 0
-                results['Innodb_pending_log_flushes'] = long(row[4])
-                results['Innodb_pending_buffer_pool_flushes'] = long(row[7])
-
-            # INSERT BUFFER AND ADAPTIVE HASH INDEX
-            elif line.find('Ibuf for space 0: size ') == 0:
-                # Older InnoDB code seemed to be ready for an ibuf per tablespace.  It
-                # had two lines in the output.  Newer has just one line, see below.
-                # Ibuf for space 0: size 1, free list len 887, seg size 889, is not empty
-                # Ibuf for space 0: size 1, free list len 887, seg size 889,
-                results['Innodb_ibuf_size'] = long(row[5])
-                results['Innodb_ibuf_free_list'] = long(row[9])
-                results['Innodb_ibuf_segment_size'] = long(row[12])
-            elif line.find('Ibuf: size ') == 0:
-                # Ibuf: size 1, free list len 4634, seg size 4636,
-                results['Innodb_ibuf_size'] = long(row[2])
-                results['Innodb_ibuf_free_list'] = long(row[6])
-                results['Innodb_ibuf_segment_size'] = long(row[9])
-
-                if line.find('merges') > -1:
-                    results['Innodb_ibuf_merges'] = long(row[10])
-            elif line.find(', delete mark ') > 0 and prev_line.find('merged operations:') == 0:
-                # Output of show engine innodb status has changed in 5.5
-                # merged operations:
-                # insert 593983, delete mark 387006, delete 73092
-                results['Innodb_ibuf_merged_inserts'] = long(row[1])
-                results['Innodb_ibuf_merged_delete_marks'] = long(row[4])
-                results['Innodb_ibuf_merged_deletes'] = long(row[6])
-                results['Innodb_ibuf_merged'] = results['Innodb_ibuf_merged_inserts'] + results[
-                    'Innodb_ibuf_merged_delete_marks'] + results['Innodb_ibuf_merged_deletes']
-            elif line.find(' merged recs, ') > 0:
-                # 19817685 inserts, 19817684 merged recs, 3552620 merges
-                results['Innodb_ibuf_merged_inserts'] = long(row[0])
-                results['Innodb_ibuf_merged'] = long(row[2])
-                results['Innodb_ibuf_merges'] = long(row[5])
-            elif line.find('Hash table size ') == 0:
-                # In some versions of InnoDB, the used cells is omitted.
-                # Hash table size 4425293, used cells 4229064, ....
-                # Hash table size 57374437, node heap has 72964 buffer(s) <--
-                # no used cells
-                results['Innodb_hash_index_cells_total'] = long(row[3])
-                results['Innodb_hash_index_cells_used'] = long(
-                    row[6]) if line.find('used cells') > 0 else 0
-
-            # LOG
-            elif line.find(" log i/o's done, ") > 0:
-                # 3430041 log i/o's done, 17.44 log i/o's/second
-                # 520835887 log i/o's done, 17.28 log i/o's/second, 518724686
-                # syncs, 2980893 checkpoints
-                results['Innodb_log_writes'] = long(row[0])
-            elif line.find(" pending log writes, ") > 0:
-                # 0 pending log writes, 0 pending chkp writes
-                results['Innodb_pending_log_writes'] = long(row[0])
-                results['Innodb_pending_checkpoint_writes'] = long(row[4])
-            elif line.find("Log sequence number") == 0:
-                # This number is NOT printed in hex in InnoDB plugin.
-                # Log sequence number 272588624
-                results['Innodb_lsn_current'] = long(row[3])
-            elif line.find("Log flushed up to") == 0:
-                # This number is NOT printed in hex in InnoDB plugin.
-                # Log flushed up to   272588624
-                results['Innodb_lsn_flushed'] = long(row[4])
-            elif line.find("Last checkpoint at") == 0:
-                # Last checkpoint at  272588624
-                results['Innodb_lsn_last_checkpoint'] = long(row[3])
-
-            # BUFFER POOL AND MEMORY
-            elif line.find("Total memory allocated") == 0 and line.find("in additional pool allocated") > 0:
-                # Total memory allocated 29642194944; in additional pool allocated 0
-                # Total memory allocated by read views 96
-                results['Innodb_mem_total'] = long(row[3])
-                results['Innodb_mem_additional_pool'] = long(row[8])
-            elif line.find('Adaptive hash index ') == 0:
-                #   Adaptive hash index 1538240664     (186998824 + 1351241840)
-                results['Innodb_mem_adaptive_hash'] = long(row[3])
-            elif line.find('Page hash           ') == 0:
-                #   Page hash           11688584
-                results['Innodb_mem_page_hash'] = long(row[2])
-            elif line.find('Dictionary cache    ') == 0:
-                #   Dictionary cache    145525560      (140250984 + 5274576)
-                results['Innodb_mem_dictionary'] = long(row[2])
-            elif line.find('File system         ') == 0:
-                #   File system         313848         (82672 + 231176)
-                results['Innodb_mem_file_system'] = long(row[2])
-            elif line.find('Lock system         ') == 0:
-                #   Lock system         29232616       (29219368 + 13248)
-                results['Innodb_mem_lock_system'] = long(row[2])
-            elif line.find('Recovery system     ') == 0:
-                #   Recovery system     0      (0 + 0)
-                results['Innodb_mem_recovery_system'] = long(row[2])
-            elif line.find('Threads             ') == 0:
-                #   Threads             409336         (406936 + 2400)
-                results['Innodb_mem_thread_hash'] = long(row[1])
-            elif line.find("Buffer pool size ") == 0:
-                # The " " after size is necessary to avoid matching the wrong line:
-                # Buffer pool size        1769471
-                # Buffer pool size, bytes 28991012864
-                if buffer_id == -1:
-                    results['Innodb_buffer_pool_pages_total'] = long(row[3])
-            elif line.find("Free buffers") == 0:
-                # Free buffers            0
-                if buffer_id == -1:
-                    results['Innodb_buffer_pool_pages_free'] = long(row[2])
-            elif line.find("Database pages") == 0:
-                # Database pages          1696503
-                if buffer_id == -1:
-                    results['Innodb_buffer_pool_pages_data'] = long(row[2])
-
-            elif line.find("Modified db pages") == 0:
-                # Modified db pages       160602
-                if buffer_id == -1:
-                    results['Innodb_buffer_pool_pages_dirty'] = long(row[3])
-            elif line.find("Pages read ahead") == 0:
-                # Must do this BEFORE the next test, otherwise it'll get fooled by this
-                # line from the new plugin:
-                # Pages read ahead 0.00/s, evicted without access 0.06/s
-                pass
-            elif line.find("Pages read") == 0:
-                # Pages read 15240822, created 1770238, written 21705836
-                if buffer_id == -1:
-                    results['Innodb_pages_read'] = long(row[2])
-                    results['Innodb_pages_created'] = long(row[4])
-                    results['Innodb_pages_written'] = long(row[6])
-
-            # ROW OPERATIONS
-            elif line.find('Number of rows inserted') == 0:
-                # Number of rows inserted 50678311, updated 66425915, deleted
-                # 20605903, read 454561562
-                results['Innodb_rows_inserted'] = long(row[4])
-                results['Innodb_rows_updated'] = long(row[6])
-                results['Innodb_rows_deleted'] = long(row[8])
-                results['Innodb_rows_read'] = long(row[10])
-            elif line.find(" queries inside InnoDB, ") > 0:
-                # 0 queries inside InnoDB, 0 queries in queue
-                results['Innodb_queries_inside'] = long(row[0])
-                results['Innodb_queries_queued'] = long(row[4])
-
-            prev_line = line
+        results = parse_innodb_status(innodb_status_text, self.log, transactions)
 
         # We need to calculate this metric separately
         try:
@@ -1273,24 +1059,60 @@ class MySql(AgentCheck):
         enabled = self._collect_string(var, results)
         return (enabled and enabled.lower().strip() == 'on')
 
-    def _get_query_exec_time_95th_us(self, db):
+    def _run_scheduled_query(self, name, query, db, host, options, tags):
+        """
+        Return the last result of one of the `SCHEDULED_QUERIES`, run by
+        `query(db, host, timeout)` once its min interval has passed.
+        """
+        min_interval, timeout = SCHEDULED_QUERIES[name]
+        min_interval = float(options.get('{0}_min_interval'.format(name), min_interval))
+        timeout = float(options.get('{0}_timeout'.format(name), timeout))
+
+        scheduler = self.query_schedulers[self._get_host_key()]
+        result, age = scheduler.run(name, min_interval, lambda: query(db, host, timeout))
+        if age is not None:
+            self.gauge('datadog.agent.mysql.cached_query.age', age, tags=tags + ['query:{0}'.format(name)])
+        return result
+
+    def _with_timeout(self, db, host, query, timeout):
+        """
+        Return the SELECT `query` stopped by the server after `timeout` seconds,
+        on the versions supporting it: MySQL >= 5.7.8 and MariaDB >= 10.1.1
+        """
+        if not timeout:
+            return query
+        if self._get_is_mariadb(db, host):
+            if self._version_compatible(db, host, (10, 1, 1)):
+                return "SET STATEMENT max_statement_time={0} FOR {1}".format(timeout, query)
+        elif self._version_compatible(db, host, (5, 7, 8)):
+            return query.replace('SELECT', 'SELECT /*+ MAX_EXECUTION_TIME({0}) */'.format(int(timeout * 1000)), 1)
+        return query
+
+    def _get_query_exec_time_95th_us(self, db, host, timeout=0):
         # Fetches the 95th percentile query execution time and returns the value
-        # in microseconds
-        sql_95th_percentile = """SELECT `avg_us`, `ro` as `percentile` FROM
-            (SELECT `avg_us`, @rownum := @rownum + 1 as `ro` FROM
-                (SELECT ROUND(avg_timer_wait / 1000000) as `avg_us`
-                    FROM performance_schema.events_statements_summary_by_digest
-                    ORDER BY `avg_us` ASC) p,
-                (SELECT @rownum := 0) r) q
-            WHERE q.`ro` > ROUND(.95*@rownum)
-            ORDER BY `percentile` ASC
-            LIMIT 1"""
+        # in microseconds.
+        # The digests are counted first, so that the server only has to keep the
+        # slowest 5% of them to find the percentile instead of sorting them all.
+        sql_digest_count = """SELECT COUNT(*)
+            FROM performance_schema.events_statements_summary_by_digest"""
+
+        sql_95th_percentile = """SELECT ROUND(avg_timer_wait / 1000000) as `avg_us`
+            FROM performance_schema.events_statements_summary_by_digest
+            ORDER BY avg_timer_wait DESC
+            LIMIT 1 OFFSET %s"""
 
         try:
             with closing(db.cursor()) as cursor:
-                cursor.execute(sql_95th_percentile)
+                cursor.execute(sql_digest_count)
+                digest_count = cursor.fetchone()[0]
 
-                if cursor.rowcount < 1:
+                # The first digest past the ROUND(.95 * count) fastest ones
+                percentile_index = (95 * digest_count + 50) // 100
+                if percentile_index < digest_count:
+                    cursor.execute(self._with_timeout(db, host, sql_95th_percentile, timeout),
+                                   (digest_count - 1 - percentile_index,))
+
+                if percentile_index >= digest_count or cursor.rowcount < 1:
                     self.warning("Failed to fetch records from the perf schema\
                                  'events_statements_summary_by_digest' table.")
                     return None
@@ -1303,7 +1125,7 @@ class MySql(AgentCheck):
             self.warning("95th percentile performance metrics unavailable at this time: %s" % str(e))
             return None
 
-    def _query_exec_time_per_schema(self, db):
+    def _query_exec_time_per_schema(self, db, host, timeout=0):
         # Fetches the avg query execution time per schema and returns the
         # value in microseconds
 
@@ -1314,7 +1136,7 @@ class MySql(AgentCheck):
 
         try:
             with closing(db.cursor()) as cursor:
-                cursor.execute(sql_avg_query_run_time)
+                cursor.execute(self._with_timeout(db, host, sql_avg_query_run_time, timeout))
 
                 if cursor.rowcount < 1:
                     self.warning("Failed to fetch records from the perf schema \
@@ -1334,7 +1156,7 @@ class MySql(AgentCheck):
             self.warning("Avg exec time performance metrics unavailable at this time: %s" % str(e))
             return None
 
-    def _query_size_per_schema(self, db):
+    def _query_size_per_schema(self, db, host, timeout=0):
         # Fetches the avg query execution time per schema and returns the
         # value in microseconds
 
@@ -1347,7 +1169,7 @@ class MySql(AgentCheck):
 
         try:
             with closing(db.cursor()) as cursor:
-                cursor.execute(sql_query_schema_size)
+                cursor.execute(self._with_timeout(db, host, sql_query_schema_size, timeout))
 
                 if cursor.rowcount < 1:
                     self.warning("Failed to fetch records from the information schema 'tables' table.")
@@ -1365,7 +1187,7 @@ class MySql(AgentCheck):
         except (pymysql.err.InternalError, pymysql.err.OperationalError) as e:
             self.warning("Avg exec time performance metrics unavailable at this time: %s" % str(e))
 
-        return {}
+        return None
 
     def _compute_synthetic_results(self, results):
         if ('Qcache_hits' in results) and ('Qcache_inserts' in results) and ('Qcache_not_cached' in results):
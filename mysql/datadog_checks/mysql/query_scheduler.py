@@ -0,0 +1,46 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import time
+
+# The expensive queries: min interval between two runs and timeout, in seconds.
+# Both can be set with the `<name>_min_interval` and `<name>_timeout` options.
+SCHEDULED_QUERIES = {
+    # SUM of the size of all the tables of information_schema.tables
+    'schema_size': (600, 30),
+    # 95th percentile of the digests of performance_schema.events_statements_summary_by_digest
+    'exec_time_95th': (60, 10),
+    # avg of the digests of performance_schema.events_statements_summary_by_digest by schema
+    'exec_time_per_schema': (60, 10),
+}
+
+
+class QueryScheduler(object):
+    """
+    Last results of the expensive queries of an instance. A query is run again once its min
+    interval has passed since its previous run, its last result is reused in between.
+    """
+    def __init__(self):
+        # query name -> (time of the last run, time of the last result, last result)
+        self._queries = {}
+
+    def run(self, name, min_interval, query):
+        """
+        Return the result of the query `name` and its age in seconds, both None without a result yet.
+
+        `query()` is only called if it wasn't in the last `min_interval` seconds. When it fails,
+        i.e. returns None, the previous result is kept and it isn't called again before
+        `min_interval` either.
+        """
+        now = time.time()
+        last_run, collected_at, result = self._queries.get(name, (None, None, None))
+
+        if last_run is None or now - last_run >= min_interval:
+            new_result = query()
+            if new_result is not None:
+                collected_at, result = now, new_result
+            self._queries[name] = (now, collected_at, result)
+
+        if collected_at is None:
+            return None, None
+        return result, time.time() - collected_at
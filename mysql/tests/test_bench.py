@@ -0,0 +1,74 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import os
+
+import mock
+import pytest
+
+from datadog_checks.mysql.innodb_status import parse_innodb_status
+
+from . import common
+
+TRANSACTION = """---TRANSACTION {0}, ACTIVE 12 sec starting index read
+mysql tables in use 1, locked 1
+LOCK WAIT 2 lock struct(s), heap size 1136, 1 row lock(s)
+MySQL thread id {0}, OS thread handle 139828433094400, query id 1251002 10.0.3.17 app updating
+UPDATE accounts SET balance = 0 WHERE id = {0}
+------- TRX HAS BEEN WAITING 12 SEC FOR THIS LOCK TO BE GRANTED:
+RECORD LOCKS space id 58 page no 3 n bits 72 index PRIMARY of table `shop`.`accounts` trx id {0} lock_mode X
+Record lock, heap no 4 PHYSICAL RECORD: n_fields 4; compact format; info bits 0
+ 0: len 4; hex 80000003; asc     ;;
+
+------------------
+"""
+
+BUFFER_POOL = """---BUFFER POOL {0}
+Buffer pool size   8191
+Free buffers       1024
+Database pages     7041
+Old database pages 2579
+Modified db pages  12
+Pending reads      0
+Pending writes: LRU 0, flush list 0, single page 0
+Pages made young 1523, not young 18844
+0.00 youngs/s, 0.00 non-youngs/s
+Pages read 1220, created 6512, written 58830
+0.00 reads/s, 0.04 creates/s, 0.62 writes/s
+Buffer pool hit rate 1000 / 1000, young-making rate 0 / 1000 not 0 / 1000
+Pages read ahead 0.00/s, evicted without access 0.00/s, Random read ahead 0.00/s
+LRU len: 7041, unzip_LRU len: 0
+I/O sum[0]:cur[0], unzip sum[0]:cur[0]
+"""
+
+
+def busy_status(transactions, buffer_pools):
+    """
+    The status of the MySQL 5.7 fixture, with more transactions and buffer pools
+    """
+    with open(os.path.join(common.HERE, 'fixtures', 'innodb_status', 'mysql-5.7.txt')) as f:
+        text = f.read()
+
+    transaction_list = 'LIST OF TRANSACTIONS FOR EACH SESSION:\n'
+    text = text.replace(
+        transaction_list,
+        transaction_list + ''.join(TRANSACTION.format(i) for i in xrange(transactions))
+    )
+    row_operations = '--------------\nROW OPERATIONS\n'
+    return text.replace(
+        row_operations,
+        '----------------------\nINDIVIDUAL BUFFER POOL INFO\n----------------------\n' +
+        ''.join(BUFFER_POOL.format(i) for i in xrange(buffer_pools)) +
+        row_operations
+    )
+
+
+@pytest.mark.parametrize('transactions', [True, False], ids=['transactions', 'no_transactions'])
+def test_parse_innodb_status(benchmark, transactions):
+    text = busy_status(5000, 64)
+    benchmark.extra_info['status_bytes'] = len(text)
+
+    results = benchmark(parse_innodb_status, text, mock.MagicMock(), transactions)
+
+    assert results['Innodb_buffer_pool_pages_total'] == 8191
+    assert results.get('Innodb_current_transactions', 0) == (5004 if transactions else 0)
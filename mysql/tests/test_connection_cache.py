@@ -0,0 +1,86 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import mock
+import pytest
+
+from datadog_checks.mysql.connection_cache import ConnectionCache
+
+pytestmark = pytest.mark.unit
+
+PARAMS = {'host': 'localhost', 'port': 3306, 'user': 'dog', 'password': 'dog'}
+
+
+@pytest.fixture
+def now():
+    with mock.patch('datadog_checks.mysql.connection_cache.time.time') as time:
+        time.return_value = 1000.0
+        yield time
+
+
+@pytest.fixture
+def cache():
+    return ConnectionCache(mock.MagicMock())
+
+
+def test_connection_is_reused(cache, now):
+    connect = mock.MagicMock()
+
+    db, reused = cache.get('localhost:3306', PARAMS, connect, 3600)
+    assert not reused
+    now.return_value += 15
+    assert cache.get('localhost:3306', PARAMS, connect, 3600) == (db, True)
+
+    assert connect.call_count == 1
+    db.ping.assert_called_once_with(reconnect=False)
+    assert db.close.call_count == 0
+
+
+def test_lost_connection_is_replaced(cache, now):
+    db, _ = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+    db.ping.side_effect = Exception('(2006, MySQL server has gone away)')
+    db.close.side_effect = Exception('Already closed')
+
+    new_db, reused = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+
+    assert not reused
+    assert new_db is not db
+    db.close.assert_called_once_with()
+
+
+def test_old_connection_is_replaced(cache, now):
+    db, _ = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+    now.return_value += 3600
+
+    new_db, reused = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+
+    assert not reused
+    assert db.ping.call_count == 0
+    db.close.assert_called_once_with()
+
+
+def test_connection_is_replaced_when_its_params_change(cache, now):
+    db, _ = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+
+    _, reused = cache.get('localhost:3306', dict(PARAMS, password='new'), mock.MagicMock, 3600)
+
+    assert not reused
+    db.close.assert_called_once_with()
+
+
+def test_failed_connection_is_not_cached(cache, now):
+    with pytest.raises(Exception):
+        cache.get('localhost:3306', PARAMS, mock.MagicMock(side_effect=Exception('(1045, Access denied)')), 3600)
+
+    assert len(cache) == 0
+
+
+def test_close(cache, now):
+    first, _ = cache.get('localhost:3306', PARAMS, mock.MagicMock, 3600)
+    second, _ = cache.get('/var/run/mysqld.sock', PARAMS, mock.MagicMock, 3600)
+
+    cache.close()
+
+    assert len(cache) == 0
+    first.close.assert_called_once_with()
+    second.close.assert_called_once_with()
@@ -0,0 +1,198 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import json
+import os
+
+import mock
+import pytest
+
+from datadog_checks.mysql import MySql
+from datadog_checks.mysql.innodb_status import parse_innodb_status
+
+from . import common
+
+FIXTURES = os.path.join(common.HERE, 'fixtures', 'innodb_status')
+VERSIONS = ['mysql-5.5', 'mysql-5.6', 'mysql-5.7', 'mysql-8.0', 'percona-5.6', 'mariadb-10.1']
+TRANSACTION_METRICS = {
+    'Innodb_active_transactions',
+    'Innodb_current_transactions',
+    'Innodb_history_list_length',
+    'Innodb_lock_structs',
+    'Innodb_locked_tables',
+    'Innodb_locked_transactions',
+    'Innodb_tables_in_use',
+}
+
+pytestmark = pytest.mark.unit
+
+
+def read_fixture(version):
+    with open(os.path.join(FIXTURES, '{}.txt'.format(version))) as f:
+        text = f.read()
+    with open(os.path.join(FIXTURES, '{}.json'.format(version))) as f:
+        expected = json.load(f)
+    return text, expected
+
+
+def section(name, *lines):
+    return '\n'.join(['-' * len(name), name, '-' * len(name)] + list(lines) + [''])
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_parse_fixtures(version):
+    text, expected = read_fixture(version)
+    log = mock.MagicMock()
+
+    assert parse_innodb_status(text, log) == expected
+    assert log.warning.call_count == 0
+
+
+@pytest.mark.parametrize('version', VERSIONS)
+def test_skip_transactions(version):
+    text, expected = read_fixture(version)
+
+    results = parse_innodb_status(text, mock.MagicMock(), transactions=False)
+
+    assert TRANSACTION_METRICS.isdisjoint(results)
+    assert results == {key: value for key, value in expected.iteritems() if key not in TRANSACTION_METRICS}
+
+
+def test_only_the_transactions_section_is_counted():
+    # the transactions of the LATEST DETECTED DEADLOCK section are gone
+    text, _ = read_fixture('mysql-5.7')
+    assert text.count('mysql tables in use 1') == 3
+
+    results = parse_innodb_status(text, mock.MagicMock())
+    assert results['Innodb_tables_in_use'] == 1
+    assert results['Innodb_locked_transactions'] == 1
+
+
+def test_individual_buffer_pools_are_skipped():
+    text, _ = read_fixture('mysql-8.0')
+    results = parse_innodb_status(text, mock.MagicMock())
+    assert results['Innodb_buffer_pool_pages_total'] == 16382
+    assert results['Innodb_pages_read'] == 941
+
+
+@pytest.mark.parametrize('line, reads, writes', [
+    ('Pending normal aio reads: 1, aio writes: 2,', 1, 2),
+    ('Pending normal aio reads: 1 [1, 0] , aio writes: 2 [0, 2] ,', 1, 2),
+    ('Pending normal aio reads: [0, 1, 0, 2] , aio writes: [3, 0, 0, 1] ,', 3, 4),
+    ('Pending normal aio reads: 1 [0, 1, 0, 0] , aio writes: 2 [2, 0] ,', 1, 2),
+    ('Pending normal aio reads: 1 [0, 1, 0, 0] , aio writes: 2 [0, 2, 0, 0] ,', 1, 2),
+    ('Pending normal aio reads: 1 [0, 0, 1, 0, 0, 0, 0, 0] , aio writes: 2 [0, 2, 0, 0] ,', 1, 2),
+])
+def test_pending_normal_aio(line, reads, writes):
+    results = parse_innodb_status(section('FILE I/O', line), mock.MagicMock())
+    assert results['Innodb_pending_normal_aio_reads'] == reads
+    assert results['Innodb_pending_normal_aio_writes'] == writes
+
+
+def test_older_formats():
+    text = (
+        section(
+            'SEMAPHORES',
+            'RW-shared spins 3859028, OS waits 2100750; RW-excl spins 4641946, OS waits 1530310',
+        ) +
+        section(
+            'INSERT BUFFER AND ADAPTIVE HASH INDEX',
+            'Ibuf for space 0: size 1, free list len 887, seg size 889, is not empty',
+            '19817685 inserts, 19817684 merged recs, 3552620 merges',
+            'Hash table size 4425293, used cells 4229064, node heap has 12 buffer(s)',
+        ) +
+        section(
+            'BUFFER POOL AND MEMORY',
+            'Total memory allocated 29642194944; in additional pool allocated 0',
+            'Internal hash tables (constant factor + variable factor)',
+            '    Threads             409336         (406936 + 2400)',
+        )
+    )
+
+    assert parse_innodb_status(text, mock.MagicMock()) == {
+        'Innodb_s_lock_spin_waits': 3859028,
+        'Innodb_s_lock_os_waits': 2100750,
+        'Innodb_x_lock_spin_waits': 4641946,
+        'Innodb_x_lock_os_waits': 1530310,
+        'Innodb_ibuf_size': 1,
+        'Innodb_ibuf_free_list': 887,
+        'Innodb_ibuf_segment_size': 889,
+        'Innodb_ibuf_merged_inserts': 19817685,
+        'Innodb_ibuf_merged': 19817684,
+        'Innodb_ibuf_merges': 3552620,
+        'Innodb_hash_index_cells_total': 4425293,
+        'Innodb_hash_index_cells_used': 4229064,
+        'Innodb_mem_total': 29642194944,
+        'Innodb_mem_additional_pool': 0,
+        'Innodb_mem_thread_hash': 409336,
+    }
+
+
+def test_unparsable_line():
+    text = section(
+        'LOG',
+        'Log sequence number n/a',
+        'Last checkpoint at  12',
+    )
+    log = mock.MagicMock()
+
+    results = parse_innodb_status(text, log)
+
+    assert results == {'Innodb_lsn_last_checkpoint': 12}
+    assert log.warning.call_count == 1
+
+
+def test_query_looking_like_a_header():
+    text = section(
+        'TRANSACTIONS',
+        '---TRANSACTION 1A3F04, ACTIVE 33 sec',
+        'SELECT 1 FROM t',
+        '----------',
+        'TODO',
+        '----------',
+        'mysql tables in use 1, locked 1',
+    ) + section('LOG', 'Log sequence number 12')
+
+    results = parse_innodb_status(text, mock.MagicMock())
+
+    assert results['Innodb_tables_in_use'] == 1
+    assert results['Innodb_lsn_current'] == 12
+
+
+def test_get_stats_from_innodb_status():
+    text, expected = read_fixture('mysql-5.6')
+    check = MySql(common.CHECK_NAME, {}, {})
+    db = mock.MagicMock()
+    cursor = db.cursor.return_value
+    cursor.rowcount = 1
+    cursor.fetchone.return_value = ('InnoDB', '', text)
+
+    results = check._get_stats_from_innodb_status(db, transactions=False)
+
+    cursor.execute.assert_called_once_with("SHOW /*!50000 ENGINE*/ INNODB STATUS")
+    assert results['Innodb_checkpoint_age'] == str(81626143 - 81621884)
+    assert results['Innodb_mutex_spin_waits'] == str(expected['Innodb_mutex_spin_waits'])
+    assert 'Innodb_current_transactions' not in results
+
+
+def test_row_lock_time_from_status_variable():
+    # the status of the fixture has a transaction waiting for a lock
+    text, _ = read_fixture('mysql-5.7')
+    row_lock_times = {}
+    for extra_innodb_metrics in (False, True):
+        check = MySql(common.CHECK_NAME, {}, {})
+        db = mock.MagicMock()
+        cursor = db.cursor.return_value
+        cursor.rowcount = 1
+        cursor.fetchone.return_value = ('InnoDB', '', text)
+        with mock.patch.object(check, '_get_stats_from_status', return_value={'Innodb_row_lock_time': 5000}), \
+                mock.patch.object(check, '_get_stats_from_variables', return_value={}), \
+                mock.patch.object(check, '_is_innodb_engine_enabled', return_value=True), \
+                mock.patch.object(check, '_version_compatible', return_value=True), \
+                mock.patch.object(check, '_submit_metrics') as submit_metrics:
+            check._collect_metrics('localhost', db, [], {'extra_innodb_metrics': extra_innodb_metrics}, None)
+        metrics, results, _ = submit_metrics.call_args[0]
+        assert 'Innodb_row_lock_time' in metrics
+        row_lock_times[extra_innodb_metrics] = results['Innodb_row_lock_time']
+
+    assert row_lock_times == {False: 5000, True: 5000}
@@ -93,6 +93,10 @@ def test_complex_config(aggregator, spin_up_mysql):
     # version_metadata = mysql_check.service_metadata['version']
     # assert len(version_metadata) == 1
 
+    _test_cached_query_age(aggregator)
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=0,
+                             tags=tags.METRIC_TAGS, count=1)
+
     # test custom query metrics
     aggregator.assert_metric('alice.age', value=25)
     aggregator.assert_metric('bob.age', value=20)
@@ -108,6 +112,21 @@ def test_complex_config(aggregator, spin_up_mysql):
     aggregator.assert_all_metrics_covered()
 
 
+def test_connection_reuse(aggregator, spin_up_mysql):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check.check(common_config.MYSQL_MINIMAL_CONFIG)
+    mysql_check.check(common_config.MYSQL_MINIMAL_CONFIG)
+
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=0, count=1)
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=1, count=1)
+    aggregator.assert_service_check('mysql.can_connect', status=MySql.OK,
+                                    tags=tags.SC_TAGS_MIN, count=2)
+    assert len(mysql_check._connections) == 1
+
+    mysql_check.stop()
+    assert len(mysql_check._connections) == 0
+
+
 def test_connection_failure(aggregator, spin_up_mysql):
     """
     Service check reports connection failure
@@ -172,6 +191,10 @@ def test_complex_config_replica(aggregator, spin_up_mysql):
             aggregator.assert_metric(mname,
                                      tags=tags.METRIC_TAGS, at_least=0)
 
+    _test_cached_query_age(aggregator)
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=0,
+                             tags=tags.METRIC_TAGS, count=1)
+
     # test custom query metrics
     aggregator.assert_metric('alice.age', value=25)
     aggregator.assert_metric('bob.age', value=20)
@@ -187,6 +210,17 @@ def test_complex_config_replica(aggregator, spin_up_mysql):
     aggregator.assert_all_metrics_covered()
 
 
+def _test_cached_query_age(aggregator):
+    """
+    Check the age of the results of the scheduled queries, run on the first check run
+    """
+    aggregator.assert_metric('datadog.agent.mysql.cached_query.age',
+                             tags=tags.METRIC_TAGS+['query:schema_size'], count=1)
+    for query in ('exec_time_95th', 'exec_time_per_schema'):
+        aggregator.assert_metric('datadog.agent.mysql.cached_query.age',
+                                 tags=tags.METRIC_TAGS+['query:{0}'.format(query)], at_least=0)
+
+
 def _test_optional_metrics(aggregator, optional_metrics, at_least):
     """
     Check optional metrics - there should be at least `at_least` matches
@@ -235,3 +269,118 @@ def test__get_server_pid():
             # the pid should be none but without errors
             assert mysql_check._get_server_pid(None) is None
             assert mysql_check.log.exception.call_count == 0
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('digest_count, offset', [(19, 0), (20, 0), (21, 0), (100, 4), (1000, 49)])
+def test__get_query_exec_time_95th_us(digest_count, offset):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check._with_timeout = mock.MagicMock(side_effect=lambda db, host, query, timeout: query)
+    db = mock.MagicMock()
+    cursor = db.cursor.return_value
+    cursor.rowcount = 1
+    cursor.fetchone.side_effect = [(digest_count,), (1200,)]
+
+    assert mysql_check._get_query_exec_time_95th_us(db, 'localhost', 10) == 1200
+    assert cursor.execute.call_args[0][1] == (offset,)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('digest_count', [0, 1])
+def test__get_query_exec_time_95th_us_no_result(digest_count):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check.warning = mock.MagicMock()
+    db = mock.MagicMock()
+    cursor = db.cursor.return_value
+    cursor.fetchone.return_value = (digest_count,)
+
+    assert mysql_check._get_query_exec_time_95th_us(db, 'localhost', 10) is None
+    assert cursor.execute.call_count == 1
+    assert mysql_check.warning.call_count == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('is_mariadb, version, timeout, expected', [
+    (False, (5, 7, 8), 10, 'SELECT /*+ MAX_EXECUTION_TIME(10000) */ 1 FROM (SELECT 1) t'),
+    (False, (5, 7, 8), 0, 'SELECT 1 FROM (SELECT 1) t'),
+    (False, (5, 6, 40), 10, 'SELECT 1 FROM (SELECT 1) t'),
+    (True, (10, 1, 1), 2.5, 'SET STATEMENT max_statement_time=2.5 FOR SELECT 1 FROM (SELECT 1) t'),
+    (True, (10, 0, 34), 10, 'SELECT 1 FROM (SELECT 1) t'),
+])
+def test__with_timeout(is_mariadb, version, timeout, expected):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check._get_is_mariadb = mock.MagicMock(return_value=is_mariadb)
+    mysql_check._version_compatible = mock.MagicMock(side_effect=lambda db, host, compat: version >= compat)
+
+    assert mysql_check._with_timeout(None, 'localhost', 'SELECT 1 FROM (SELECT 1) t', timeout) == expected
+
+
+@pytest.mark.unit
+def test__connect_reuses_the_connection(aggregator):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check._get_config(common_config.MYSQL_MINIMAL_CONFIG)
+    args = ('localhost', 0, '', 'dog', 'dog', '', {}, 10, [], 3600)
+
+    with mock.patch('datadog_checks.mysql.mysql.pymysql.connect', side_effect=lambda **kwargs: mock.MagicMock()) \
+            as connect:
+        with mysql_check._connect(*args) as db:
+            mysql_check.is_mariadb[mysql_check._get_host_key()] = False
+        with mysql_check._connect(*args) as reused_db:
+            pass
+
+        assert reused_db is db
+        assert connect.call_count == 1
+        assert connect.call_args[1]['autocommit'] is True
+        db.ping.assert_called_once_with(reconnect=False)
+        assert mysql_check.is_mariadb == {mysql_check._get_host_key(): False}
+
+        # the server went away
+        db.ping.side_effect = Exception('(2006, MySQL server has gone away)')
+        with mysql_check._connect(*args) as new_db:
+            pass
+
+        assert connect.call_count == 2
+        assert new_db is not db
+        assert mysql_check.is_mariadb == {}
+
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=1, count=1)
+    aggregator.assert_metric('datadog.agent.mysql.connection.reused', value=0, count=2)
+    aggregator.assert_service_check('mysql.can_connect', status=MySql.OK, count=3)
+
+
+@pytest.mark.unit
+def test__connect_drops_the_connection_on_error(aggregator):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check._get_config(common_config.MYSQL_MINIMAL_CONFIG)
+    args = ('localhost', 0, '', 'dog', 'dog', '', {}, 10, [], 3600)
+
+    with mock.patch('datadog_checks.mysql.mysql.pymysql.connect') as connect:
+        with pytest.raises(Exception):
+            with mysql_check._connect(*args) as db:
+                raise Exception('(2013, Lost connection to MySQL server during query)')
+
+        db.close.assert_called_once_with()
+        assert len(mysql_check._connections) == 0
+
+        with mysql_check._connect(*args):
+            pass
+        assert connect.call_count == 2
+
+    aggregator.assert_service_check('mysql.can_connect', status=MySql.CRITICAL, count=1)
+    aggregator.assert_service_check('mysql.can_connect', status=MySql.OK, count=2)
+
+
+@pytest.mark.unit
+def test__connect_without_reuse():
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check._get_config(common_config.MYSQL_MINIMAL_CONFIG)
+    args = ('localhost', 0, '', 'dog', 'dog', '', {}, 10, [], 0)
+
+    with mock.patch('datadog_checks.mysql.mysql.pymysql.connect') as connect:
+        with mysql_check._connect(*args) as db:
+            pass
+
+        db.close.assert_called_once_with()
+        with mysql_check._connect(*args):
+            pass
+        assert connect.call_count == 2
@@ -0,0 +1,66 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import mock
+import pytest
+
+from datadog_checks.mysql.query_scheduler import QueryScheduler
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def now():
+    with mock.patch('datadog_checks.mysql.query_scheduler.time.time') as time:
+        time.return_value = 1000.0
+        yield time
+
+
+def test_result_is_reused_until_the_min_interval(now):
+    scheduler = QueryScheduler()
+    query = mock.MagicMock(side_effect=[1, 2])
+
+    assert scheduler.run('q', 60, query) == (1, 0)
+    now.return_value += 59
+    assert scheduler.run('q', 60, query) == (1, 59)
+    assert query.call_count == 1
+
+    now.return_value += 1
+    assert scheduler.run('q', 60, query) == (2, 0)
+    assert query.call_count == 2
+
+
+def test_failed_query_keeps_the_previous_result(now):
+    scheduler = QueryScheduler()
+    query = mock.MagicMock(side_effect=[1, None, 3])
+
+    scheduler.run('q', 60, query)
+    now.return_value += 60
+    assert scheduler.run('q', 60, query) == (1, 60)
+
+    # not retried before the min interval
+    now.return_value += 30
+    assert scheduler.run('q', 60, query) == (1, 90)
+    assert query.call_count == 2
+
+    now.return_value += 30
+    assert scheduler.run('q', 60, query) == (3, 0)
+
+
+def test_no_result_yet(now):
+    scheduler = QueryScheduler()
+    query = mock.MagicMock(return_value=None)
+
+    assert scheduler.run('q', 60, query) == (None, None)
+    now.return_value += 10
+    assert scheduler.run('q', 60, query) == (None, None)
+    assert query.call_count == 1
+
+
+def test_queries_are_scheduled_separately(now):
+    scheduler = QueryScheduler()
+
+    scheduler.run('slow', 600, lambda: 'slow')
+    now.return_value += 60
+    assert scheduler.run('fast', 60, lambda: 'fast') == ('fast', 0)
+    assert scheduler.run('slow', 600, lambda: 'other') == ('slow', 60)
@@ -33,6 +33,11 @@ def aggregator():
     aggregator.reset()
     return aggregator
 
+def assert_connection_stats(aggregator, endpoint):
+    tags = ['endpoint:' + endpoint]
+    for stat in ('new', 'reused'):
+        aggregator.assert_metric(NAMESPACE + '.prometheus.connections.' + stat, tags=tags)
+
 @pytest.fixture(scope="module")
 def poll_mock():
     registry = CollectorRegistry()
@@ -47,7 +52,7 @@ def poll_mock():
     g3.labels(matched_label="foobar", node="host2", timestamp="456").set(float('inf'))
 
     poll_mock = mock.patch(
-        'requests.get',
+        'requests.Session.get',
         return_value=mock.MagicMock(
             status_code=200,
             iter_lines=lambda **kwargs: generate_latest(registry).split("\n"),
@@ -67,6 +72,7 @@ def test_prometheus_check(aggregator, poll_mock):
     aggregator.assert_metric(CHECK_NAME + '.renamed.metric1', tags=['node:host1', 'flavor:test', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.metric2', tags=['timestamp:123', 'node:host2', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.counter1', tags=['node:host2'], metric_type=aggregator.MONOTONIC_COUNT)
+    assert_connection_stats(aggregator, instance['prometheus_url'])
     assert aggregator.metrics_asserted_pct == 100.0
 
 def test_prometheus_check_counter_gauge(aggregator, poll_mock):
@@ -80,6 +86,7 @@ def test_prometheus_check_counter_gauge(aggregator, poll_mock):
     aggregator.assert_metric(CHECK_NAME + '.renamed.metric1', tags=['node:host1', 'flavor:test', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.metric2', tags=['timestamp:123', 'node:host2', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.counter1', tags=['node:host2'], metric_type=aggregator.GAUGE)
+    assert_connection_stats(aggregator, instance['prometheus_url'])
     assert aggregator.metrics_asserted_pct == 100.0
 
 def test_invalid_metric(aggregator, poll_mock):
@@ -111,6 +118,7 @@ def test_prometheus_wildcard(aggregator, poll_mock):
     c.check(instance)
     aggregator.assert_metric(CHECK_NAME + '.metric1', tags=['node:host1', 'flavor:test', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.metric2', tags=['timestamp:123', 'node:host2', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
+    assert_connection_stats(aggregator, instance['prometheus_url'])
     assert aggregator.metrics_asserted_pct == 100.0
 
 def test_prometheus_default_instance(aggregator, poll_mock):
@@ -133,6 +141,7 @@ def test_prometheus_default_instance(aggregator, poll_mock):
     })
     aggregator.assert_metric(CHECK_NAME + '.renamed.metric1', tags=['node:host1', 'flavor:test', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.metric2', tags=['timestamp:123', 'node:host2', 'matched_label:foobar'], metric_type=aggregator.GAUGE)
+    assert_connection_stats(aggregator, 'http://custom:1337/metrics')
     assert aggregator.metrics_asserted_pct == 100.0
 
 def test_prometheus_mixed_instance(aggregator, poll_mock):
@@ -182,4 +191,5 @@ def test_prometheus_mixed_instance(aggregator, poll_mock):
         })
     aggregator.assert_metric(CHECK_NAME + '.renamed.metric1', hostname="host1", tags=['node:host1', 'flavor:test', 'matched_label:foobar', 'timestamp:123', 'extra:foo'], metric_type=aggregator.GAUGE)
     aggregator.assert_metric(CHECK_NAME + '.metric2', hostname="host2", tags=['timestamp:123', 'node:host2', 'matched_label:foobar', 'timestamp:123', 'extra:foo'], metric_type=aggregator.GAUGE)
+    assert_connection_stats(aggregator, 'http://custom:1337/metrics')
     assert aggregator.metrics_asserted_pct == 100.0
@@ -0,0 +1,181 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from __future__ import unicode_literals
+
+from pyVmomi import vim, vmodl  # pylint: disable=E0611
+
+# Properties collected for each type of managed entity of the inventory
+INVENTORY_PROPERTIES = [
+    (vim.Folder, ['name', 'parent']),
+    (vim.Datacenter, ['name', 'parent']),
+    (vim.ComputeResource, ['name', 'parent']),
+    (vim.HostSystem, ['name', 'parent']),
+    (vim.Datastore, ['name', 'parent']),
+    (vim.VirtualMachine, ['name', 'parent', 'runtime.host', 'runtime.powerState', 'customValue']),
+]
+
+# Changes of these properties alter the parent tags of the entities
+STRUCTURAL_PROPERTIES = frozenset(['name', 'parent'])
+
+
+class VSphereInventory(object):
+    """
+    Local copy of the properties of the vCenter managed entities needed to discover the MORs
+    and compute their tags, maintained with a PropertyCollector filter.
+
+    The first `refresh` retrieves the properties of the whole inventory in bulk, the next ones
+    only apply the changes reported by `WaitForUpdatesEx` since the previous refresh. The tags
+    of the parents of an entity are computed from the collected `parent` properties and memoized
+    until the name or parent of an entity changes, instead of reading `mor.parent` and `mor.name`
+    one property fetch at a time.
+    """
+    def __init__(self, content, log):
+        """
+        :param content: vim.ServiceInstanceContent of the vCenter server
+        """
+        self.content = content
+        self.log = log
+        self._filter = None
+        # ContainerView of the whole inventory traversed by the filter
+        self._view = None
+        self._version = ''
+        # MOR -> {property path -> value}
+        self._properties = {}
+        # MOR -> tuple of the tags of its parents, root first
+        self._parent_tags = {}
+
+    def _filter_spec(self):
+        self._destroy_view()
+        self._view = self.content.viewManager.CreateContainerView(
+            self.content.rootFolder, [vimtype for vimtype, _ in INVENTORY_PROPERTIES], True)
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverseEntities', path='view', skip=False, type=vim.view.ContainerView)
+        return vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[
+                vmodl.query.PropertyCollector.ObjectSpec(obj=self._view, skip=True, selectSet=[traversal_spec]),
+                vmodl.query.PropertyCollector.ObjectSpec(obj=self.content.rootFolder),
+            ],
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(type=vimtype, pathSet=path_set)
+                for vimtype, path_set in INVENTORY_PROPERTIES
+            ]
+        )
+
+    def refresh(self):
+        """
+        Bring the inventory up to date. The updates of a new filter hold the properties
+        of all the entities, later ones only the changes since the previous version.
+        """
+        property_collector = self.content.propertyCollector
+        if self._filter is None:
+            self._filter = property_collector.CreateFilter(self._filter_spec(), partialUpdates=False)
+            self._version = ''
+            self._properties = {}
+            self._parent_tags = {}
+
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+        try:
+            while True:
+                update_set = property_collector.WaitForUpdatesEx(self._version, options)
+                if update_set is None:
+                    break
+                self._apply_updates(update_set)
+                self._version = update_set.version
+                if not update_set.truncated:
+                    break
+        except Exception:
+            # start over from a new filter next time
+            self.reset()
+            raise
+
+    def reset(self):
+        if self._filter is not None:
+            try:
+                self._filter.DestroyPropertyFilter()
+            except Exception as e:
+                self.log.debug("Unable to destroy the property filter: %s", e)
+        self._filter = None
+        self._destroy_view()
+
+    def _destroy_view(self):
+        if self._view is not None:
+            try:
+                self._view.DestroyView()
+            except Exception as e:
+                self.log.debug("Unable to destroy the container view: %s", e)
+        self._view = None
+
+    def _apply_updates(self, update_set):
+        structural_change = False
+        for filter_update in update_set.filterSet:
+            for object_update in filter_update.objectSet:
+                mor = object_update.obj
+                if object_update.kind == 'leave':
+                    self._properties.pop(mor, None)
+                    structural_change = True
+                    continue
+
+                properties = self._properties.setdefault(mor, {})
+                for change in object_update.changeSet:
+                    if change.op in ('remove', 'indirectRemove'):
+                        properties.pop(change.name, None)
+                    else:
+                        properties[change.name] = change.val
+                    if change.name in STRUCTURAL_PROPERTIES:
+                        structural_change = True
+
+        if structural_change:
+            self._parent_tags = {}
+
+    def get(self, mor, path, default=None):
+        """
+        Return the collected value of the property `path` of `mor`
+        """
+        return self._properties.get(mor, {}).get(path, default)
+
+    def name(self, mor):
+        """
+        Return the name of `mor`, fetched from vCenter if it is not part of the inventory
+        """
+        properties = self._properties.get(mor)
+        if properties is not None and 'name' in properties:
+            return properties['name']
+        return mor.name
+
+    def entities(self, vimtype):
+        """
+        Return the list of (MOR, properties) of the entities of type `vimtype`
+        """
+        return [(mor, properties) for mor, properties in self._properties.iteritems() if isinstance(mor, vimtype)]
+
+    def parent_tags(self, mor):
+        """
+        Return the tuple of the tags of the parents of `mor`, from the root down
+        """
+        tags = self._parent_tags.get(mor)
+        if tags is None:
+            parent = self.get(mor, 'parent')
+            if parent is None:
+                tags = ()
+            else:
+                tags = self.parent_tags(parent) + self._entity_tags(parent)
+            self._parent_tags[mor] = tags
+        return tags
+
+    def _entity_tags(self, mor):
+        if isinstance(mor, vim.HostSystem):
+            return ('vsphere_host:{}'.format(self.name(mor)),)
+        elif isinstance(mor, vim.Folder):
+            return ('vsphere_folder:{}'.format(self.name(mor)),)
+        elif isinstance(mor, vim.ComputeResource):
+            name = self.name(mor)
+            if isinstance(mor, vim.ClusterComputeResource):
+                return ('vsphere_cluster:{}'.format(name), 'vsphere_compute:{}'.format(name))
+            return ('vsphere_compute:{}'.format(name),)
+        elif isinstance(mor, vim.Datacenter):
+            return ('vsphere_datacenter:{}'.format(self.name(mor)),)
+        return ()
+
+    def __len__(self):
+        return len(self._properties)
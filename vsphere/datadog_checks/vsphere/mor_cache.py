@@ -0,0 +1,118 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import sys
+
+
+class MorEntity(object):
+    """
+    A managed object reference (MOR) whose metrics are collected, along with its hostname and tags
+    """
+    __slots__ = ('mor', 'mor_type', 'hostname', 'tags', 'metrics', 'interval', 'last_seen')
+
+    def __init__(self, mor, mor_type, hostname, tags):
+        self.mor = mor
+        self.mor_type = mor_type
+        self.hostname = hostname
+        self.tags = tags
+        self.metrics = None
+        self.interval = None
+        self.last_seen = None
+
+
+class MorCache(object):
+    """
+    Store of the `MorEntity` of a vCenter instance, by MOR id.
+
+    Thousands of VMs share the same datacenter, cluster and host tags, and hosts of the same type
+    the same counters: the tag strings, tag tuples and metric lists of the entities are interned
+    in the cache so siblings reference a single copy of them.
+    """
+    def __init__(self):
+        self._entities = {}
+        self._strings = {}
+        self._tags = {}
+        self._metrics = {}
+
+    @staticmethod
+    def mor_id(mor):
+        return str(mor)
+
+    def entity(self, mor, mor_type, hostname, tags):
+        """
+        Return a new `MorEntity` with interned tags, it is added to the cache with `add`
+        """
+        return MorEntity(mor, mor_type, self._intern_string(hostname), self.intern_tags(tags))
+
+    def _intern_string(self, string):
+        if string is None:
+            return None
+        return self._strings.setdefault(string, string)
+
+    def intern_tags(self, tags):
+        """
+        Return the shared tuple equal to `tags`
+        """
+        tags = tuple(self._intern_string(tag) for tag in tags)
+        return self._tags.setdefault(tags, tags)
+
+    def intern_metrics(self, metrics):
+        """
+        Return the shared tuple of the `vim.PerformanceManager.MetricId` equal to `metrics`
+        """
+        key = tuple((metric.counterId, metric.instance) for metric in metrics)
+        return self._metrics.setdefault(key, tuple(metrics))
+
+    def add(self, entity):
+        self._entities[self.mor_id(entity.mor)] = entity
+
+    def get(self, mor_id):
+        return self._entities.get(mor_id)
+
+    def __contains__(self, mor_id):
+        return mor_id in self._entities
+
+    def __len__(self):
+        return len(self._entities)
+
+    def items(self):
+        return self._entities.items()
+
+    def entities(self):
+        return self._entities.values()
+
+    def purge(self, last_seen):
+        """
+        Remove the entities not seen since `last_seen`, and the interned values only they used
+        """
+        stale = [mor_id for mor_id, entity in self._entities.items() if entity.last_seen < last_seen]
+        if not stale:
+            return
+        for mor_id in stale:
+            del self._entities[mor_id]
+
+        entities = self._entities.values()
+        self._tags = {entity.tags: entity.tags for entity in entities}
+        self._strings = {}
+        for tags in self._tags:
+            for tag in tags:
+                self._strings[tag] = tag
+        for entity in entities:
+            if entity.hostname is not None:
+                self._strings[entity.hostname] = entity.hostname
+        self._metrics = {
+            tuple((metric.counterId, metric.instance) for metric in entity.metrics): entity.metrics
+            for entity in entities if entity.metrics is not None
+        }
+
+    def memory_footprint(self):
+        """
+        Return an estimate of the memory used by the cache in bytes: its tables, the entities
+        and the interned values, not counting the MOR and metric objects held from pyVmomi
+        """
+        size = sum(sys.getsizeof(table) for table in (self._entities, self._strings, self._tags, self._metrics))
+        size += sum(sys.getsizeof(mor_id) + sys.getsizeof(entity) for mor_id, entity in self._entities.iteritems())
+        size += sum(sys.getsizeof(string) for string in self._strings)
+        size += sum(sys.getsizeof(tags) for tags in self._tags)
+        size += sum(sys.getsizeof(metrics) for metrics in self._metrics.itervalues())
+        return size
@@ -6,6 +6,7 @@ from datetime import timedelta
 from Queue import Empty, Queue
 import re
 import ssl
+import threading
 import time
 import traceback
 
@@ -16,10 +17,12 @@ from datadog_checks.config import _is_affirmative
 from datadog_checks.checks import AgentCheck
 from datadog_checks.checks.libs.vmware.basic_metrics import BASIC_METRICS
 from datadog_checks.checks.libs.vmware.all_metrics import ALL_METRICS
-from datadog_checks.checks.libs.thread_pool import Pool
+from datadog_checks.checks.libs.scheduler import Job, JobScheduler, Lane, QueueFull
 from datadog_checks.checks.libs.timer import Timer
 from .common import SOURCE_TYPE
 from .event import VSphereEvent
+from .inventory import VSphereInventory
+from .mor_cache import MorCache
 try:
     # Agent >= 6.0: the check pushes tags invoking `set_external_tags`
     from datadog_agent import set_external_tags
@@ -40,6 +43,8 @@ REFRESH_MORLIST_INTERVAL = 3 * 60
 REFRESH_METRICS_METADATA_INTERVAL = 10 * 60
 # The amount of jobs batched at the same time in the queue to query available metrics
 BATCH_MORLIST_SIZE = 50
+# The maximum amount of MORs whose metrics are queried in a single QueryPerf call
+BATCH_QUERY_PERF_SIZE = 1
 
 REALTIME_RESOURCES = {'vm', 'host'}
 
@@ -51,8 +56,16 @@ RESOURCE_TYPE_MAP = {
 }
 
 # Time after which we reap the jobs that clog the queue
-# TODO: use it
 JOB_TIMEOUT = 10
+# Time after which we reap a discovery of the whole inventory
+DISCOVERY_JOB_TIMEOUT = REFRESH_MORLIST_INTERVAL
+# The maximum amount of jobs pending in each lane of the pool, further jobs are skipped until the next run
+MAX_QUEUED_JOBS = 100000
+# Lanes of the pool, metric collection is served before discovery
+COLLECTION_LANE = 'collection'
+DISCOVERY_LANE = 'discovery'
+# QueryPerf batches are shrunk when a call takes longer than this, grown when it takes less than half
+QUERY_PERF_TARGET_LATENCY = JOB_TIMEOUT / 2.0
 MORLIST = 'morlist'
 METRICS_METADATA = 'metrics_metadata'
 LAST = 'last'
@@ -87,7 +100,6 @@ class VSphereCheck(AgentCheck):
         AgentCheck.__init__(self, name, init_config, agentConfig, instances)
         self.time_started = time.time()
         self.pool_started = False
-        self.jobs_status = {}
         self.exceptionq = Queue()
 
         # Connections open to vCenter instances
@@ -116,47 +128,75 @@ class VSphereCheck(AgentCheck):
 
         # managed entity raw view
         self.registry = {}
+        # Properties of the managed entities, by instance: (server instance, VSphereInventory)
+        self.inventories = {}
         # First layer of cache (get entities from the tree)
         self.morlist_raw = {}
-        # Second layer, processed from the first one
+        # Second layer, processed from the first one: a `MorCache` by instance
         self.morlist = {}
         # Metrics metadata, basically perfCounterId -> {name, group, description}
         self.metrics_metadata = {}
         self.latest_event_query = {}
 
+        # Amount of MORs queried per QueryPerf call, adapted to the latency of the calls
+        self.batch_query_perf_max_size = int(init_config.get('batch_query_perf_size', BATCH_QUERY_PERF_SIZE))
+        self.query_perf_target_latency = float(
+            init_config.get('query_perf_target_latency', QUERY_PERF_TARGET_LATENCY))
+        self.batch_query_perf_size = {}
+        self._batch_query_perf_lock = threading.Lock()
+
     def stop(self):
         self.stop_pool()
+        for _, inventory in self.inventories.itervalues():
+            inventory.reset()
 
     def start_pool(self):
         self.log.info("Starting Thread Pool")
         self.pool_size = int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL))
 
-        self.pool = Pool(self.pool_size)
+        max_queued_jobs = int(self.init_config.get('max_queued_jobs', MAX_QUEUED_JOBS))
+
+        # Discovery can't take more than half of the workers, so that it never starves metric collection
+        lanes = [
+            Lane(COLLECTION_LANE, priority=0, max_queue_size=max_queued_jobs),
+            Lane(DISCOVERY_LANE, priority=1, max_queue_size=max_queued_jobs, max_running=max(1, self.pool_size // 2)),
+        ]
+        self.pool = JobScheduler(self.pool_size, lanes=lanes, name='vsphere')
         self.pool_started = True
-        self.jobs_status = {}
 
     def stop_pool(self):
         self.log.info("Stopping Thread Pool")
         if self.pool_started:
-            self.pool.terminate()
-            self.pool.join()
-            self.jobs_status.clear()
-            assert self.pool.get_nworkers() == 0
+            self.pool.stop(timeout=JOB_TIMEOUT)
             self.pool_started = False
 
-    def restart_pool(self):
-        self.stop_pool()
-        self.start_pool()
+    def _submit_job(self, func, args, lane=COLLECTION_LANE, timeout=JOB_TIMEOUT):
+        """
+        Queue a job in the pool, return False if the queue of its lane is full
+        """
+        try:
+            self.pool.submit(func, args=args, lane=lane, timeout=timeout, block=False)
+        except QueueFull:
+            self.log.warning("Too many pending %s jobs, skipping %s until the next run", lane, func.__name__)
+            return False
+        return True
 
-    def _clean(self):
-        now = time.time()
-        # TODO: use that
-        for name in self.jobs_status.keys():
-            start_time = self.jobs_status[name]
-            if now - start_time > JOB_TIMEOUT:
-                self.log.critical("Restarting Pool. One check is stuck.")
-                self.restart_pool()
-                break
+    def _clean(self, custom_tags=None):
+        for job in self.pool.reap():
+            self.log.critical("Gave up on job %s, still running after %ss", job, job.timeout)
+
+        # ## <TEST-INSTRUMENTATION>
+        for lane, stats in self.pool.pop_stats().iteritems():
+            tags = ['lane:{}'.format(lane)] + (custom_tags or [])
+            for state in (Job.DONE, Job.FAILED, Job.TIMED_OUT, Job.CANCELLED):
+                self.gauge('datadog.agent.vsphere.jobs.count', stats[state], tags=tags + ['state:{}'.format(state)])
+            started = stats[Job.DONE] + stats[Job.FAILED] + stats[Job.TIMED_OUT]
+            if started:
+                self.gauge('datadog.agent.vsphere.jobs.queue_time.avg', stats['queue_time.total'] / started, tags=tags)
+                self.gauge('datadog.agent.vsphere.jobs.run_time.avg', stats['run_time.total'] / started, tags=tags)
+            self.gauge('datadog.agent.vsphere.jobs.queue_time.max', stats['queue_time.max'], tags=tags)
+            self.gauge('datadog.agent.vsphere.jobs.run_time.max', stats['run_time.max'], tags=tags)
+        # ## </TEST-INSTRUMENTATION>
 
     def _query_event(self, instance):
         i_key = self._instance_key(instance)
@@ -293,29 +333,45 @@ class VSphereCheck(AgentCheck):
         external_host_tags = []
         for instance in self.instances:
             i_key = self._instance_key(instance)
-            mor_by_mor_name = self.morlist.get(i_key)
+            mor_cache = self.morlist.get(i_key)
 
-            if not mor_by_mor_name:
+            if not mor_cache:
                 self.log.warning(
                     u"Unable to extract hosts' tags for vSphere instance named %s"
                     u"Is the check failing on this instance?", i_key
                 )
                 continue
 
-            for mor in mor_by_mor_name.itervalues():
-                if mor['hostname']:  # some mor's have a None hostname
-                    external_host_tags.append((mor['hostname'], {SOURCE_TYPE: mor['tags']}))
+            for mor in mor_cache.entities():
+                if mor.hostname:  # some mor's have a None hostname
+                    external_host_tags.append((mor.hostname, {SOURCE_TYPE: list(mor.tags)}))
 
         return external_host_tags
 
+    def _get_mor_cache(self, instance):
+        """ Return the `MorCache` of the vCenter instance
+        """
+        return self.morlist.setdefault(self._instance_key(instance), MorCache())
+
+    def _get_inventory(self, instance, server_instance):
+        """ Return the `VSphereInventory` of the vCenter instance, a new one if the connection was renewed
+        """
+        i_key = self._instance_key(instance)
+        inventory_server, inventory = self.inventories.get(i_key, (None, None))
+        if inventory is None or inventory_server is not server_instance:
+            if inventory is not None:
+                inventory.reset()
+            inventory = VSphereInventory(server_instance.RetrieveContent(), self.log)
+            self.inventories[i_key] = (server_instance, inventory)
+        return inventory
+
     def _discover_mor(self, instance, tags, regexes=None, include_only_marked=False):
         """
         Explore vCenter infrastructure to discover hosts, virtual machines
         and compute their associated tags.
 
-
-        Start with the vCenter `rootFolder` and proceed recursively,
-        queueing other such jobs for children nodes.
+        The properties of the managed entities are kept in a `VSphereInventory`: the first
+        discovery retrieves them in bulk, the next ones only the changes since the previous one.
 
         Example topology:
             ```
@@ -334,58 +390,32 @@ class VSphereCheck(AgentCheck):
         If it's a node we want to query metric for, queue it in `self.morlist_raw` that
         will be processed by another job.
         """
-        def _get_parent_tags(mor):
-            tags = []
-            if mor.parent:
-                tag = []
-                if isinstance(mor.parent, vim.HostSystem):
-                    tag.append(u'vsphere_host:{}'.format(mor.parent.name))
-                elif isinstance(mor.parent, vim.Folder):
-                    tag.append(u'vsphere_folder:{}'.format(mor.parent.name))
-                elif isinstance(mor.parent, vim.ComputeResource):
-                    if isinstance(mor.parent, vim.ClusterComputeResource):
-                        tag.append(u'vsphere_cluster:{}'.format(mor.parent.name))
-                    tag.append(u'vsphere_compute:{}'.format(mor.parent.name))
-                elif isinstance(mor.parent, vim.Datacenter):
-                    tag.append(u'vsphere_datacenter:{}'.format(mor.parent.name))
-
-                tags = _get_parent_tags(mor.parent)
-                if tag:
-                    tags.extend(tag)
-
-            return tags
-
-        def _get_all_objs(content, vimtype, regexes=None, include_only_marked=False, tags=None):
+        def _get_all_objs(inventory, vimtype, regexes=None, include_only_marked=False, tags=None):
             """
             Get all the vsphere objects associated with a given type
             """
             if tags is None:
                 tags = []
             obj_list = []
-            container = content.viewManager.CreateContainerView(
-                content.rootFolder,
-                [RESOURCE_TYPE_MAP[vimtype]],
-                True)
-
-            for c in container.view:
-                instance_tags = []
-                if not self._is_excluded(c, regexes, include_only_marked):
-                    hostname = c.name
-                    if c.parent:
-                        instance_tags += _get_parent_tags(c)
+            mor_cache = self._get_mor_cache(instance)
+
+            for c, properties in inventory.entities(RESOURCE_TYPE_MAP[vimtype]):
+                if not self._is_excluded(c, regexes, include_only_marked, properties):
+                    hostname = properties.get('name')
+                    instance_tags = list(inventory.parent_tags(c))
 
                     vsphere_type = None
                     if isinstance(c, vim.VirtualMachine):
                         vsphere_type = u'vsphere_type:vm'
-                        if c.runtime.powerState == vim.VirtualMachinePowerState.poweredOff:
+                        if properties.get('runtime.powerState') == vim.VirtualMachinePowerState.poweredOff:
                             continue
-                        host = c.runtime.host.name
+                        host = inventory.name(properties.get('runtime.host'))
                         instance_tags.append(u'vsphere_host:{}'.format(host))
                     elif isinstance(c, vim.HostSystem):
                         vsphere_type = u'vsphere_type:host'
                     elif isinstance(c, vim.Datastore):
                         vsphere_type = u'vsphere_type:datastore'
-                        instance_tags.append(u'vsphere_datastore:{}'.format(c.name))
+                        instance_tags.append(u'vsphere_datastore:{}'.format(hostname))
                         hostname = None
                     elif isinstance(c, vim.Datacenter):
                         vsphere_type = u'vsphere_type:datacenter'
@@ -393,7 +423,7 @@ class VSphereCheck(AgentCheck):
 
                     if vsphere_type:
                         instance_tags.append(vsphere_type)
-                    obj_list.append(dict(mor_type=vimtype, mor=c, hostname=hostname, tags=tags+instance_tags))
+                    obj_list.append(mor_cache.entity(c, vimtype, hostname, tags + instance_tags))
 
             return obj_list
 
@@ -404,9 +434,11 @@ class VSphereCheck(AgentCheck):
             if i_key not in self.morlist_raw:
                 self.morlist_raw[i_key] = {}
 
+            inventory = self._get_inventory(instance, server_instance)
+            inventory.refresh()
             for resource in sorted(RESOURCE_TYPE_MAP):
                 self.morlist_raw[i_key][resource] = _get_all_objs(
-                    server_instance.RetrieveContent(),
+                    inventory,
                     resource,
                     regexes,
                     include_only_marked,
@@ -414,24 +446,33 @@ class VSphereCheck(AgentCheck):
                 )
 
         # collect...
-        self.pool.apply_async(
+        self._submit_job(
             build_resource_registry,
-            args=(instance, tags, regexes, include_only_marked)
+            args=(instance, tags, regexes, include_only_marked),
+            lane=DISCOVERY_LANE,
+            timeout=DISCOVERY_JOB_TIMEOUT
         )
 
     @staticmethod
-    def _is_excluded(obj, regexes, include_only_marked):
+    def _is_excluded(obj, regexes, include_only_marked, properties=None):
         """
         Return `True` if the given host or virtual machine is excluded by the user configuration,
         i.e. violates any of the following rules:
         * Do not match the corresponding `*_include_only` regular expressions
         * Is "non-labeled" while `include_only_marked` is enabled (virtual machine only)
+
+        The `name` and `customValue` are read from the inventory `properties` when provided.
         """
+        def get_property(path):
+            if properties is not None:
+                return properties.get(path)
+            return getattr(obj, path)
+
         # Host
         if isinstance(obj, vim.HostSystem):
             # Based on `host_include_only_regex`
             if regexes and regexes.get('host_include') is not None:
-                match = re.search(regexes['host_include'], obj.name, re.IGNORECASE)
+                match = re.search(regexes['host_include'], get_property('name'), re.IGNORECASE)
                 if not match:
                     return True
 
@@ -439,14 +480,14 @@ class VSphereCheck(AgentCheck):
         elif isinstance(obj, vim.VirtualMachine):
             # Based on `vm_include_only_regex`
             if regexes and regexes.get('vm_include') is not None:
-                match = re.search(regexes['vm_include'], obj.name, re.IGNORECASE)
+                match = re.search(regexes['vm_include'], get_property('name'), re.IGNORECASE)
                 if not match:
                     return True
 
             # Based on `include_only_marked`
             if include_only_marked:
                 monitored = False
-                for field in obj.customValue:
+                for field in get_property('customValue') or []:
                     if field.value == VM_MONITORING_FLAG:
                         monitored = True
                         break  # we shall monitor
@@ -502,24 +543,26 @@ class VSphereCheck(AgentCheck):
 
         self.log.debug(
             "job_atomic: Querying available metrics"
-            " for MOR {0} (type={1})".format(mor['mor'], mor['mor_type'])
+            " for MOR {0} (type={1})".format(mor.mor, mor.mor_type)
         )
 
-        mor['interval'] = REAL_TIME_INTERVAL if mor['mor_type'] in REALTIME_RESOURCES else None
+        mor.interval = REAL_TIME_INTERVAL if mor.mor_type in REALTIME_RESOURCES else None
 
         available_metrics = perfManager.QueryAvailablePerfMetric(
-            mor['mor'], intervalId=mor['interval'])
+            mor.mor, intervalId=mor.interval)
 
-        mor['metrics'] = self._compute_needed_metrics(instance, available_metrics)
+        mor_cache = self.morlist[i_key]
+        mor.metrics = mor_cache.intern_metrics(self._compute_needed_metrics(instance, available_metrics))
 
-        mor_name = str(mor['mor'])
-        if mor_name in self.morlist[i_key]:
+        cached_mor = mor_cache.get(mor_cache.mor_id(mor.mor))
+        if cached_mor is not None:
             # Was already here last iteration
-            self.morlist[i_key][mor_name]['metrics'] = mor['metrics']
+            cached_mor.metrics = mor.metrics
         else:
-            self.morlist[i_key][mor_name] = mor
+            cached_mor = mor
+            mor_cache.add(mor)
 
-        self.morlist[i_key][mor_name]['last_seen'] = time.time()
+        cached_mor.last_seen = time.time()
 
         # ## <TEST-INSTRUMENTATION>
         self.histogram('datadog.agent.vsphere.morlist_process_atomic.time', t.total(), tags=custom_tags)
@@ -531,8 +574,7 @@ class VSphereCheck(AgentCheck):
         metrics for this MOR and put it in self.morlist
         """
         i_key = self._instance_key(instance)
-        if i_key not in self.morlist:
-            self.morlist[i_key] = {}
+        self._get_mor_cache(instance)
 
         batch_size = self.init_config.get('batch_morlist_size', BATCH_MORLIST_SIZE)
 
@@ -541,7 +583,10 @@ class VSphereCheck(AgentCheck):
             for i in xrange(batch_size):
                 try:
                     mor = self.morlist_raw[i_key][resource_type].pop()
-                    self.pool.apply_async(self._cache_morlist_process_atomic, args=(instance, mor))
+                    if not self._submit_job(self._cache_morlist_process_atomic, (instance, mor), lane=DISCOVERY_LANE):
+                        # retry on the next run
+                        self.morlist_raw[i_key][resource_type].append(mor)
+                        return
 
                     processed += 1
                     if processed == batch_size:
@@ -558,13 +603,14 @@ class VSphereCheck(AgentCheck):
         """ Check if self.morlist doesn't have some old MORs that are gone, ie
         we cannot get any metrics from them anyway (or =0)
         """
-        i_key = self._instance_key(instance)
-        morlist = self.morlist[i_key].items()
+        mor_cache = self._get_mor_cache(instance)
+        mor_cache.purge(time.time() - 2 * REFRESH_MORLIST_INTERVAL)
 
-        for mor_name, mor in morlist:
-            last_seen = mor['last_seen']
-            if (time.time() - last_seen) > 2 * REFRESH_MORLIST_INTERVAL:
-                del self.morlist[i_key][mor_name]
+        # ## <TEST-INSTRUMENTATION>
+        custom_tags = instance.get('tags', [])
+        self.gauge('datadog.agent.vsphere.morlist.size', len(mor_cache), tags=custom_tags)
+        self.gauge('datadog.agent.vsphere.morlist.memory', mor_cache.memory_footprint(), tags=custom_tags)
+        # ## </TEST-INSTRUMENTATION>
 
     def _cache_metrics_metadata(self, instance):
         """ Get from the server instance, all the performance counters metadata
@@ -611,9 +657,25 @@ class VSphereCheck(AgentCheck):
         # Defaults to return the value without transformation
         return value
 
+    def _get_batch_query_perf_size(self, i_key):
+        return self.batch_query_perf_size.get(i_key, self.batch_query_perf_max_size)
+
+    def _adapt_batch_query_perf_size(self, i_key, queried, latency):
+        """ Halve the amount of MORs per QueryPerf call when a call of `queried` MORs took longer than the
+        target latency, grow it by a quarter when a full batch took less than half of it
+        """
+        with self._batch_query_perf_lock:
+            size = self._get_batch_query_perf_size(i_key)
+            if latency > self.query_perf_target_latency:
+                size = max(1, size // 2)
+            elif latency < self.query_perf_target_latency / 2 and queried >= size:
+                size = min(self.batch_query_perf_max_size, size + max(1, size // 4))
+            self.batch_query_perf_size[i_key] = size
+
     @atomic_method
-    def _collect_metrics_atomic(self, instance, mor):
-        """ Task that collects the metrics listed in the morlist for one MOR
+    def _collect_metrics_atomic(self, instance, mors):
+        """ Task that collects the metrics listed in the morlist for a batch of MORs,
+        with a single QueryPerf call
         """
         # ## <TEST-INSTRUMENTATION>
         t = Timer()
@@ -624,54 +686,72 @@ class VSphereCheck(AgentCheck):
         perfManager = server_instance.content.perfManager
         custom_tags = instance.get('tags', [])
 
-        query = vim.PerformanceManager.QuerySpec(maxSample=1,
-                                                 entity=mor['mor'],
-                                                 metricId=mor['metrics'],
-                                                 intervalId=mor['interval'],
-                                                 format='normal')
-        results = perfManager.QueryPerf(querySpec=[query])
-        if results:
-            for result in results[0].value:
-                if result.id.counterId not in self.metrics_metadata[i_key]:
-                    self.log.debug("Skipping this metric value, because there is no metadata about it")
-                    continue
-
-                # Metric types are absolute, delta, and rate
-                try:
-                    metric_name = self.metrics_metadata[i_key][result.id.counterId]['name']
-                except KeyError:
-                    metric_name = None
-
-                if metric_name not in ALL_METRICS:
-                    self.log.debug(u"Skipping unknown `%s` metric.", metric_name)
-                    continue
-
-                if not result.value:
-                    self.log.debug(u"Skipping `%s` metric because the value is empty", metric_name)
-                    continue
-
-                instance_name = result.id.instance or "none"
-                value = self._transform_value(instance, result.id.counterId, result.value[0])
-
-                tags = ['instance:%s' % instance_name]
-                if not mor['hostname']:  # no host tags available
-                    tags.extend(mor['tags'])
-
-                # vsphere "rates" should be submitted as gauges (rate is
-                # precomputed).
-                self.gauge(
-                    "vsphere.%s" % metric_name,
-                    value,
-                    hostname=mor['hostname'],
-                    tags=['instance:%s' % instance_name] + custom_tags
-                )
+        query_specs = []
+        mors_by_name = {}
+        for mor in mors:
+            query_specs.append(vim.PerformanceManager.QuerySpec(maxSample=1,
+                                                                entity=mor.mor,
+                                                                metricId=mor.metrics,
+                                                                intervalId=mor.interval,
+                                                                format='normal'))
+            mors_by_name[MorCache.mor_id(mor.mor)] = mor
+
+        query_start = time.time()
+        results = perfManager.QueryPerf(querySpec=query_specs)
+        self._adapt_batch_query_perf_size(i_key, len(mors), time.time() - query_start)
+
+        for entity_metric in results or []:
+            mor = mors_by_name.get(MorCache.mor_id(entity_metric.entity))
+            if mor is None:
+                self.log.debug(u"Skipping the metrics of `%s`, it wasn't queried", entity_metric.entity)
+                continue
+            self._submit_perf_values(instance, mor, entity_metric.value, custom_tags)
 
         # ## <TEST-INSTRUMENTATION>
         self.histogram('datadog.agent.vsphere.metric_colection.time', t.total(), tags=custom_tags)
         # ## </TEST-INSTRUMENTATION>
 
+    def _submit_perf_values(self, instance, mor, values, custom_tags):
+        """ Submit the metric series returned by QueryPerf for one MOR
+        """
+        i_key = self._instance_key(instance)
+        for result in values:
+            if result.id.counterId not in self.metrics_metadata[i_key]:
+                self.log.debug("Skipping this metric value, because there is no metadata about it")
+                continue
+
+            # Metric types are absolute, delta, and rate
+            try:
+                metric_name = self.metrics_metadata[i_key][result.id.counterId]['name']
+            except KeyError:
+                metric_name = None
+
+            if metric_name not in ALL_METRICS:
+                self.log.debug(u"Skipping unknown `%s` metric.", metric_name)
+                continue
+
+            if not result.value:
+                self.log.debug(u"Skipping `%s` metric because the value is empty", metric_name)
+                continue
+
+            instance_name = result.id.instance or "none"
+            value = self._transform_value(instance, result.id.counterId, result.value[0])
+
+            tags = ['instance:%s' % instance_name]
+            if not mor.hostname:  # no host tags available
+                tags.extend(mor.tags)
+
+            # vsphere "rates" should be submitted as gauges (rate is
+            # precomputed).
+            self.gauge(
+                "vsphere.%s" % metric_name,
+                value,
+                hostname=mor.hostname,
+                tags=['instance:%s' % instance_name] + custom_tags
+            )
+
     def collect_metrics(self, instance):
-        """ Calls asynchronously _collect_metrics_atomic on all MORs, as the
+        """ Calls asynchronously _collect_metrics_atomic on batches of MORs, as the
         job queue is processed the Aggregator will receive the metrics.
         """
         i_key = self._instance_key(instance)
@@ -679,20 +759,29 @@ class VSphereCheck(AgentCheck):
             self.log.debug("Not collecting metrics for this instance, nothing to do yet: {0}".format(i_key))
             return
 
-        mors = self.morlist[i_key].items()
+        mors = self.morlist[i_key].entities()
         self.log.debug("Collecting metrics of %d mors" % len(mors))
 
         vm_count = 0
 
         custom_tags = instance.get('tags', [])
 
-        for mor_name, mor in mors:
-            if mor['mor_type'] == 'vm':
+        batch_size = self._get_batch_query_perf_size(i_key)
+        batch = []
+        # the collection lane is full, the remaining MORs are skipped until the next run
+        queue_full = False
+        for mor in mors:
+            if mor.mor_type == 'vm':
                 vm_count += 1
-            if 'metrics' not in mor or not mor['metrics']:
+            if not mor.metrics or queue_full:
                 continue
 
-            self.pool.apply_async(self._collect_metrics_atomic, args=(instance, mor))
+            batch.append(mor)
+            if len(batch) >= batch_size:
+                queue_full = not self._submit_job(self._collect_metrics_atomic, (instance, batch))
+                batch = []
+        if batch:
+            self._submit_job(self._collect_metrics_atomic, (instance, batch))
 
         self.gauge('vsphere.vm.count', vm_count, tags=["vcenter_server:%s" % instance.get('name')] + custom_tags)
 
@@ -703,7 +792,7 @@ class VSphereCheck(AgentCheck):
         custom_tags = instance.get('tags', [])
 
         # ## <TEST-INSTRUMENTATION>
-        self.gauge('datadog.agent.vsphere.queue_size', self.pool._workq.qsize(), tags=['instant:initial'] + custom_tags)
+        self.gauge('datadog.agent.vsphere.queue_size', self.pool.queue_size(), tags=['instant:initial'] + custom_tags)
         # ## </TEST-INSTRUMENTATION>
 
         # First part: make sure our object repository is neat & clean
@@ -720,7 +809,7 @@ class VSphereCheck(AgentCheck):
         self._query_event(instance)
 
         # For our own sanity
-        self._clean()
+        self._clean(custom_tags)
 
         thread_crashed = False
         try:
@@ -738,5 +827,5 @@ class VSphereCheck(AgentCheck):
             set_external_tags(self.get_external_host_tags())
 
         # ## <TEST-INSTRUMENTATION>
-        self.gauge('datadog.agent.vsphere.queue_size', self.pool._workq.qsize(), tags=['instant:final'] + custom_tags)
+        self.gauge('datadog.agent.vsphere.queue_size', self.pool.queue_size(), tags=['instant:final'] + custom_tags)
         # ## </TEST-INSTRUMENTATION>
@@ -0,0 +1,24 @@
+# (C) Datadog, Inc. 2018
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import pytest
+from mock import MagicMock
+
+from datadog_checks.stubs import aggregator
+from datadog_checks.vsphere import VSphereCheck
+from .utils import MockedPerfManager, disable_thread_pool, mock_morlist
+
+# simulated QueryPerf round trip, well below the one of an actual vCenter
+QUERY_PERF_LATENCY = 0.0001
+
+
+@pytest.mark.parametrize('batch_size', [1, 100], ids=['single', 'batch_100'])
+@pytest.mark.parametrize('entities', [1000, 10000, 50000], ids=['1k', '10k', '50k'])
+def test_collect_metrics(benchmark, entities, batch_size):
+    instance = {'name': 'vsphere_mock', 'tags': ['foo:bar']}
+    check = disable_thread_pool(VSphereCheck('vsphere', {'batch_query_perf_size': batch_size}, {}, [instance]))
+    check._get_server_instance = MagicMock()
+    check._get_server_instance.return_value.content.perfManager = MockedPerfManager(latency=QUERY_PERF_LATENCY)
+    mock_morlist(check, instance, entities, ['cpu.usage', 'mem.usage', 'net.usage'])
+
+    benchmark.pedantic(check.collect_metrics, args=(instance,), setup=aggregator.reset, rounds=3)
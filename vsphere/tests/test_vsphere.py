@@ -3,15 +3,21 @@
 # Licensed under Simplified BSD License (see LICENSE)
 from __future__ import unicode_literals
 
+import threading
+import time
+
 import pytest
 import mock
 from mock import MagicMock
+from pyVmomi import vim
 
 from datadog_checks.vsphere import VSphereCheck
 from datadog_checks.vsphere.vsphere import MORLIST, INTERVAL, METRICS_METADATA
 from datadog_checks.vsphere.common import SOURCE_TYPE
-from .utils import assertMOR, MockedMOR
-from .utils import disable_thread_pool, get_mocked_server
+from datadog_checks.vsphere.inventory import VSphereInventory
+from datadog_checks.vsphere.mor_cache import MorCache
+from .utils import assertMOR, MockedMOR, MockedPerfManager
+from .utils import disable_thread_pool, get_mocked_server, mock_morlist
 
 
 @pytest.fixture
@@ -56,7 +62,6 @@ def test_init():
     check = VSphereCheck('vsphere', init_config, {}, [{'name': 'vsphere_foo'}])
     assert check.time_started > 0
     assert check.pool_started is False
-    assert len(check.jobs_status) == 0
     assert len(check.server_instances) == 0
     assert len(check.cache_times) == 1
     assert 'vsphere_foo' in check.cache_times
@@ -170,6 +175,77 @@ def test__discover_mor(vsphere, instance):
     assertMOR(vsphere, instance, name="vm4", spec="vm", subset=True, tags=tags)
 
 
+def test__discover_mor_incremental(vsphere, instance):
+    """
+    Discoveries after the first one only apply the inventory changes
+    """
+    server = vsphere._get_server_instance.return_value
+    property_collector = server.content.propertyCollector
+    tags = ["toto"]
+
+    vsphere._discover_mor(instance, tags)
+    assert property_collector.created_filters == 1
+    assertMOR(vsphere, instance, spec="vm", count=3)
+
+    # rename a cluster, power off a VM, remove another one
+    topology = property_collector.topology
+    by_name = {mor.name: mor for mor in property_collector.walk(topology)}
+    property_collector.modify(by_name['compute_resource2'], 'name', 'renamed_cluster')
+    property_collector.modify(by_name['vm1'], 'runtime.powerState', 'poweredOff')
+    property_collector.leave(by_name['vm2'])
+
+    vsphere._discover_mor(instance, tags)
+    assert property_collector.created_filters == 1
+    assertMOR(vsphere, instance, spec="vm", count=1)
+    assertMOR(vsphere, instance, name="vm4", spec="vm", subset=True,
+              tags=["vsphere_cluster:renamed_cluster", "vsphere_compute:renamed_cluster"])
+    assertMOR(vsphere, instance, name="host3", spec="host", subset=True, tags=["vsphere_cluster:renamed_cluster"])
+    assertMOR(vsphere, instance, name="host1", spec="host", subset=True, tags=["vsphere_cluster:compute_resource1"])
+
+
+def test__discover_mor_new_connection(vsphere, instance):
+    """
+    The inventory is retrieved again from a new filter when the connection is renewed
+    """
+    vsphere._discover_mor(instance, [])
+    property_collector = vsphere._get_server_instance.return_value.content.propertyCollector
+
+    server = get_mocked_server()
+    vsphere._get_server_instance.return_value = server
+    vsphere._discover_mor(instance, [])
+
+    assert property_collector.created_filters == 1
+    assert server.content.propertyCollector.created_filters == 1
+    assertMOR(vsphere, instance, count=8)
+
+
+def test_inventory_container_view():
+    """
+    The ContainerView of the inventory is destroyed when it's replaced and on reset
+    """
+    views = [MagicMock(spec=vim.view.ContainerView), MagicMock(spec=vim.view.ContainerView)]
+    content = MagicMock(rootFolder=MagicMock(spec=vim.Folder),
+                        **{'viewManager.CreateContainerView.side_effect': views})
+    property_collector = content.propertyCollector
+    property_collector.WaitForUpdatesEx.side_effect = [Exception("connection lost"), None]
+    inventory = VSphereInventory(content, MagicMock())
+
+    # the filter and its view are replaced after a failure
+    with pytest.raises(Exception) as excinfo:
+        inventory.refresh()
+    assert str(excinfo.value) == "connection lost"
+    views[0].DestroyView.assert_called_once_with()
+    property_collector.CreateFilter.return_value.DestroyPropertyFilter.assert_called_once_with()
+
+    inventory.refresh()
+    assert content.viewManager.CreateContainerView.call_count == 2
+    assert not views[1].DestroyView.called
+
+    inventory.reset()
+    views[1].DestroyView.assert_called_once_with()
+    views[0].DestroyView.assert_called_once_with()
+
+
 def test_check(vsphere, instance):
     """
     Test the check() method
@@ -261,3 +337,107 @@ def test_service_check_ok(aggregator, instance):
         sc = aggregator.service_checks(VSphereCheck.SERVICE_CHECK_NAME)[0]
         assert sc.status == check.OK
         assert 'foo:bar' in sc.tags
+
+
+def test_collect_metrics_batches(vsphere, instance, aggregator):
+    """
+    MORs are queried by batches of `batch_query_perf_size`, the results are submitted with the hostname of their MOR
+    """
+    perf_manager = MockedPerfManager()
+    vsphere._get_server_instance.return_value.content.perfManager = perf_manager
+    vsphere.batch_query_perf_max_size = 2
+    mock_morlist(vsphere, instance, 5, ['cpu.usage', 'mem.usage'])
+
+    vsphere.collect_metrics(instance)
+
+    assert perf_manager.calls == 3
+    for i in range(5):
+        aggregator.assert_metric('vsphere.cpu.usage', value=42, hostname='vm{}'.format(i),
+                                 tags=['instance:none', 'foo:bar'], count=1)
+        aggregator.assert_metric('vsphere.mem.usage', value=42, hostname='vm{}'.format(i), count=1)
+
+
+def test_adapt_batch_query_perf_size(vsphere):
+    vsphere.batch_query_perf_max_size = 100
+    target = vsphere.query_perf_target_latency
+
+    vsphere._adapt_batch_query_perf_size('vsphere_mock', 100, target * 2)
+    assert vsphere._get_batch_query_perf_size('vsphere_mock') == 50
+    vsphere._adapt_batch_query_perf_size('vsphere_mock', 50, target * 2)
+    assert vsphere._get_batch_query_perf_size('vsphere_mock') == 25
+
+    # only full batches grow the size
+    vsphere._adapt_batch_query_perf_size('vsphere_mock', 10, target / 4)
+    assert vsphere._get_batch_query_perf_size('vsphere_mock') == 25
+    vsphere._adapt_batch_query_perf_size('vsphere_mock', 25, target / 4)
+    assert vsphere._get_batch_query_perf_size('vsphere_mock') == 31
+
+    for _ in range(20):
+        vsphere._adapt_batch_query_perf_size('vsphere_mock', 100, target / 4)
+    assert vsphere._get_batch_query_perf_size('vsphere_mock') == 100
+
+
+def test_mor_cache():
+    mor_cache = MorCache()
+    vm1 = mor_cache.entity(MockedMOR(spec="VirtualMachine"), 'vm', 'vm1', [u'vsphere_host:host1', u'vsphere_type:vm'])
+    vm2 = mor_cache.entity(MockedMOR(spec="VirtualMachine"), 'vm', 'vm2', [u'vsphere_host:host1', u'vsphere_type:vm'])
+    vm3 = mor_cache.entity(MockedMOR(spec="VirtualMachine"), 'vm', 'vm3', [u'vsphere_host:host2', u'vsphere_type:vm'])
+
+    # siblings share their tags
+    assert vm1.tags is vm2.tags
+    assert vm1.tags == (u'vsphere_host:host1', u'vsphere_type:vm')
+    assert vm3.tags[1] is vm1.tags[1]
+    metrics = [MagicMock(counterId=1, instance=''), MagicMock(counterId=2, instance='')]
+    vm1.metrics = mor_cache.intern_metrics(metrics)
+    vm2.metrics = mor_cache.intern_metrics(list(metrics))
+    assert vm1.metrics is vm2.metrics
+
+    for last_seen, mor in enumerate([vm1, vm2, vm3]):
+        mor.last_seen = last_seen
+        mor_cache.add(mor)
+    assert len(mor_cache) == 3
+    assert mor_cache.get(MorCache.mor_id(vm2.mor)) is vm2
+
+    # the entities not seen since 2 are gone, along with the values only they used
+    mor_cache.purge(2)
+    assert mor_cache.entities() == [vm3]
+    assert mor_cache.intern_tags([u'vsphere_host:host2', u'vsphere_type:vm']) is vm3.tags
+    assert mor_cache.intern_metrics(metrics) is not vm1.metrics
+    assert mor_cache.memory_footprint() > 0
+
+
+def test__vacuum_morlist(vsphere, instance, aggregator):
+    mock_morlist(vsphere, instance, 3, ['cpu.usage'])
+    mor_cache = vsphere.morlist[instance['name']]
+    mor_cache.entities()[0].last_seen = 0
+
+    vsphere._vacuum_morlist(instance)
+
+    assert len(mor_cache) == 2
+    aggregator.assert_metric('datadog.agent.vsphere.morlist.size', value=2, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.morlist.memory', value=mor_cache.memory_footprint())
+
+
+def test_pool(aggregator):
+    check = VSphereCheck('vsphere', {'threads_count': 1, 'max_queued_jobs': 1}, {}, [{'name': 'vsphere_foo'}])
+    check.start_pool()
+    release = threading.Event()
+    try:
+        stuck = check.pool.submit(release.wait, args=(5,), lane='collection', timeout=0)
+        while check.pool.running() < 1:
+            time.sleep(0.001)
+        assert check._submit_job(release.wait, (5,)) is True
+        # backpressure
+        assert check._submit_job(release.wait, (5,)) is False
+
+        # the stuck job is reaped, its worker replaced
+        check._clean(['foo:bar'])
+        assert stuck.state == 'timed_out'
+        aggregator.assert_metric('datadog.agent.vsphere.jobs.count', value=1,
+                                 tags=['lane:collection', 'state:timed_out', 'foo:bar'])
+        aggregator.assert_metric('datadog.agent.vsphere.jobs.count', value=0,
+                                 tags=['lane:discovery', 'state:done', 'foo:bar'])
+    finally:
+        release.set()
+        check.stop_pool()
+    assert check.pool_started is False
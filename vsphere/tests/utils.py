@@ -3,11 +3,15 @@
 # Licensed under Simplified BSD License (see LICENSE)
 import os
 import json
+import time
+from collections import namedtuple
 from datetime import datetime
 
 from mock import Mock, MagicMock
 from pyVmomi import vim
 
+from datadog_checks.vsphere.mor_cache import MorCache
+
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 
@@ -36,49 +40,121 @@ class MockedMOR(Mock):
             self.customValue.append(Mock(value="DatadogMonitored"))
 
 
-class MockedContainer(Mock):
-    TYPES = [vim.Datacenter, vim.Datastore, vim.HostSystem, vim.VirtualMachine]
+# Lightweight equivalents of the `vim.PerformanceManager.EntityMetric` and `IntSeries` results of QueryPerf
+EntityMetric = namedtuple('EntityMetric', ['entity', 'value'])
+MetricSeries = namedtuple('MetricSeries', ['id', 'value'])
 
-    def __init__(self, **kwargs):
-        # Mocking
-        super(MockedContainer, self).__init__(**kwargs)
-
-        self.topology = kwargs.get('topology')
-        self.view_idx = 0
-
-    def container_view(self, topology_node, vimtype):
-        view = []
-
-        def get_child_topology(attribute):
-            entity = getattr(topology_node, attribute)
-            try:
-                for child in entity:
-                    child_topology = self.container_view(child, vimtype)
-                    view.extend(child_topology)
-            except TypeError:
-                child_topology = self.container_view(entity, vimtype)
-                view.extend(child_topology)
-
-        if isinstance(topology_node, vimtype):
-            view = [topology_node]
-
-        if hasattr(topology_node, 'childEntity'):
-            get_child_topology('childEntity')
-        elif hasattr(topology_node, 'hostFolder'):
-            get_child_topology('hostFolder')
-        elif hasattr(topology_node, 'host'):
-            get_child_topology('host')
-        elif hasattr(topology_node, 'vm'):
-            get_child_topology('vm')
-
-        return view
-
-    @property
-    def view(self):
-        view = self.container_view(self.topology, self.TYPES[self.view_idx])
-        self.view_idx += 1
-        self.view_idx = self.view_idx % len(self.TYPES)
-        return view
+
+class MockedPerfManager(object):
+    """
+    Local stand-in for `vim.PerformanceManager`, QueryPerf answers one value per queried counter
+    after a simulated round trip of `latency` seconds.
+    """
+    def __init__(self, latency=0, value=42):
+        self.latency = latency
+        self.value = value
+        self.calls = 0
+
+    def QueryPerf(self, querySpec):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [
+            EntityMetric(spec.entity, [MetricSeries(metric_id, [self.value]) for metric_id in spec.metricId])
+            for spec in querySpec
+        ]
+
+
+def mock_morlist(check, instance, count, metrics):
+    """
+    Fill the morlist of the check with `count` VMs, each collecting the `metrics` names
+    """
+    i_key = instance['name']
+    check.metrics_metadata[i_key] = {}
+    metric_ids = []
+    for counter_id, name in enumerate(metrics):
+        check.metrics_metadata[i_key][counter_id] = {'name': name, 'unit': 'number'}
+        metric_ids.append(vim.PerformanceManager.MetricId(counterId=counter_id, instance=''))
+
+    check.morlist[i_key] = mor_cache = MorCache()
+    for i in xrange(count):
+        mor = mor_cache.entity(vim.VirtualMachine('vm-{}'.format(i)), 'vm', 'vm{}'.format(i), ['vsphere_type:vm'])
+        mor.metrics = mor_cache.intern_metrics(metric_ids)
+        mor.interval = 20
+        mor.last_seen = time.time()
+        mor_cache.add(mor)
+
+
+# Lightweight equivalents of the `vmodl.query.PropertyCollector` updates
+PropertyChange = namedtuple('PropertyChange', ['name', 'op', 'val'])
+ObjectUpdate = namedtuple('ObjectUpdate', ['kind', 'obj', 'changeSet'])
+FilterUpdate = namedtuple('FilterUpdate', ['filter', 'objectSet'])
+UpdateSet = namedtuple('UpdateSet', ['version', 'filterSet', 'truncated'])
+
+
+class MockedPropertyCollector(object):
+    """
+    Stand-in for `vmodl.query.PropertyCollector` reporting the entities of a topology built by `create_topology`.
+
+    The first `WaitForUpdatesEx` call after `CreateFilter` reports all the entities, the next ones the
+    changes made with `enter`, `modify` and `leave` since the previous call.
+    """
+    CHILD_ATTRIBUTES = ['childEntity', 'hostFolder', 'host', 'vm']
+
+    def __init__(self, topology):
+        self.topology = topology
+        self.created_filters = 0
+        self.calls = 0
+        self._version = 0
+        self._pending = []
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.created_filters += 1
+        self._pending = [ObjectUpdate('enter', mor, self._changes(mor)) for mor in self.walk(self.topology)]
+        return MagicMock()
+
+    def WaitForUpdatesEx(self, version, options):
+        self.calls += 1
+        if not self._pending:
+            return None
+        self._version += 1
+        object_set, self._pending = self._pending, []
+        return UpdateSet(str(self._version), [FilterUpdate(None, object_set)], False)
+
+    def enter(self, mor):
+        self._pending.append(ObjectUpdate('enter', mor, self._changes(mor)))
+
+    def modify(self, mor, name, val):
+        self._pending.append(ObjectUpdate('modify', mor, [PropertyChange(name, 'assign', val)]))
+
+    def leave(self, mor):
+        self._pending.append(ObjectUpdate('leave', mor, []))
+
+    @staticmethod
+    def _changes(mor):
+        changes = [PropertyChange('name', 'assign', mor.name), PropertyChange('parent', 'assign', mor.parent)]
+        if isinstance(mor, vim.VirtualMachine):
+            changes.extend([
+                PropertyChange('runtime.host', 'assign', mor.runtime.host),
+                PropertyChange('runtime.powerState', 'assign', mor.runtime.powerState),
+                PropertyChange('customValue', 'assign', mor.customValue),
+            ])
+        return changes
+
+    def walk(self, node):
+        """
+        Yield `node` and all its descendants
+        """
+        yield node
+        for attribute in self.CHILD_ATTRIBUTES:
+            if hasattr(node, attribute):
+                children = getattr(node, attribute)
+                if not isinstance(children, list):
+                    children = [children]
+                for child in children:
+                    for mor in self.walk(child):
+                        yield mor
+                break
 
 
 def create_topology(topology_json):
@@ -161,17 +237,17 @@ def assertMOR(check, instance, name=None, spec=None, tags=None, count=None, subs
         mor_list = [mor for _, mors in check.morlist_raw[instance_name].iteritems() for mor in mors]
 
     for mor in mor_list:
-        if name is not None and name != mor['hostname']:
+        if name is not None and name != mor.hostname:
             continue
 
-        if spec is not None and spec != mor['mor_type']:
+        if spec is not None and spec != mor.mor_type:
             continue
 
         if tags is not None:
             if subset:
-                if not set(tags).issubset(set(mor['tags'])):
+                if not set(tags).issubset(set(mor.tags)):
                     continue
-            elif set(tags) != set(mor['tags']):
+            elif set(tags) != set(mor.tags):
                 continue
 
         candidates.append(mor)
@@ -187,7 +263,12 @@ def disable_thread_pool(check):
     """
     Disable the thread pool on the check instance
     """
-    check.pool = MagicMock(apply_async=lambda func, args: func(*args))
+    check.pool = MagicMock(
+        submit=lambda func, args=(), **kwargs: func(*args),
+        reap=lambda: [],
+        pop_stats=lambda: {},
+        queue_size=lambda lane=None: 0,
+    )
     check.pool_started = True  # otherwise the mock will be overwritten
     return check
 
@@ -199,11 +280,13 @@ def get_mocked_server():
     # create topology from a fixture file
     vcenter_topology = create_topology('vsphere_topology.json')
     # mock pyvmomi stuff
-    view_mock = MockedContainer(topology=vcenter_topology)
+    view_mock = MagicMock(spec=vim.view.ContainerView)
     viewmanager_mock = MagicMock(**{'CreateContainerView.return_value': view_mock})
     event_mock = MagicMock(createdTime=datetime.now())
     eventmanager_mock = MagicMock(latestEvent=event_mock)
-    content_mock = MagicMock(viewManager=viewmanager_mock, eventManager=eventmanager_mock)
+    content_mock = MagicMock(viewManager=viewmanager_mock, eventManager=eventmanager_mock,
+                             rootFolder=vcenter_topology,
+                             propertyCollector=MockedPropertyCollector(vcenter_topology))
     # assemble the mocked server
     server_mock = MagicMock()
     server_mock.configure_mock(**{